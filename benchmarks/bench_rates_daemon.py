@@ -0,0 +1,98 @@
+"""
+Получение курсов: чтение rates.json (холодный процесс и прогретый
+RatesCache) против демона курсов по Unix-сокету — точечный lookup
+и синхронизация снимка по поколению.
+
+rates.json генерируется во временном каталоге (--pairs пар к USD),
+демон работает в потоке этого же процесса без обновления курсов.
+
+Запуск: python -m benchmarks.bench_rates_daemon [--pairs N] [--calls N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from time import perf_counter
+
+from valutatrade_hub.core.rates_cache import RatesCache
+from valutatrade_hub.logging_config import LOGGER
+from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.daemon import DaemonClient, RatesDaemon
+
+
+def _write_rates(path: str, n_pairs: int) -> None:
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    pairs = {
+        f"C{i:04d}_USD": {"rate": 1.0 + i / 1000, "updated_at": now, "source": "bench"}
+        for i in range(n_pairs)
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"pairs": pairs, "last_refresh": now, "version": 1}, f, indent=2)
+
+
+def _measure(label: str, n: int, fn) -> None:
+    start = perf_counter()
+    for _ in range(n):
+        fn()
+    elapsed_us = (perf_counter() - start) * 1e6
+    print(f"{label:<34} {elapsed_us / n:9.1f} µs/вызов")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pairs", type=int, default=2000)
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    LOGGER.disabled = True
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        rates_file = os.path.join(tmp_dir, "rates.json")
+        socket_path = os.path.join(tmp_dir, "rates.sock")
+        _write_rates(rates_file, args.pairs)
+
+        daemon = RatesDaemon(
+            ParserConfig(RATES_FILE_PATH=rates_file), socket_path, refresh=False
+        )
+        threading.Thread(target=daemon.serve_forever, daemon=True).start()
+        while not os.path.exists(socket_path):
+            time.sleep(0.01)
+
+        client = DaemonClient(socket_path)
+        generation, _ = client.snapshot()
+        warm = RatesCache(rates_file)
+        warm.get()
+
+        print(f"pairs={args.pairs}, calls={args.calls}")
+        cold_calls = max(args.calls // 100, 5)
+        _measure(
+            "файл, холодный процесс",
+            cold_calls,
+            lambda: RatesCache(rates_file).get().matrix,
+        )
+        _measure("файл, прогретый RatesCache", args.calls, warm.get)
+        _measure(
+            "демон, lookup 1 пары",
+            args.calls,
+            lambda: client.lookup([("C0001", "C0002")]),
+        )
+        batch = [(f"C{i:04d}", "C0000") for i in range(100)]
+        _measure("демон, lookup 100 пар", args.calls, lambda: client.lookup(batch))
+        _measure(
+            "демон, снимок не изменился",
+            args.calls,
+            lambda: client.snapshot(generation),
+        )
+        _measure("демон, полный снимок", cold_calls, client.snapshot)
+
+        client.close()
+        daemon.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Сравнение количества файловых операций на одну сделку:
+прежний путь (get_portfolio_by_user_id + update_portfolio)
+против UnitOfWork (разовая и долгоживущая сессия, как в CLI).
+
+Запуск: python -m benchmarks.bench_trade_io [--users N] [--trades N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+from datetime import datetime
+from time import perf_counter
+
+from valutatrade_hub.core import usecases, utils
+from valutatrade_hub.core.models import Portfolio, User, Wallet
+from valutatrade_hub.core.session import UnitOfWork
+from valutatrade_hub.infra.ledger import TradeLedger, set_ledger
+from valutatrade_hub.infra.repository import (
+    IO_STATS,
+    JsonStorageBackend,
+    set_backend,
+)
+from valutatrade_hub.logging_config import LOGGER
+
+
+def _prepare(tmp_dir: str, n_users: int) -> JsonStorageBackend:
+    backend = JsonStorageBackend(
+        users_file=os.path.join(tmp_dir, "users.json"),
+        portfolios_file=os.path.join(tmp_dir, "portfolios.json"),
+        user_seq_file=os.path.join(tmp_dir, "users_seq.json"),
+    )
+    backend.save_users([
+        User(i, f"user{i}", "x", "y", datetime(2026, 1, 1))
+        for i in range(1, n_users + 1)
+    ])
+    backend.save_portfolios({
+        i: Portfolio(i, {"USD": Wallet("USD", 1000.0)})
+        for i in range(1, n_users + 1)
+    })
+    set_backend(backend)
+    set_ledger(TradeLedger(os.path.join(tmp_dir, "ledger.jsonl")))
+    return backend
+
+
+def _legacy_trade(user: User) -> None:
+    portfolio = utils.get_portfolio_by_user_id(user.user_id)
+    wallet = portfolio.get_wallet("BTC") or portfolio.add_currency("BTC")
+    wallet.deposit(0.001)
+    utils.update_portfolio(portfolio)
+
+
+def _measure(label: str, trades: int, trade) -> None:
+    IO_STATS["reads"] = IO_STATS["writes"] = 0
+    start = perf_counter()
+    for _ in range(trades):
+        trade()
+    elapsed_ms = (perf_counter() - start) * 1000
+
+    print(
+        f"{label:<28} reads/trade={IO_STATS['reads'] / trades:.2f} "
+        f"writes/trade={IO_STATS['writes'] / trades:.2f} "
+        f"avg={elapsed_ms / trades:.2f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--trades", type=int, default=50)
+    args = parser.parse_args()
+
+    # Не засоряем logs/actions.log сделками бенчмарка
+    LOGGER.disabled = True
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        _prepare(tmp_dir, args.users)
+        user = User(1, "user1", "x", "y", datetime(2026, 1, 1))
+        session = UnitOfWork()
+
+        print(f"users={args.users}, trades={args.trades}")
+        _measure("legacy utils", args.trades, lambda: _legacy_trade(user))
+        _measure(
+            "UnitOfWork (per trade)",
+            args.trades,
+            lambda: usecases.buy(user, "BTC", 0.001),
+        )
+        _measure(
+            "UnitOfWork (CLI session)",
+            args.trades,
+            lambda: usecases.buy(user, "BTC", 0.001, session=session),
+        )
+
+
+if __name__ == "__main__":
+    main()
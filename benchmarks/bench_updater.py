@@ -0,0 +1,108 @@
+"""
+Офлайн-нагрузка RatesUpdater: полный цикл обновления (HTTP к
+поддельному провайдеру, разбор, детектор изменений, история, кэш)
+во временном каталоге данных.
+
+Выводит задержку одного обновления (p50/p95/max), пропускную
+способность в курсах/с, число ответов 503 и запросов к провайдеру.
+
+Запуск: python -m benchmarks.bench_updater [--symbols N] [--updates N]
+    [--latency-ms MS] [--jitter-ms MS] [--error-rate P] [--fixtures DIR]
+    [--universe]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+from time import perf_counter
+
+from benchmarks.fake_provider import FIXTURES_DIR, FakeProvider, FakeProviderServer
+from valutatrade_hub.logging_config import LOGGER
+from valutatrade_hub.parser_service.api_clients import (
+    CoinGeckoClient,
+    ExchangeRateApiClient,
+)
+from valutatrade_hub.parser_service.health import percentile
+from valutatrade_hub.parser_service.storage import RatesStorage
+from valutatrade_hub.parser_service.updater import RatesUpdater
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--symbols", type=int, default=1000)
+    parser.add_argument("--updates", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument(
+        "--universe",
+        action="store_true",
+        help="UNIVERSE_MODE=full: валюты находятся через /coins/markets и /codes",
+    )
+    args = parser.parse_args()
+
+    LOGGER.disabled = True
+    provider = FakeProvider(
+        args.fixtures,
+        symbols=args.symbols,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        seed=1,
+    )
+    server = FakeProviderServer(provider).start()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config = server.parser_config(
+            RATES_FILE_PATH=os.path.join(tmp_dir, "rates.json"),
+            HISTORY_FILE_PATH=os.path.join(tmp_dir, "exchange_rates.json"),
+            HISTORY_DIR_PATH=os.path.join(tmp_dir, "history"),
+            SOURCES_STATE_FILE_PATH=os.path.join(tmp_dir, "sources.json"),
+            UNIVERSE_FILE_PATH=os.path.join(tmp_dir, "universe.json"),
+            HTTP_BACKOFF_BASE_SECONDS=0.01,
+            # breaker не должен отключать источник посреди замера
+            BREAKER_FAILURE_THRESHOLD=args.updates + 1,
+        )
+        if args.universe:
+            config.UNIVERSE_MODE = "full"
+            config.CRYPTO_TOP_N = args.symbols
+        storage = RatesStorage(config)
+
+        durations = []
+        total_rates = 0
+        failed_updates = 0
+        for _ in range(args.updates):
+            clients = [CoinGeckoClient(config), ExchangeRateApiClient(config)]
+            start = perf_counter()
+            result = RatesUpdater(config, storage, clients).run_update()
+            durations.append((perf_counter() - start) * 1000)
+            total_rates += result["total_rates"] + result["unchanged_rates"]
+            failed_updates += bool(result["errors"])
+
+    server.stop()
+
+    print(
+        f"symbols={args.symbols} (crypto {len(config.CRYPTO_CURRENCIES)}, "
+        f"fiat {len(config.FIAT_CURRENCIES)}), updates={args.updates}, "
+        f"latency={args.latency_ms}±{args.jitter_ms} ms, "
+        f"error rate={args.error_rate}"
+    )
+    print(
+        f"обновление: p50 {percentile(durations, 50):.1f} ms, "
+        f"p95 {percentile(durations, 95):.1f} ms, max {max(durations):.1f} ms"
+    )
+    print(
+        f"пропускная способность: {total_rates / (sum(durations) / 1000):.0f} "
+        f"курсов/с ({total_rates} курсов)"
+    )
+    print(
+        f"обновлений с ошибками: {failed_updates}, "
+        f"запросов к провайдеру: {provider.requests}, ответов 503: {provider.errors}"
+    )
+
+
+if __name__ == "__main__":
+    main()
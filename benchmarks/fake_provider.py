@@ -0,0 +1,381 @@
+"""
+Локальная замена CoinGecko и ExchangeRate-API для офлайн-нагрузки
+RatesUpdater.
+
+record — записывает реальные ответы API в фикстуры (ключ API в файл
+         не попадает);
+serve  — отдаёт фикстуры (или синтетические данные той же формы)
+         с настраиваемой задержкой, долей ошибок и числом символов.
+
+Эндпоинты совпадают с настоящими:
+  /api/v3/simple/price?ids=...&vs_currencies=usd
+  /api/v3/coins/markets?vs_currency=usd&per_page=N&page=N
+  /v6/<key>/latest/<BASE>
+  /v6/<key>/codes
+Курсы слегка «гуляют» между ответами; ETag / If-None-Match -> 304.
+
+Запуск:
+  python -m benchmarks.fake_provider record [--fixtures DIR]
+  python -m benchmarks.fake_provider serve [--port N] [--symbols N]
+      [--latency-ms MS] [--error-rate P]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from valutatrade_hub.parser_service.api_clients import get_session
+from valutatrade_hub.parser_service.config import ParserConfig
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+COINGECKO_FIXTURE = "coingecko.json"
+EXCHANGERATE_FIXTURE = "exchangerate.json"
+
+# Формы ответов на случай, если фикстуры ещё не записаны
+DEFAULT_COINGECKO = {
+    "bitcoin": {"usd": 95000.0},
+    "ethereum": {"usd": 3300.0},
+    "solana": {"usd": 145.0},
+}
+DEFAULT_EXCHANGERATE = {
+    "result": "success",
+    "base_code": "USD",
+    "conversion_rates": {"USD": 1.0, "EUR": 0.86, "GBP": 0.74, "RUB": 79.0},
+}
+
+
+def _synthetic_code(i: int) -> str:
+    """Код синтетической монеты: C + 4 знака base36 (проходит 2–5 символов)"""
+    digits = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    code = ""
+    for _ in range(4):
+        i, rest = divmod(i, 36)
+        code = digits[rest] + code
+    return "C" + code
+
+
+# ===== ЗАПИСЬ ФИКСТУР =====
+
+def _save_fixture(path: str, url: str, resp) -> None:
+    fixture = {
+        "url": url,
+        "recorded_at": datetime.now(timezone.utc).isoformat(),
+        "status": resp.status_code,
+        "headers": {
+            name: resp.headers[name]
+            for name in ("Content-Type", "ETag", "Last-Modified")
+            if name in resp.headers
+        },
+        "body": resp.json(),
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(fixture, f, ensure_ascii=False, indent=2)
+    print(f"{path}: статус {resp.status_code}")
+
+
+def record(config: ParserConfig, fixtures_dir: str) -> None:
+    """Записывает ответы настоящих API в fixtures_dir"""
+    os.makedirs(fixtures_dir, exist_ok=True)
+    session = get_session(config.HTTP_POOL_SIZE)
+
+    ids = [config.CRYPTO_ID_MAP[code] for code in config.CRYPTO_CURRENCIES]
+    params = {"ids": ",".join(ids), "vs_currencies": config.BASE_CURRENCY.lower()}
+    resp = session.get(
+        config.COINGECKO_URL, params=params, timeout=config.REQUEST_TIMEOUT
+    )
+    _save_fixture(
+        os.path.join(fixtures_dir, COINGECKO_FIXTURE), resp.url, resp
+    )
+
+    if not config.EXCHANGERATE_API_KEY:
+        print("ExchangeRate-API пропущен: не задан EXCHANGERATE_API_KEY")
+        return
+    url = (
+        f"{config.EXCHANGERATE_API_URL}/{config.EXCHANGERATE_API_KEY}"
+        f"/latest/{config.BASE_CURRENCY}"
+    )
+    resp = session.get(url, timeout=config.REQUEST_TIMEOUT)
+    _save_fixture(
+        os.path.join(fixtures_dir, EXCHANGERATE_FIXTURE),
+        url.replace(config.EXCHANGERATE_API_KEY, "<key>"),
+        resp,
+    )
+
+
+def _load_fixture(fixtures_dir: str, name: str, default: Dict) -> Dict:
+    try:
+        with open(os.path.join(fixtures_dir, name), "r", encoding="utf-8") as f:
+            return json.load(f)["body"]
+    except (FileNotFoundError, KeyError, ValueError):
+        return default
+
+
+# ===== ПОДДЕЛЬНЫЙ ПРОВАЙДЕР =====
+
+class FakeProvider:
+    """
+    Данные и поведение поддельного провайдера.
+
+    symbols   — сколько монет / фиатных валют отдавать: записанные
+                дополняются синтетическими coin-NNNNN / XNNNN
+    drift     — относительный шаг случайного блуждания курсов за ответ
+    latency_ms, jitter_ms — задержка ответа (равномерный джиттер ±)
+    error_rate — доля ответов 503
+    """
+
+    def __init__(
+        self,
+        fixtures_dir: str = FIXTURES_DIR,
+        symbols: int = 0,
+        drift: float = 0.001,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.drift = drift
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+        coins = _load_fixture(fixtures_dir, COINGECKO_FIXTURE, DEFAULT_COINGECKO)
+        # coin id -> цена в USD
+        self.coins: Dict[str, float] = {
+            coin_id: float(prices.get("usd", next(iter(prices.values()))))
+            for coin_id, prices in coins.items()
+            if prices
+        }
+        for i in range(max(symbols - len(self.coins), 0)):
+            self.coins[f"coin-{i:05d}"] = self.rng.lognormvariate(0, 3)
+
+        fiat = _load_fixture(
+            fixtures_dir, EXCHANGERATE_FIXTURE, DEFAULT_EXCHANGERATE
+        )
+        self.base_code = fiat.get("base_code", "USD")
+        # код -> единиц валюты за 1 base_code
+        self.fiat: Dict[str, float] = {
+            code: float(rate) for code, rate in fiat["conversion_rates"].items()
+        }
+        for i in range(max(symbols - len(self.fiat), 0)):
+            self.fiat[f"X{i:04d}"] = self.rng.lognormvariate(0, 2)
+
+        self.generation = 0
+
+    def crypto_codes(self) -> Dict[str, str]:
+        """Код -> coin id (BTC -> bitcoin и т.д., синтетические — CXXXX)"""
+        known = {v: k for k, v in ParserConfig().CRYPTO_ID_MAP.items()}
+        return {
+            known.get(coin_id) or _synthetic_code(int(coin_id[5:])): coin_id
+            for coin_id in self.coins
+            if coin_id in known or coin_id.startswith("coin-")
+        }
+
+    def _advance(self) -> None:
+        """Курсы меняются к каждому ответу (по ним меняется и ETag)"""
+        if not self.drift:
+            return
+        uniform = self.rng.uniform
+        for table in (self.coins, self.fiat):
+            for key, value in table.items():
+                if key != self.base_code:
+                    table[key] = value * (1 + uniform(-self.drift, self.drift))
+        self.generation += 1
+
+    def respond(self, path: str, etag: str) -> Tuple[int, Dict[str, str], bytes]:
+        """(статус, заголовки, тело) для запроса"""
+        with self.lock:
+            self.requests += 1
+            delay = self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)
+            failed = self.rng.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            else:
+                self._advance()
+
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if failed:
+            return 503, {"Retry-After": "0"}, b'{"error": "unavailable"}'
+
+        url = urlsplit(path)
+        current = f'W/"{self.generation}"'
+        if etag == current:
+            return 304, {"ETag": current}, b""
+
+        if url.path.endswith("/simple/price"):
+            query = parse_qs(url.query)
+            ids = ",".join(query.get("ids", [""])).split(",")
+            vs = query.get("vs_currencies", ["usd"])[0]
+            with self.lock:
+                body = {
+                    coin_id: {vs: self.coins[coin_id]}
+                    for coin_id in ids
+                    if coin_id in self.coins
+                }
+        elif url.path.endswith("/coins/markets"):
+            query = parse_qs(url.query)
+            per_page = int(query.get("per_page", ["100"])[0])
+            page = int(query.get("page", ["1"])[0])
+            codes = {coin_id: code for code, coin_id in self.crypto_codes().items()}
+            with self.lock:
+                # «капитализация» — цена × 1e6, по убыванию
+                ranked = sorted(self.coins.items(), key=lambda item: -item[1])
+            body = [
+                {
+                    "id": coin_id,
+                    "symbol": codes.get(coin_id, coin_id).lower(),
+                    "name": coin_id.replace("-", " ").title(),
+                    "market_cap": price * 1e6,
+                }
+                for coin_id, price in ranked[(page - 1) * per_page:page * per_page]
+            ]
+        elif url.path.endswith("/codes"):
+            body = {
+                "result": "success",
+                "supported_codes": [[code, code] for code in self.fiat],
+            }
+        elif "/latest/" in url.path:
+            with self.lock:
+                body = {
+                    "result": "success",
+                    "base_code": self.base_code,
+                    "conversion_rates": dict(self.fiat),
+                }
+        else:
+            return 404, {}, b'{"error": "not found"}'
+
+        headers = {"Content-Type": "application/json", "ETag": current}
+        return 200, headers, json.dumps(body).encode("utf-8")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # заголовки и тело уходят одним пакетом (иначе Nagle + delayed ACK)
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def do_GET(self) -> None:
+        status, headers, body = self.server.provider.respond(
+            self.path, self.headers.get("If-None-Match", "")
+        )
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class FakeProviderServer:
+    """HTTP-сервер FakeProvider в фоновом потоке"""
+
+    def __init__(self, provider: FakeProvider, host: str = "127.0.0.1", port: int = 0):
+        self.provider = provider
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.provider = provider
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def coingecko_url(self) -> str:
+        return f"{self.base_url}/api/v3/simple/price"
+
+    @property
+    def exchangerate_url(self) -> str:
+        return f"{self.base_url}/v6"
+
+    def parser_config(self, **overrides) -> ParserConfig:
+        """ParserConfig, направленный на этот сервер, со всеми его символами"""
+        crypto = self.provider.crypto_codes()
+        fiat = tuple(
+            code for code in self.provider.fiat if code != self.provider.base_code
+        )
+        params = {
+            "COINGECKO_URL": self.coingecko_url,
+            "EXCHANGERATE_API_URL": self.exchangerate_url,
+            "EXCHANGERATE_API_KEY": "fake-key",
+            "BASE_CURRENCY": self.provider.base_code,
+            "CRYPTO_CURRENCIES": tuple(crypto),
+            "CRYPTO_ID_MAP": crypto,
+            "FIAT_CURRENCIES": fiat,
+        }
+        params.update(overrides)
+        return ParserConfig(**params)
+
+    def start(self) -> "FakeProviderServer":
+        self._thread = threading.Thread(
+            target=self.httpd.serve_forever, name="fake-provider", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rec = sub.add_parser("record", help="записать ответы настоящих API")
+    rec.add_argument("--fixtures", default=FIXTURES_DIR)
+
+    serve = sub.add_parser("serve", help="запустить поддельный провайдер")
+    serve.add_argument("--fixtures", default=FIXTURES_DIR)
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--symbols", type=int, default=0)
+    serve.add_argument("--drift", type=float, default=0.001)
+    serve.add_argument("--latency-ms", type=float, default=0.0)
+    serve.add_argument("--jitter-ms", type=float, default=0.0)
+    serve.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(ParserConfig(), args.fixtures)
+        return
+
+    provider = FakeProvider(
+        args.fixtures,
+        symbols=args.symbols,
+        drift=args.drift,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+    )
+    server = FakeProviderServer(provider, port=args.port)
+    print("Поддельный провайдер запущен. Для клиентов parser_service:")
+    print(f"  export COINGECKO_URL={server.coingecko_url}")
+    print(f"  export EXCHANGERATE_API_URL={server.exchangerate_url}")
+    print("  export EXCHANGERATE_API_KEY=fake-key")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+import pytest
+
+from valutatrade_hub.logging_config import LOGGER
+
+
+@pytest.fixture(autouse=True)
+def quiet_logger():
+    """Тесты не пишут в logs/actions.log"""
+    LOGGER.disabled = True
+    yield
+    LOGGER.disabled = False
@@ -0,0 +1,180 @@
+"""HTTP-клиенты Parser Service против локального stub-сервера"""
+
+import json
+import os
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from valutatrade_hub.core.exceptions import ApiRequestError
+from valutatrade_hub.parser_service.api_clients import (
+    CoinGeckoClient,
+    ExchangeRateApiClient,
+)
+from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.storage import RatesStorage
+from valutatrade_hub.parser_service.updater import RatesUpdater
+
+PAYLOAD = json.dumps(
+    {
+        "bitcoin": {"usd": 95000.0},
+        "ethereum": {"usd": 3300.0},
+        "solana": {"usd": 145.0},
+    }
+).encode("utf-8")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Отвечает как CoinGecko /simple/price. Первые failures_left запросов
+    получают 503 (с Retry-After, если он задан).
+    """
+
+    protocol_version = "HTTP/1.1"
+    # заголовки и тело уходят одним пакетом (иначе Nagle + delayed ACK)
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    connections = 0
+    requests = 0
+    failures_left = 0
+    retry_after = ""
+    lock = threading.Lock()
+
+    def setup(self) -> None:
+        super().setup()
+        with StubHandler.lock:
+            StubHandler.connections += 1
+
+    def do_GET(self) -> None:
+        status, body = 200, PAYLOAD
+        with StubHandler.lock:
+            StubHandler.requests += 1
+            if StubHandler.failures_left > 0:
+                StubHandler.failures_left -= 1
+                status, body = 503, b"unavailable"
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 503 and StubHandler.retry_after:
+            self.send_header("Retry-After", StubHandler.retry_after)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def stub_url():
+    StubHandler.connections = StubHandler.requests = StubHandler.failures_left = 0
+    StubHandler.retry_after = ""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    ).start()
+    yield f"http://127.0.0.1:{server.server_port}/simple/price"
+    server.shutdown()
+    server.server_close()
+
+
+def _client(url: str, **overrides) -> CoinGeckoClient:
+    params = {"COINGECKO_URL": url, "HTTP_BACKOFF_BASE_SECONDS": 0.01}
+    params.update(overrides)
+    return CoinGeckoClient(ParserConfig(**params))
+
+
+def test_pool_reuses_connection(stub_url):
+    """Повторные запросы идут по одному keep-alive соединению"""
+    for _ in range(10):
+        client = _client(stub_url)
+        assert len(client.fetch_rates()) == 3
+
+    assert StubHandler.requests == 10
+    assert StubHandler.connections == 1
+
+
+def test_retry_on_503(stub_url):
+    """После двух 503 клиент повторяет запрос и получает ответ"""
+    StubHandler.failures_left = 2
+
+    assert len(_client(stub_url).fetch_rates()) == 3
+    assert StubHandler.requests == 3
+
+
+def test_retries_exhausted(stub_url):
+    """503 на каждую попытку — ошибка после HTTP_MAX_RETRIES повторов"""
+    StubHandler.failures_left = 100
+
+    with pytest.raises(ApiRequestError, match="503"):
+        _client(stub_url, HTTP_MAX_RETRIES=2).fetch_rates()
+    assert StubHandler.requests == 3
+
+
+def test_retry_after_overrides_backoff(stub_url):
+    """Retry-After: 0 важнее длинного экспоненциального backoff"""
+    StubHandler.failures_left = 2
+    StubHandler.retry_after = "0"
+    client = _client(
+        stub_url, HTTP_BACKOFF_BASE_SECONDS=30, HTTP_BACKOFF_MAX_SECONDS=30
+    )
+
+    start = time.monotonic()
+    assert len(client.fetch_rates()) == 3
+    assert time.monotonic() - start < 5
+
+
+def test_backoff_stops_at_deadline(stub_url):
+    """Пауза, выходящая за дедлайн обновления, не выдерживается"""
+    StubHandler.failures_left = 100
+    StubHandler.retry_after = "5"
+    client = _client(stub_url, HTTP_BACKOFF_MAX_SECONDS=5)
+    client.deadline = time.monotonic() + 1
+
+    start = time.monotonic()
+    with pytest.raises(ApiRequestError):
+        client.fetch_rates()
+    assert time.monotonic() - start < 1
+    assert StubHandler.requests == 1
+
+
+def _closed_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_failed_request_does_not_leak_api_key(tmp_path):
+    """Ключ API из URL не попадает ни в ошибку, ни в sources.json"""
+    key = "SECRETKEY123"
+    config = ParserConfig(
+        EXCHANGERATE_API_URL=f"http://127.0.0.1:{_closed_port()}/v6",
+        EXCHANGERATE_API_KEY=key,
+        HTTP_MAX_RETRIES=1,
+        HTTP_BACKOFF_BASE_SECONDS=0.01,
+        RATES_FILE_PATH=os.path.join(tmp_path, "rates.json"),
+        HISTORY_FILE_PATH=os.path.join(tmp_path, "exchange_rates.json"),
+        HISTORY_DIR_PATH=os.path.join(tmp_path, "history"),
+        SOURCES_STATE_FILE_PATH=os.path.join(tmp_path, "sources.json"),
+        UNIVERSE_FILE_PATH=os.path.join(tmp_path, "universe.json"),
+    )
+
+    with pytest.raises(ApiRequestError) as excinfo:
+        ExchangeRateApiClient(config).fetch_rates()
+    assert key not in str(excinfo.value)
+    assert "/v6/***/latest" in str(excinfo.value)
+
+    storage = RatesStorage(config)
+    result = RatesUpdater(
+        config, storage, [ExchangeRateApiClient(config)]
+    ).run_update()
+    assert result["errors"]
+    assert key not in str(result["errors"])
+    health = storage.load_sources_state()["ExchangeRate-API"]["health"]
+    assert health["last_error"]
+    with open(config.SOURCES_STATE_FILE_PATH, encoding="utf-8") as f:
+        assert key not in f.read()
@@ -0,0 +1,51 @@
+"""Журнал портфелей при нескольких экземплярах хранилища"""
+
+import os
+import threading
+
+from valutatrade_hub.core.models import Portfolio
+from valutatrade_hub.infra.repository import JournaledJsonStorageBackend
+
+
+def _make_backend(tmp_path) -> JournaledJsonStorageBackend:
+    return JournaledJsonStorageBackend(
+        str(tmp_path / "users.json"),
+        str(tmp_path / "portfolios.json"),
+        str(tmp_path / "user_seq.json"),
+        journal_file=str(tmp_path / "portfolios.journal"),
+        # сжатие после каждых нескольких записей
+        journal_max_bytes=300,
+    )
+
+
+def _deposit(backend: JournaledJsonStorageBackend, user_id: int, n: int) -> None:
+    for _ in range(n):
+        portfolio = backend.get_portfolio(user_id)
+        if portfolio is None:
+            portfolio = Portfolio(user_id=user_id, wallets={})
+        wallet = portfolio.get_wallet("USD") or portfolio.add_currency("USD")
+        wallet.deposit(1.0)
+        backend.save_portfolio_batch([portfolio])
+
+
+def test_two_instances_do_not_lose_deposits_on_compaction(tmp_path):
+    """Сжатие одного экземпляра не теряет записи другого"""
+    n = 500
+    backends = [_make_backend(tmp_path), _make_backend(tmp_path)]
+    threads = [
+        threading.Thread(target=_deposit, args=(backend, user_id, n))
+        for user_id, backend in enumerate(backends, start=1)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for backend in backends:
+        backend.close()
+
+    fresh = _make_backend(tmp_path)
+    for user_id in (1, 2):
+        assert fresh.get_portfolio(user_id).get_wallet("USD").balance == n
+
+    # свёрнутые журналы удалены
+    assert not [p for p in os.listdir(tmp_path) if p.endswith(".old")]
@@ -0,0 +1,198 @@
+"""MultiSourceScheduler на FakeClock: без сети и без ожидания"""
+
+import os
+import random
+from datetime import datetime, timezone
+
+import pytest
+
+from valutatrade_hub.core.exceptions import ApiRequestError
+from valutatrade_hub.parser_service.api_clients import BaseApiClient
+from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.scheduler import (
+    FakeClock,
+    MultiSourceScheduler,
+    SourceSchedule,
+)
+from valutatrade_hub.parser_service.storage import RatesStorage
+
+
+class FakeClient(BaseApiClient):
+    """
+    Источник без HTTP: каждый опрос «отправляет» batches запросов
+    и тратит latency секунд часов. outcomes — результаты опросов по
+    порядку (False — ошибка), дальше — успех.
+    """
+
+    def __init__(
+        self,
+        config: ParserConfig,
+        clock: FakeClock,
+        outcomes=(),
+        batches: int = 1,
+        latency: float = 0.0,
+        config_error=None,
+    ) -> None:
+        super().__init__(config)
+        self.clock = clock
+        self.outcomes = list(outcomes)
+        self.batches = batches
+        self.latency = latency
+        self.config_error = config_error
+        self.calls = []
+
+    @property
+    def name(self) -> str:
+        return "Fake"
+
+    @property
+    def configuration_error(self):
+        return self.config_error
+
+    def fetch_rates(self):
+        self.calls.append(self.clock.monotonic())
+        self.requests_sent += self.batches
+        self.clock.advance(self.latency)
+        if self.outcomes and not self.outcomes.pop(0):
+            raise ApiRequestError("Fake: статус 503")
+        return {"BTC_USD": {"rate": 100.0 + len(self.calls), "source": self.name}}
+
+
+@pytest.fixture
+def config(tmp_path):
+    return ParserConfig(
+        RATES_FILE_PATH=os.path.join(tmp_path, "rates.json"),
+        HISTORY_FILE_PATH=os.path.join(tmp_path, "exchange_rates.json"),
+        HISTORY_DIR_PATH=os.path.join(tmp_path, "history"),
+        SOURCES_STATE_FILE_PATH=os.path.join(tmp_path, "sources.json"),
+        UNIVERSE_FILE_PATH=os.path.join(tmp_path, "universe.json"),
+        # breaker не вмешивается, если тест не проверяет его явно
+        BREAKER_FAILURE_THRESHOLD=1000,
+    )
+
+
+def _scheduler(config, clock, client, **schedule_params):
+    params = {"interval": 60.0, "jitter": 0.0, "backoff_base": 30.0}
+    params.update(schedule_params)
+    schedule = SourceSchedule(client, **params)
+    scheduler = MultiSourceScheduler(
+        config, RatesStorage(config), [schedule], clock=clock, rng=random.Random(1)
+    )
+    return scheduler, schedule
+
+
+def test_start_times_do_not_drift(config):
+    """Сроки считаются от предыдущего срока: задержка запроса не копится"""
+    clock = FakeClock()
+    client = FakeClient(config, clock, latency=2.5)
+    scheduler, _ = _scheduler(config, clock, client)
+
+    scheduler.run(iterations=100)
+
+    assert client.calls == [i * 60.0 for i in range(100)]
+
+
+def test_jitter_stays_within_bounds(config):
+    """Каждый запуск отклоняется от сетки не больше чем на jitter·интервал"""
+    clock = FakeClock()
+    client = FakeClient(config, clock, latency=1.0)
+    scheduler, _ = _scheduler(config, clock, client, jitter=0.1)
+
+    scheduler.run(iterations=200)
+
+    offsets = [t - i * 60.0 for i, t in enumerate(client.calls)]
+    assert all(abs(offset) <= 6.0 for offset in offsets)
+    # джиттер действительно применяется
+    assert len({round(offset, 6) for offset in offsets}) > 100
+
+
+def test_backoff_grows_and_resets(config):
+    """После ошибок пауза удваивается, после успеха — снова интервал"""
+    clock = FakeClock()
+    client = FakeClient(config, clock, outcomes=[False, False, False, True, True])
+    scheduler, schedule = _scheduler(config, clock, client)
+
+    scheduler.run(iterations=5)
+
+    gaps = [b - a for a, b in zip(client.calls, client.calls[1:])]
+    assert gaps == [30.0, 60.0, 120.0, 60.0]
+    assert schedule.failures == 0
+
+
+def test_backoff_is_capped(config):
+    clock = FakeClock()
+    client = FakeClient(config, clock, outcomes=[False] * 10)
+    scheduler, _ = _scheduler(config, clock, client, backoff_max=200.0)
+
+    scheduler.run(iterations=10)
+
+    gaps = [b - a for a, b in zip(client.calls, client.calls[1:])]
+    assert max(gaps) == 200.0
+
+
+def test_monthly_quota_is_spread_over_the_month(config):
+    """Квота 100 запросов делится на весь месяц, а не тратится в первые часы"""
+    clock = FakeClock()  # 2026-01-01 00:00 UTC
+    month_end = datetime(2026, 2, 1, tzinfo=timezone.utc).timestamp()
+    mid_month = datetime(2026, 1, 16, 12, tzinfo=timezone.utc).timestamp()
+    client = FakeClient(config, clock)
+    scheduler, schedule = _scheduler(
+        config, clock, client, jitter=0.1, monthly_quota=100
+    )
+
+    while clock.time() < month_end:
+        scheduler.run(iterations=1)
+
+    offset = clock.time() - clock.monotonic()
+    in_month = [t + offset for t in client.calls if t + offset < month_end]
+    assert 90 <= len(in_month) <= 100
+    first_half = [t for t in in_month if t < mid_month]
+    assert 40 <= len(first_half) <= 60
+
+
+def test_quota_counts_requests_actually_sent(config):
+    """Пакетные запросы расходуют квоту по числу отправленных запросов"""
+    clock = FakeClock()
+    client = FakeClient(config, clock, batches=3)
+    scheduler, schedule = _scheduler(config, clock, client, monthly_quota=1000)
+
+    scheduler.run(iterations=4)
+
+    assert schedule.quota_used == 12
+    saved = RatesStorage(config).load_sources_state()["Fake"]["quota"]
+    assert saved["used"] == 12
+
+
+def test_unconfigured_source_is_skipped_not_failed(config):
+    """Без ключа API запросов нет: квота не тратится, backoff не растёт"""
+    clock = FakeClock()
+    client = FakeClient(config, clock, config_error="ключ API не задан")
+    scheduler, schedule = _scheduler(config, clock, client)
+
+    for _ in range(10):
+        scheduler.run(iterations=1)
+
+    assert client.calls == []
+    assert schedule.quota_used == 0
+    assert schedule.failures == 0
+    assert schedule.skipped == 10
+    assert schedule.last_error == "ключ API не задан"
+    # без backoff: опросы идут с обычным интервалом
+    assert clock.monotonic() == 9 * 60.0
+
+
+def test_open_breaker_is_skipped_not_failed(config):
+    """Пока breaker открыт, источник пропускается без запроса и без backoff"""
+    config.BREAKER_FAILURE_THRESHOLD = 1
+    clock = FakeClock()
+    client = FakeClient(config, clock, outcomes=[False])
+    scheduler, schedule = _scheduler(config, clock, client)
+
+    for _ in range(4):
+        scheduler.run(iterations=1)
+
+    # breaker живёт по реальным часам и за время теста не закрывается
+    assert len(client.calls) == 1
+    assert schedule.quota_used == 1
+    assert schedule.failures == 1
+    assert schedule.skipped == 3
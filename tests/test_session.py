@@ -0,0 +1,56 @@
+"""Сессии портфелей поверх хранилищ с точечной записью"""
+
+import os
+
+import pytest
+
+from valutatrade_hub.core.session import UnitOfWork
+from valutatrade_hub.infra.repository import (
+    JournaledJsonStorageBackend,
+    JsonStorageBackend,
+    ShardedJsonStorageBackend,
+    SqliteStorageBackend,
+)
+
+
+def _make_backend(kind: str, tmp_path):
+    users = str(tmp_path / "users.json")
+    seq = str(tmp_path / "user_seq.json")
+    if kind == "json":
+        return JsonStorageBackend(users, str(tmp_path / "portfolios.json"), seq)
+    if kind == "journal":
+        return JournaledJsonStorageBackend(
+            users,
+            str(tmp_path / "portfolios.json"),
+            seq,
+            journal_file=str(tmp_path / "portfolios.journal"),
+        )
+    if kind == "sharded":
+        return ShardedJsonStorageBackend(
+            users, str(tmp_path / "portfolios"), seq, shard_count=4
+        )
+    return SqliteStorageBackend(os.path.join(tmp_path, "data.db"))
+
+
+def _buy(session: UnitOfWork, user_id: int, amount: float) -> None:
+    portfolio = session.get_portfolio(user_id)
+    wallet = portfolio.get_wallet("BTC") or portfolio.add_currency("BTC")
+    wallet.deposit(amount)
+    session.mark_dirty(portfolio)
+    session.commit()
+
+
+@pytest.mark.parametrize("kind", ["json", "journal", "sharded", "sqlite"])
+def test_two_sessions_do_not_lose_writes(kind, tmp_path):
+    """buy/buy/buy из двух долгоживущих сессий (как у CLI) — сумма сохраняется"""
+    # отдельные экземпляры хранилища — как два процесса
+    first = UnitOfWork(_make_backend(kind, tmp_path))
+    second = UnitOfWork(_make_backend(kind, tmp_path))
+
+    _buy(first, 1, 1.0)
+    _buy(second, 1, 1.0)
+    _buy(first, 1, 1.0)
+
+    for session in (first, second):
+        assert session.get_portfolio(1).get_wallet("BTC").balance == 3.0
+        session.backend.close()
@@ -1,9 +1,14 @@
 import shlex
+from datetime import datetime, timezone
 
 from valutatrade_hub.parser_service.api_clients import CoinGeckoClient, ExchangeRateApiClient
 from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.health import SourceHealth
+from valutatrade_hub.parser_service.history_index import get_history_index
 from valutatrade_hub.parser_service.storage import RatesStorage
+from valutatrade_hub.parser_service.universe import apply_universe
 from valutatrade_hub.parser_service.updater import RatesUpdater
+from valutatrade_hub.infra.repository import migrate_storage
 
 from ..core.usecases import (
     register,
@@ -12,8 +17,17 @@ from ..core.usecases import (
     buy,
     sell,
     get_rate,
+    get_rate_at,
+    get_rate_history,
+    get_rates_to,
 )
+from ..core.rates_cache import get_rates_snapshot
+from ..core.revaluation import revalue_all
+from ..core.analytics import analyze_pair, correlation_matrix, parse_window
+from ..core.backtest import portfolio_history
 
+from ..core.currencies import get_currency
+from ..core.session import UnitOfWork
 from ..core.exceptions import (
     InsufficientFundsError,
     CurrencyNotFoundError,
@@ -26,13 +40,30 @@ def print_help():
     print("  register --username <str> --password <str>")
     print("  login --username <str> --password <str>")
     print("  show-portfolio [--base <VAL>]")
+    print("  portfolio-history [--base <VAL>] [--days <N>] [--step <1h|1d>]")
     print("  buy --currency <VAL> --amount <FLOAT>")
     print("  sell --currency <VAL> --amount <FLOAT>")
-    print("  get-rate --from <VAL> --to <VAL>")
+    print("  get-rate --from <VAL> --to <VAL> [--at <ISO-время>]")
+    print("  rate-history --pair <FROM_TO> [--interval <1m|1h|1d>] [--limit <N>]")
+    print("  analytics --pair <FROM_TO> [--window <30m|24h|7d>] [--days <N>]")
+    print("  revalue-all [--base <VAL>] [--top <N>]")
+    print("  sources-status")
+    print(
+        "  migrate-storage --to <json|journal|sharded|sqlite>"
+        " [--from <json|journal|sharded|sqlite>]"
+    )
     print("  help")
     print("  exit\n")
 
 
+def format_age(seconds: float) -> str:
+    """Возраст курса в удобочитаемом виде"""
+    minutes = int(seconds // 60)
+    if minutes < 60:
+        return f"{minutes} мин назад"
+    return f"{minutes // 60} ч {minutes % 60} мин назад"
+
+
 def parse_args(args: list) -> dict:
     """Простейший парсер аргументов"""
     result = {}
@@ -57,6 +88,8 @@ def run_cli():
     print_help()
 
     current_user = None
+    # Сессия держит загруженные портфели между командами
+    session = UnitOfWork()
 
     while True:
         try:
@@ -118,7 +151,9 @@ def run_cli():
             base = args.get("base")
 
             try:
-                data = show_portfolio(current_user, base_currency=base)
+                data = show_portfolio(
+                    current_user, base_currency=base, session=session
+                )
 
                 print(f"\nПортфель пользователя '{data['username']}' (база: {data['base']}):")
 
@@ -135,6 +170,11 @@ def run_cli():
 
                     if conv is None:
                         print(f"- {code}: {bal:.4f} → курс недоступен")
+                    elif w["stale"]:
+                        print(
+                            f"- {code}: {bal:.4f} → {conv:.4f} {data['base']} "
+                            f"(курс устарел, {format_age(w['age_seconds'])})"
+                        )
                     else:
                         print(f"- {code}: {bal:.4f} → {conv:.4f} {data['base']}")
 
@@ -168,7 +208,7 @@ def run_cli():
 
                 amount = float(amount)
 
-                result = buy(current_user, currency, amount)
+                result = buy(current_user, currency, amount, session=session)
 
                 print("\nПокупка выполнена:")
                 print(f"- Валюта: {result['currency']}")
@@ -177,6 +217,10 @@ def run_cli():
 
                 if result["estimated_value_usd"] is not None:
                     print(f"- Оценочная стоимость: {result['estimated_value_usd']:.4f} USD")
+                    if result["estimate_refreshing"]:
+                        print("  (по устаревшему курсу, обновление запущено в фоне)")
+                    elif result["estimate_stale"]:
+                        print("  (по устаревшему курсу)")
                 else:
                     print("- Оценочная стоимость недоступна (нет курса).")
 
@@ -212,7 +256,7 @@ def run_cli():
 
                 amount = float(amount)
 
-                result = sell(current_user, currency, amount)
+                result = sell(current_user, currency, amount, session=session)
 
                 print("\nПродажа выполнена:")
                 print(f"- Валюта: {result['currency']}")
@@ -221,6 +265,10 @@ def run_cli():
 
                 if result["estimated_income_usd"] is not None:
                     print(f"- Оценочная выручка: {result['estimated_income_usd']:.4f} USD")
+                    if result["estimate_refreshing"]:
+                        print("  (по устаревшему курсу, обновление запущено в фоне)")
+                    elif result["estimate_stale"]:
+                        print("  (по устаревшему курсу)")
                 else:
                     print("- Курс недоступен — оценка невозможна.")
 
@@ -250,13 +298,39 @@ def run_cli():
                 t = args.get("to")
 
                 if not f or not t:
-                    print("Используйте: get-rate --from <VAL> --to <VAL>")
+                    print(
+                        "Используйте: get-rate --from <VAL> --to <VAL>"
+                        " [--at <ISO-время>]"
+                    )
+                    continue
+
+                at = args.get("at")
+                if at:
+                    data = get_rate_at(f, t, at)
+                    print(
+                        f"\nКурс {f.upper()} → {t.upper()} на {at}: {data['rate']} "
+                        f"(котировка от {data['timestamp']})"
+                    )
+                    print(
+                        f"Обратный курс {t.upper()} → {f.upper()}: "
+                        f"{data['reverse_rate']}\n"
+                    )
                     continue
 
                 data = get_rate(f, t)
 
                 print(f"\nКурс {f.upper()} → {t.upper()}: {data['rate']} (обновлено: {data['updated_at']})")
-                print(f"Обратный курс {t.upper()} → {f.upper()}: {data['reverse_rate']}\n")
+                print(f"Обратный курс {t.upper()} → {f.upper()}: {data['reverse_rate']}")
+                if data["stale"]:
+                    refresh = (
+                        ", обновление запущено в фоне"
+                        if data["refreshing"] else ""
+                    )
+                    print(
+                        f"Внимание: курс устарел "
+                        f"({format_age(data['age_seconds'])}){refresh}."
+                    )
+                print("")
 
             except CurrencyNotFoundError as e:
                 print(e)
@@ -302,6 +376,14 @@ def run_cli():
             last_refresh = result["last_refresh"]
             errors = result["errors"]
 
+            if result["unchanged_sources"]:
+                print(f"INFO: Not modified: {', '.join(result['unchanged_sources'])}")
+            if result["unchanged_rates"]:
+                print(
+                    f"INFO: {result['unchanged_rates']} курсов без изменений — "
+                    f"продлена только свежесть, история не пополнялась"
+                )
+
             if errors:
                 for src, msg in errors:
                     print(f"ERROR: Failed to fetch from {src}: {msg}")
@@ -315,18 +397,58 @@ def run_cli():
                     f"Last refresh: {last_refresh}"
                 )
 
+        # SOURCES-STATUS
+        elif cmd == "sources-status":
+            config = ParserConfig()
+            state = RatesStorage(config).load_sources_state()
+            now = datetime.now(timezone.utc).timestamp()
+
+            print("\nСостояние источников курсов:")
+            for name in ("CoinGecko", "ExchangeRate-API"):
+                entry = state.get(name, {})
+                health = SourceHealth(
+                    failure_threshold=config.BREAKER_FAILURE_THRESHOLD,
+                    reset_seconds=config.BREAKER_RESET_SECONDS,
+                    window=config.HEALTH_WINDOW,
+                    data=entry.get("health"),
+                )
+                rate = health.success_rate
+                p50, p95 = health.latency(50), health.latency(95)
+
+                print(f"- {name}: breaker {health.state}")
+                print(
+                    f"    успешных: "
+                    f"{'—' if rate is None else f'{rate:.0%}'} "
+                    f"из {len(health.results)} последних запросов"
+                )
+                print(
+                    f"    request_ms: p50 {'—' if p50 is None else f'{p50:.0f}'}, "
+                    f"p95 {'—' if p95 is None else f'{p95:.0f}'}"
+                )
+                if health.failures:
+                    print(f"    ошибок подряд: {health.failures}")
+                if health.retry_in(now):
+                    print(f"    пробный запрос через {health.retry_in(now):.0f} с")
+                if health.last_error:
+                    print(f"    последняя ошибка: {health.last_error}")
+                quota = entry.get("quota")
+                if quota:
+                    print(
+                        f"    квота за {quota['month']}: "
+                        f"использовано {quota['used']}"
+                    )
+            print()
+
         # SHOW-RATES
         elif cmd == "show-rates":
             config = ParserConfig()
-            storage = RatesStorage(config)
+            snapshot = get_rates_snapshot()
 
-            data = storage.load_cache()
-            if not data or "pairs" not in data:
+            if not snapshot.rates:
                 print("Локальный кеш курсов пуст. Выполните 'update-rates', чтобы загрузить данные.")
                 continue
 
-            pairs = data["pairs"]
-            last_refresh = data.get("last_refresh", "unknown")
+            last_refresh = snapshot.last_refresh or "unknown"
 
             currency_filter = args.get("currency")
             top_n = args.get("top")
@@ -335,38 +457,16 @@ def run_cli():
             # Базовая валюта по умолчанию — та же, что в конфиге
             base_currency = (base or config.BASE_CURRENCY).upper()
 
-            usd_rates = {}
-            for pair_key, payload in pairs.items():
-                from_code, to_code = pair_key.split("_", 1)
-                if to_code != config.BASE_CURRENCY:
-                    continue
-                usd_rates[from_code] = float(payload["rate"])
-
-            if base_currency != config.BASE_CURRENCY:
-                if base_currency not in usd_rates:
-                    print(f"Базовая валюта '{base_currency}' не найдена в кеше.")
-                    continue
-                base_usd = usd_rates[base_currency]
-                if base_usd == 0:
-                    print(f"Невозможно пересчитать в базу '{base_currency}'.")
-                    continue
-
-                # пересчёт в base_currency
-                converted_pairs = {}
-                for code, rate_usd in usd_rates.items():
-                    rate_base = rate_usd / base_usd
-                    key = f"{code}_{base_currency}"
-                    converted_pairs[key] = rate_base
+            # Все курсы к базе одним проходом по снимку (TTL не проверяем —
+            # показываем содержимое кеша как есть)
+            rates = get_rates_to(base_currency, check_ttl=False)
+            display_pairs = {
+                key: info["rate"] for key, info in rates.items() if info is not None
+            }
 
-                # из converted_pairs строим список для вывода
-                display_pairs = {
-                    key: rate for key, rate in converted_pairs.items()
-                }
-            else:
-                # база = USD
-                display_pairs = {}
-                for pair_key, payload in pairs.items():
-                    display_pairs[pair_key] = float(payload["rate"])
+            if not display_pairs:
+                print(f"Базовая валюта '{base_currency}' не найдена в кеше.")
+                continue
 
             # Фильтрация по валюте
             if currency_filter:
@@ -387,6 +487,8 @@ def run_cli():
                     print("--top должен быть числом")
                     continue
 
+                if config.UNIVERSE_MODE == "full":
+                    apply_universe(config, RatesStorage(config).load_universe())
                 crypto_set = set(config.CRYPTO_CURRENCIES)
                 filtered = {
                     k: v for k, v in display_pairs.items()
@@ -400,6 +502,194 @@ def run_cli():
             for pair_key, rate in sorted(display_pairs.items()):
                 print(f"- {pair_key}: {rate}")
 
+        # RATE-HISTORY
+        elif cmd == "rate-history":
+            pair = args.get("pair")
+            interval = args.get("interval") or "1h"
+            limit = args.get("limit")
+
+            if not pair:
+                print(
+                    "Используйте: rate-history --pair <FROM_TO>"
+                    " [--interval <1m|1h|1d>] [--limit <N>]"
+                )
+                continue
+
+            try:
+                n = int(limit) if limit is not None else 24
+                buckets = get_rate_history(pair, interval, limit=n)
+            except ValueError as e:
+                print(e)
+                continue
+
+            if not buckets:
+                print(f"История для '{pair.upper()}' не найдена.")
+                continue
+
+            print(f"\n{pair.upper()}, интервал {interval}:")
+            for b in buckets:
+                start = datetime.fromtimestamp(b["start"], timezone.utc)
+                print(
+                    f"- {start:%Y-%m-%d %H:%M} "
+                    f"O={b['open']} H={b['high']} L={b['low']} C={b['close']} "
+                    f"(тиков: {b['count']})"
+                )
+            print("")
+
+        # PORTFOLIO-HISTORY
+        elif cmd == "portfolio-history":
+            if current_user is None:
+                print("Сначала выполните login")
+                continue
+
+            base = (args.get("base") or "USD").upper()
+            days = args.get("days")
+
+            try:
+                get_currency(base)
+                step = parse_window(args.get("step") or "1d")
+                start = None
+                if days is not None:
+                    start = datetime.now(timezone.utc).timestamp() - float(days) * 86400
+                data = portfolio_history(
+                    current_user.user_id, base, start=start, step=step
+                )
+            except (ValueError, CurrencyNotFoundError) as e:
+                print(e)
+                continue
+
+            if not data["points"]:
+                print("Нет данных для построения истории портфеля.")
+                continue
+
+            print(f"\nСтоимость портфеля '{current_user.username}' в {base}:")
+            for ts, value in data["points"]:
+                moment = datetime.fromtimestamp(ts, timezone.utc)
+                shown = f"{value:,.2f}" if value == value else "нет курса"
+                print(f"- {moment:%Y-%m-%d %H:%M}  {shown}")
+
+            if data["start_value"] is not None:
+                change = data["end_value"] - data["start_value"]
+                print(f"Изменение за период: {change:+,.2f} {base}")
+            if data["unpriced"]:
+                print(f"Без истории курса: {', '.join(data['unpriced'])}")
+            print("")
+
+        # ANALYTICS
+        elif cmd == "analytics":
+            pair = args.get("pair")
+            window_arg = args.get("window") or "24h"
+            days = args.get("days")
+
+            if not pair:
+                print(
+                    "Используйте: analytics --pair <FROM_TO>"
+                    " [--window <30m|24h|7d>] [--days <N>]"
+                )
+                continue
+
+            try:
+                window = parse_window(window_arg)
+                start = None
+                if days is not None:
+                    start = datetime.now(timezone.utc).timestamp() - float(days) * 86400
+                data = analyze_pair(pair, window, start=start)
+            except ValueError as e:
+                print(e)
+                continue
+
+            begin = datetime.fromtimestamp(data["start"], timezone.utc)
+            end = datetime.fromtimestamp(data["end"], timezone.utc)
+            print(
+                f"\n{data['pair']}, окно {window_arg}: {data['count']} тиков "
+                f"({begin:%Y-%m-%d %H:%M} — {end:%Y-%m-%d %H:%M} UTC)"
+            )
+            print(f"- Последний курс:  {data['last']:.6f}")
+            print(f"- SMA:             {data['sma']:.6f}")
+            print(f"- EMA:             {data['ema']:.6f}")
+            print(
+                f"- Волатильность:   {data['volatility'] * 100:.4f}% "
+                "(std лог-доходностей)"
+            )
+            print(f"- Просадка:        {data['drawdown'] * 100:.2f}%")
+            print(f"- Макс. просадка:  {data['max_drawdown'] * 100:.2f}%")
+
+            # корреляции с парами в той же валюте котировки
+            quote = data["pair"].split("_", 1)[1]
+            pairs = [p for p in get_history_index().pairs() if p.endswith(f"_{quote}")]
+            step = max(window / 24, 60)
+            names, rows = correlation_matrix(pairs, step=step, start=start)
+            if len(names) > 1:
+                print(f"\nКорреляции доходностей (шаг {int(step // 60)} мин):")
+                print(" " * 9 + "".join(f"{n:>9}" for n in names))
+                for name, row in zip(names, rows):
+                    print(
+                        f"{name:>9}"
+                        + "".join(f"{v:9.2f}" if v == v else f"{'—':>9}" for v in row)
+                    )
+            print("")
+
+        # REVALUE-ALL
+        elif cmd == "revalue-all":
+            base = (args.get("base") or "USD").upper()
+            top_n = args.get("top")
+
+            try:
+                n = int(top_n) if top_n is not None else 10
+            except ValueError:
+                print("--top должен быть числом")
+                continue
+
+            try:
+                data = revalue_all(base)
+            except Exception as e:
+                print(e)
+                continue
+
+            print(
+                f"\nПереоценка портфелей в {data['base']}: "
+                f"пользователей {data['users']}, кошельков {data['wallets']}"
+            )
+            print(f"AUM: {data['aum']:.4f} {data['base']}")
+            if data["unpriced"]:
+                print(f"Нет курса для: {', '.join(data['unpriced'])} (учтены как 0)")
+
+            top = sorted(data["totals"].items(), key=lambda item: item[1], reverse=True)
+            for user_id, total in top[:n]:
+                print(f"- user_id={user_id}: {total:.4f} {data['base']}")
+
+            print(
+                f"Время: загрузка {data['build_ms']:.1f} ms, "
+                f"переоценка {data['revalue_ms']:.1f} ms\n"
+            )
+
+        # MIGRATE-STORAGE
+        elif cmd == "migrate-storage":
+            target = args.get("to")
+            source = args.get("from") or "json"
+
+            if not target:
+                print(
+                    "Используйте: migrate-storage --to <json|journal|sharded|sqlite>"
+                    " [--from <json|journal|sharded|sqlite>]"
+                )
+                continue
+
+            try:
+                counts = migrate_storage(source.lower(), target.lower())
+            except Exception as e:
+                print(e)
+                continue
+
+            print(
+                f"Перенесено пользователей: {counts['users']}, "
+                f"портфелей: {counts['portfolios']} ({source} → {target})."
+            )
+            print(
+                f"Чтобы использовать новое хранилище, укажите "
+                f"\"STORAGE_BACKEND\": \"{target.lower()}\" в config.json."
+            )
+
         elif cmd == "help":
             print_help()
 
@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import math
+import operator
+from array import array
+from bisect import bisect_right
+from itertools import accumulate, repeat
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from valutatrade_hub.parser_service.history_index import get_history_index
+
+# Все расчёты идут по array('d') через map/accumulate с функциями на C
+# (operator, math, bisect), без Python-цикла по тикам.
+
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def parse_window(text: str) -> float:
+    """'90s' / '30m' / '24h' / '7d' / '2w' -> секунды"""
+    raw = text.strip().lower()
+    try:
+        seconds = float(raw[:-1]) * _UNITS[raw[-1]]
+    except (IndexError, KeyError, ValueError):
+        seconds = 0.0
+    if not seconds > 0:
+        raise ValueError(
+            f"Некорректное окно '{text}', ожидается например 30m, 24h, 7d"
+        )
+    return seconds
+
+
+# ---------- Скользящие окна ----------
+def window_starts(times: array, window: float) -> List[int]:
+    """Для каждой точки i — индекс первой точки окна (t_i - window, t_i]"""
+    return list(
+        map(bisect_right, repeat(times), map(operator.sub, times, repeat(window)))
+    )
+
+
+def _window_sums(values: array, starts: Sequence[int]) -> Tuple[map, List[int]]:
+    """Суммы values по окнам [starts[i], i] через префиксные суммы"""
+    prefix = array("d", accumulate(values, initial=0.0))
+    sums = map(operator.sub, prefix[1:], map(prefix.__getitem__, starts))
+    counts = list(map(operator.sub, range(1, len(values) + 1), starts))
+    return sums, counts
+
+
+def rolling_mean(values: array, starts: Sequence[int]) -> array:
+    """Скользящее среднее (SMA) по окнам"""
+    sums, counts = _window_sums(values, starts)
+    return array("d", map(operator.truediv, sums, counts))
+
+
+def rolling_std(values: array, starts: Sequence[int]) -> array:
+    """Скользящее выборочное стандартное отклонение (0 для окна из 1 точки)"""
+    sums, counts = _window_sums(values, starts)
+    sums = list(sums)
+    squares, _ = _window_sums(array("d", map(operator.mul, values, values)), starts)
+
+    mean_sq = map(operator.truediv, map(operator.mul, sums, sums), counts)
+    numerators = map(max, map(operator.sub, squares, mean_sq), repeat(0.0))
+    dof = map(max, map(operator.sub, counts, repeat(1)), repeat(1))
+    return array("d", map(math.sqrt, map(operator.truediv, numerators, dof)))
+
+
+def log_returns(rates: array) -> array:
+    """Логарифмические доходности r[k] = ln(p[k+1] / p[k])"""
+    return array("d", map(math.log, map(operator.truediv, rates[1:], rates[:-1])))
+
+
+def ema(times: array, rates: array, window: float) -> array:
+    """
+    EMA с учётом неравномерных интервалов: вес прошлого значения
+    exp(-dt / window). Рекурсия последовательна по природе, поэтому
+    считается через accumulate (один шаг — одно выражение).
+    """
+    if not rates:
+        return array("d")
+    decays = map(
+        math.exp,
+        map(
+            operator.truediv,
+            map(operator.sub, times[:-1], times[1:]),
+            repeat(window),
+        ),
+    )
+    steps = zip(decays, rates[1:])
+    return array(
+        "d",
+        accumulate(
+            steps, lambda prev, s: s[1] + s[0] * (prev - s[1]), initial=rates[0]
+        ),
+    )
+
+
+def drawdowns(rates: array) -> array:
+    """Просадка от исторического максимума: p / max(p[:i+1]) - 1"""
+    peaks = accumulate(rates, max)
+    ratios = map(operator.truediv, rates, peaks)
+    return array("d", map(operator.sub, ratios, repeat(1.0)))
+
+
+# ---------- Анализ пары ----------
+def analyze_pair(
+    pair: str,
+    window: float,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+) -> Dict:
+    """
+    SMA, EMA, волатильность (std лог-доходностей в окне) и просадки
+    по истории пары. Ряды возвращаются как array('d') в "series".
+    """
+    pair = pair.strip().upper()
+    times, rates = get_history_index().series(pair, start, end)
+    if not times:
+        raise ValueError(f"История для пары '{pair}' не найдена")
+
+    starts = window_starts(times, window)
+
+    # доходность k относится к точке k + 1; окно доходностей для точки i
+    # начинается с доходности, входящей в точку max(starts[i], 1)
+    return_starts = list(
+        map(operator.sub, map(max, starts[1:], repeat(1)), repeat(1))
+    )
+    volatility = array("d", [math.nan])
+    volatility.extend(rolling_std(log_returns(rates), return_starts))
+
+    series = {
+        "times": times,
+        "rate": rates,
+        "sma": rolling_mean(rates, starts),
+        "ema": ema(times, rates, window),
+        "volatility": volatility,
+        "drawdown": drawdowns(rates),
+    }
+
+    return {
+        "pair": pair,
+        "window": window,
+        "count": len(times),
+        "start": times[0],
+        "end": times[-1],
+        "last": rates[-1],
+        "sma": series["sma"][-1],
+        "ema": series["ema"][-1],
+        "volatility": volatility[-1],
+        "drawdown": series["drawdown"][-1],
+        "max_drawdown": min(series["drawdown"]),
+        "series": series,
+    }
+
+
+# ---------- Корреляции ----------
+def _pearson(x: array, y: array) -> float:
+    n = len(x)
+    if n < 2:
+        return math.nan
+    sx, sy = math.fsum(x), math.fsum(y)
+    cov = math.fsum(map(operator.mul, x, y)) - sx * sy / n
+    vx = math.fsum(map(operator.mul, x, x)) - sx * sx / n
+    vy = math.fsum(map(operator.mul, y, y)) - sy * sy / n
+    if vx <= 0 or vy <= 0:
+        return math.nan
+    return cov / math.sqrt(vx * vy)
+
+
+def correlation_matrix(
+    pairs: Optional[Sequence[str]] = None,
+    step: float = 3600,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+) -> Tuple[List[str], List[array]]:
+    """
+    Матрица корреляций лог-доходностей пар на общей сетке времени с шагом
+    step (курс в узле — последний известный). Сетка начинается, когда
+    история есть у всех пар. Возвращает (пары, строки матрицы).
+    """
+    index = get_history_index()
+    if pairs is None:
+        pairs = index.pairs()
+
+    data = {}
+    for pair in pairs:
+        times, rates = index.series(pair, None, end)
+        if times:
+            data[pair] = (times, rates)
+
+    names = sorted(data)
+    if not names:
+        return [], []
+
+    first = max(times[0] for times, _ in data.values())
+    last = max(times[-1] for times, _ in data.values()) if end is None else end
+    begin = first if start is None else max(first, start)
+
+    n = int((last - begin) // step) + 1 if last >= begin else 0
+    offsets = map(operator.mul, range(n), repeat(step))
+    grid = array("d", map(operator.add, repeat(begin), offsets))
+
+    returns = {}
+    for pair in names:
+        times, rates = data[pair]
+        found = map(bisect_right, repeat(times), grid)
+        positions = map(operator.sub, found, repeat(1))
+        returns[pair] = log_returns(array("d", map(rates.__getitem__, positions)))
+
+    rows = []
+    for a in names:
+        rows.append(array("d", (_pearson(returns[a], returns[b]) for b in names)))
+    return names, rows
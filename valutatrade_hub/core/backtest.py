@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import heapq
+import math
+import time
+from itertools import repeat
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from valutatrade_hub.infra.ledger import get_ledger
+from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.history_index import get_history_index
+from valutatrade_hub.parser_service.history_store import to_epoch
+
+from .exceptions import InsufficientFundsError
+from .utils import get_portfolio_by_user_id
+
+# Порядок событий с одинаковым временем: сначала курс, затем сделка,
+# затем точка ряда — точка видит и новый курс, и результат сделки
+_TICK, _TRADE, _SAMPLE = 0, 1, 2
+
+# Сделка для replay_trades: (время epoch, BUY|SELL, валюта, сумма)
+Trade = Tuple[float, str, str, float]
+
+
+def _price_stream(code: str, base: str, end: float) -> Iterator[Tuple]:
+    """Котировки code в base до end как события (время, _TICK, код, цена)"""
+    index = get_history_index()
+    times, rates = index.series(f"{code}_{base}", None, end)
+    if times:
+        return zip(times, repeat(_TICK), repeat(code), rates)
+
+    times, rates = index.series(f"{base}_{code}", None, end)
+    inverse = (1.0 / r if r else math.nan for r in rates)
+    return zip(times, repeat(_TICK), repeat(code), inverse)
+
+
+def replay_trades(
+    trades: Iterable[Trade],
+    start: float,
+    end: float,
+    step: float,
+    base: str = "USD",
+    initial: Optional[Dict[str, float]] = None,
+) -> Dict:
+    """
+    Стоимость портфеля во времени при заданной последовательности сделок.
+
+    Сделки, котировки из истории и точки ряда (start, start + step, ...,
+    end) сливаются одним проходом heapq.merge по времени, без поиска
+    курса на каждую точку. Цены ведутся в базовой валюте Parser Service
+    и пересчитываются в base делением на цену base.
+
+    Можно подавать гипотетические сделки (бэктест): SELL сверх баланса
+    даёт InsufficientFundsError, как и в sell().
+    """
+    base = base.upper()
+    quote = ParserConfig.BASE_CURRENCY
+    balances: Dict[str, float] = dict(initial or {})
+    trades = sorted(trades, key=lambda t: t[0])
+
+    codes = set(balances) | {code for _, _, code, _ in trades} | {base}
+    prices: Dict[str, float] = {quote: 1.0}
+
+    n = int((end - start) // step) + 1 if end >= start else 0
+    grid = [start + i * step for i in range(n)]
+    if grid:
+        # ряд заканчивается ровно в end; точку сетки, совпавшую с end
+        # с точностью до округления, не дублируем
+        if end - grid[-1] > step * 1e-9:
+            grid.append(end)
+        else:
+            grid[-1] = end
+    samples = ((ts, _SAMPLE, None, None) for ts in grid)
+    events = (
+        (ts, _TRADE, code, (action.upper(), amount))
+        for ts, action, code, amount in trades
+    )
+    streams = [_price_stream(c, quote, end) for c in sorted(codes) if c != quote]
+
+    points: List[Tuple[float, float]] = []
+    unpriced: set = set()
+
+    for ts, kind, code, payload in heapq.merge(*streams, events, samples):
+        if kind == _TICK:
+            prices[code] = payload
+        elif kind == _TRADE:
+            action, amount = payload
+            balance = balances.get(code, 0.0)
+            if action == "BUY":
+                balances[code] = balance + amount
+            elif action == "SELL":
+                if amount > balance * (1 + 1e-12):
+                    raise InsufficientFundsError(balance, amount, code)
+                balances[code] = max(balance - amount, 0.0)
+            else:
+                raise ValueError(f"Неизвестный тип сделки '{action}'")
+        else:
+            base_price = prices.get(base, math.nan)
+            total = 0.0
+            for c, amount in balances.items():
+                price = prices.get(c, math.nan)
+                if amount and math.isnan(price):
+                    unpriced.add(c)
+                elif amount:
+                    total += amount * price
+            points.append((ts, total / base_price))
+
+    values = [v for _, v in points if not math.isnan(v)]
+    return {
+        "base": base,
+        "points": points,
+        "balances": balances,
+        "start_value": values[0] if values else None,
+        "end_value": values[-1] if values else None,
+        "unpriced": sorted(unpriced),
+    }
+
+
+def portfolio_history(
+    user_id: int,
+    base: str = "USD",
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    step: float = 86400,
+) -> Dict:
+    """
+    Стоимость портфеля пользователя во времени по журналу сделок.
+    Начальные балансы (до первой записи в журнале) выводятся из текущего
+    портфеля за вычетом всех сделок журнала.
+    """
+    trades: List[Trade] = []
+    for entry in get_ledger().iter_entries(user_id):
+        trades.append(
+            (
+                to_epoch(entry["timestamp"]),
+                entry["action"],
+                entry["currency"],
+                float(entry["amount"]),
+            )
+        )
+    trades.sort(key=lambda t: t[0])
+
+    opening: Dict[str, float] = {
+        code: wallet.balance
+        for code, wallet in get_portfolio_by_user_id(user_id).wallets.items()
+    }
+    for _, action, code, amount in trades:
+        delta = amount if action == "BUY" else -amount
+        opening[code] = opening.get(code, 0.0) - delta
+
+    # округление float не должно давать отрицательный стартовый баланс
+    opening = {code: max(amount, 0.0) for code, amount in opening.items()}
+
+    if end is None:
+        end = time.time()
+    if start is None:
+        start = trades[0][0] if trades else end - 30 * 86400
+
+    # сделки до start учитываются в стартовом балансе
+    initial = dict(opening)
+    for ts, action, code, amount in trades:
+        if ts >= start:
+            break
+        delta = amount if action == "BUY" else -amount
+        initial[code] = initial.get(code, 0.0) + delta
+    later = [t for t in trades if t[0] >= start]
+
+    return replay_trades(later, start, end, step, base, initial)
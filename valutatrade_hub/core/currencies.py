@@ -1,7 +1,11 @@
 from __future__ import annotations
 
+import json
+import os
 from abc import ABC, abstractmethod
-from typing import Dict
+from typing import Dict, Optional
+
+from valutatrade_hub.infra.settings import SettingsLoader
 
 from .exceptions import CurrencyNotFoundError
 
@@ -79,6 +83,53 @@ def register_currency(currency: Currency) -> None:
     _CURRENCY_REGISTRY[currency.code] = currency
 
 
+# mtime universe.json, из которого уже зарегистрированы валюты
+_UNIVERSE_MTIME: Optional[int] = None
+
+
+def _register_universe() -> None:
+    """
+    Регистрирует валюты из universe.json (его пишет parser_service
+    в режиме UNIVERSE_MODE=full). Файл перечитывается только при
+    изменении; валюты, уже бывшие в реестре, не заменяются.
+    """
+    global _UNIVERSE_MTIME
+    path = SettingsLoader().get("UNIVERSE_FILE")
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except (FileNotFoundError, TypeError):
+        return
+    if mtime == _UNIVERSE_MTIME:
+        return
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            universe = json.load(f)
+    except (OSError, ValueError):
+        return
+    _UNIVERSE_MTIME = mtime
+
+    for code, name in universe.get("fiat", {}).items():
+        if code in _CURRENCY_REGISTRY:
+            continue
+        try:
+            register_currency(FiatCurrency(name or code, code, "—"))
+        except ValueError:
+            continue
+
+    for code, coin in universe.get("crypto", {}).items():
+        if code in _CURRENCY_REGISTRY:
+            continue
+        try:
+            register_currency(
+                CryptoCurrency(
+                    coin.get("name") or code, code, "—", coin.get("market_cap") or 0
+                )
+            )
+        except ValueError:
+            continue
+
+
 def get_currency(code: str) -> Currency:
     """Возвращает объект валюты по коду"""
     if not isinstance(code, str) or not code.strip():
@@ -86,6 +137,8 @@ def get_currency(code: str) -> Currency:
 
     code = code.upper()
 
+    if code not in _CURRENCY_REGISTRY:
+        _register_universe()
     if code not in _CURRENCY_REGISTRY:
         raise CurrencyNotFoundError(code)
 
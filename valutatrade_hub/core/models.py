@@ -184,6 +184,17 @@ class Portfolio:
         base = base_currency.upper()
         total = 0.0
 
+        if exchange_rates is None:
+            # Курсы всех кошельков берём одним запросом из текущего снимка
+            from .usecases import get_rates_to
+
+            codes = [c for c in self._wallets if c != base]
+            exchange_rates = {
+                pair_key: info["rate"]
+                for pair_key, info in get_rates_to(base, codes).items()
+                if info is not None
+            }
+
         for wallet in self._wallets.values():
             code = wallet.currency_code
 
@@ -191,11 +202,6 @@ class Portfolio:
                 total += wallet.balance
                 continue
 
-            if exchange_rates is None:
-                raise ValueError(
-                    "Для конвертации требуется словарь exchange_rates",
-                )
-
             pair_key = f"{code}_{base}"
             if pair_key not in exchange_rates:
                 raise ValueError(
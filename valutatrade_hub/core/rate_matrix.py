@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import math
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from valutatrade_hub.parser_service.config import ParserConfig
+
+from .rates_cache import RatesSnapshot, get_rates_snapshot
+
+# (курс, updated_at в epoch seconds, updated_at как в rates.json)
+Quote = Tuple[float, float, str]
+
+
+class RateMatrix:
+    """
+    Матрица кросс-курсов N×N между всеми валютами снимка.
+
+    Котировки к базовой валюте (X_USD и USD_X) сводятся в вектор q,
+    где q[i] — цена валюты i в базовой валюте. Тогда курс i -> j
+    равен q[i] / q[j]: матрица имеет ранг 1 и хранится в факторизованном
+    виде, любой элемент читается за O(1) по индексам валют.
+    Прямые кросс-котировки (например EUR_RUB) перекрывают расчётные.
+    """
+
+    def __init__(self, snapshot: RatesSnapshot, base: str) -> None:
+        self.base = base
+        self.ttl_seconds = snapshot.ttl_seconds
+        self.grace_seconds = snapshot.grace_seconds
+
+        quotes: Dict[str, Quote] = {base: (1.0, math.inf, "")}
+        direct: Dict[Tuple[str, str], Quote] = {}
+
+        for pair_key, rate in snapshot.rates.items():
+            if rate <= 0:
+                continue
+            from_code, to_code = pair_key.split("_", 1)
+            quote = (
+                rate,
+                snapshot.updated_at[pair_key],
+                snapshot.updated_at_raw[pair_key],
+            )
+
+            if to_code == base:
+                quotes[from_code] = quote
+            elif from_code == base:
+                # котировка X_BASE приоритетнее обратной BASE_X
+                quotes.setdefault(to_code, (1.0 / rate, quote[1], quote[2]))
+            else:
+                direct[(from_code, to_code)] = quote
+                direct.setdefault((to_code, from_code), (1.0 / rate, *quote[1:]))
+
+        codes = set(quotes)
+        for from_code, to_code in direct:
+            codes.add(from_code)
+            codes.add(to_code)
+
+        self.codes: List[str] = sorted(codes)
+        self.index: Dict[str, int] = {c: i for i, c in enumerate(self.codes)}
+
+        missing: Quote = (math.nan, -math.inf, "")
+        self._quotes = array("d", (quotes.get(c, missing)[0] for c in self.codes))
+        self._updated = array("d", (quotes.get(c, missing)[1] for c in self.codes))
+        self._updated_raw = [quotes.get(c, missing)[2] for c in self.codes]
+
+        self._direct: Dict[Tuple[int, int], Quote] = {
+            (self.index[f], self.index[t]): q for (f, t), q in direct.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def quote_by_id(self, i: int, j: int) -> Optional[Quote]:
+        """Курс i -> j со временем обновления (более старой из котировок)"""
+        if i == j:
+            return (1.0, math.inf, "")
+
+        direct = self._direct.get((i, j))
+        if direct is not None:
+            return direct
+
+        qi = self._quotes[i]
+        qj = self._quotes[j]
+        if math.isnan(qi) or math.isnan(qj):
+            return None
+
+        k = i if self._updated[i] <= self._updated[j] else j
+        return (qi / qj, self._updated[k], self._updated_raw[k])
+
+    def quote(self, code_from: str, code_to: str) -> Optional[Quote]:
+        i = self.index.get(code_from)
+        j = self.index.get(code_to)
+        if i is None or j is None:
+            return None
+        return self.quote_by_id(i, j)
+
+    def rate(self, code_from: str, code_to: str) -> Optional[float]:
+        quote = self.quote(code_from, code_to)
+        return quote[0] if quote is not None else None
+
+    def dense(self) -> List[array]:
+        """Полная матрица N×N (строки array('d'), NaN — курса нет)"""
+        n = len(self.codes)
+        rows = []
+        for i in range(n):
+            row = array("d", [math.nan]) * n
+            for j in range(n):
+                quote = self.quote_by_id(i, j)
+                if quote is not None:
+                    row[j] = quote[0]
+            rows.append(row)
+        return rows
+
+
+def get_rate_matrix() -> RateMatrix:
+    """
+    Матрица для текущего снимка курсов.
+    Строится один раз на снимок, т.е. после каждого обновления rates.json.
+    """
+    snapshot = get_rates_snapshot()
+    if snapshot.matrix is None:
+        snapshot.matrix = RateMatrix(snapshot, ParserConfig.BASE_CURRENCY)
+    return snapshot.matrix
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from valutatrade_hub.infra.settings import SettingsLoader
+
+from .utils import _load_json
+
+
+def parse_timestamp(raw: str) -> float:
+    """ISO-время ('...Z' или без зоны = UTC) -> epoch seconds"""
+    dt = datetime.fromisoformat(raw.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class RatesSnapshot:
+    """
+    Разобранное содержимое rates.json:
+    курсы — float, updated_at — epoch seconds.
+    """
+
+    def __init__(
+        self,
+        data: dict,
+        ttl_seconds: float,
+        grace_seconds: float = 0.0,
+    ) -> None:
+        if not isinstance(data, dict):
+            data = {}
+        pairs = data.get("pairs", data)
+
+        self.rates: Dict[str, float] = {}
+        self.updated_at: Dict[str, float] = {}
+        self.updated_at_raw: Dict[str, str] = {}
+
+        for pair_key, payload in pairs.items():
+            if not isinstance(payload, dict) or "rate" not in payload:
+                continue
+            raw = payload.get("updated_at", "")
+            try:
+                ts = parse_timestamp(raw)
+            except (TypeError, ValueError):
+                continue
+            self.rates[pair_key] = float(payload["rate"])
+            self.updated_at[pair_key] = ts
+            self.updated_at_raw[pair_key] = raw
+
+        self.last_refresh: Optional[str] = data.get("last_refresh")
+        self.version = data.get("version", 0)
+        self.ttl_seconds = float(ttl_seconds)
+        # Сколько после TTL курс ещё можно отдавать с пометкой stale
+        self.grace_seconds = float(grace_seconds)
+
+        # RateMatrix для этого снимка, строится лениво (см. rate_matrix.py)
+        self.matrix = None
+
+
+class RatesCache:
+    """
+    Процессный кэш rates.json.
+    Файл перечитывается, только когда меняется его inode/mtime/size
+    (RatesStorage пишет файл через os.replace и повышает version).
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._signature: Optional[tuple] = None
+        self._snapshot: Optional[RatesSnapshot] = None
+
+    def _file_signature(self) -> Optional[tuple]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def get(self) -> RatesSnapshot:
+        signature = self._file_signature()
+        snapshot = self._snapshot
+        if snapshot is not None and signature == self._signature:
+            return snapshot
+
+        with self._lock:
+            if self._snapshot is None or signature != self._signature:
+                settings = SettingsLoader()
+                ttl = settings.get("RATES_TTL_SECONDS", 300)
+                grace = 0.0
+                if settings.get("RATES_STALE_WHILE_REVALIDATE", False):
+                    grace = settings.get("RATES_STALE_GRACE_SECONDS", 0)
+
+                self._snapshot = RatesSnapshot(
+                    _load_json(self.path, {}), ttl, grace
+                )
+                self._signature = signature
+            return self._snapshot
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._snapshot = None
+            self._signature = None
+
+
+_CACHE: Optional[RatesCache] = None
+
+# Последний снимок, полученный от демона курсов, и его поколение
+_DAEMON_SNAPSHOT: Optional[RatesSnapshot] = None
+_DAEMON_GENERATION = 0
+
+
+def _daemon_snapshot() -> Optional[RatesSnapshot]:
+    """
+    Снимок от демона курсов (parser_service.daemon), если он запущен.
+    Пока поколение не изменилось, запрос не несёт данных, и снимок
+    (вместе с построенной для него RateMatrix) переиспользуется.
+    """
+    global _DAEMON_SNAPSHOT, _DAEMON_GENERATION
+    from valutatrade_hub.parser_service.daemon import get_daemon_client
+
+    client = get_daemon_client()
+    if client is None:
+        return None
+    try:
+        fresh = client.snapshot(_DAEMON_GENERATION)
+    except OSError:
+        return None
+    if fresh is not None:
+        _DAEMON_GENERATION, _DAEMON_SNAPSHOT = fresh
+    return _DAEMON_SNAPSHOT
+
+
+def get_rates_snapshot() -> RatesSnapshot:
+    """Текущий снимок курсов (общий на процесс): от демона или из файла"""
+    global _CACHE
+    snapshot = _daemon_snapshot()
+    if snapshot is not None:
+        return snapshot
+
+    if _CACHE is None:
+        _CACHE = RatesCache(SettingsLoader().get("RATES_FILE"))
+    return _CACHE.get()
+
+
+def invalidate_rates_cache() -> None:
+    """Принудительно сбрасывает снимок курсов"""
+    global _DAEMON_SNAPSHOT, _DAEMON_GENERATION
+    _DAEMON_SNAPSHOT = None
+    _DAEMON_GENERATION = 0
+    if _CACHE is not None:
+        _CACHE.invalidate()
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import math
+import operator
+from array import array
+from time import perf_counter
+from typing import Dict, Iterable, List, Optional
+
+from .models import Portfolio
+from .utils import iter_portfolios
+
+
+class BalanceMatrix:
+    """
+    Разреженная матрица балансов пользователи × валюты в формате CSR:
+    строка i — портфель user_ids[i], его кошельки лежат в
+    currency_ids/balances[indptr[i]:indptr[i + 1]].
+    """
+
+    def __init__(self) -> None:
+        self.currencies: List[str] = []
+        self.currency_index: Dict[str, int] = {}
+        self.user_ids = array("q")
+        self.indptr = array("q", [0])
+        self.currency_ids = array("l")
+        self.balances = array("d")
+
+    @classmethod
+    def from_portfolios(cls, portfolios: Iterable[Portfolio]) -> "BalanceMatrix":
+        matrix = cls()
+        index = matrix.currency_index
+        for portfolio in portfolios:
+            for code, wallet in portfolio.wallets.items():
+                cid = index.get(code)
+                if cid is None:
+                    cid = index[code] = len(matrix.currencies)
+                    matrix.currencies.append(code)
+                matrix.currency_ids.append(cid)
+                matrix.balances.append(wallet.balance)
+            matrix.user_ids.append(portfolio.user_id)
+            matrix.indptr.append(len(matrix.balances))
+        return matrix
+
+    @property
+    def n_users(self) -> int:
+        return len(self.user_ids)
+
+    @property
+    def n_wallets(self) -> int:
+        return len(self.balances)
+
+    def dot(self, rate_vector: array) -> List[float]:
+        """
+        Умножение матрицы на вектор курсов (индекс — id валюты).
+        Весь проход идёт через map по массивам, без Python-цикла
+        на каждый кошелёк.
+        """
+        rates = map(rate_vector.__getitem__, self.currency_ids)
+        products = list(map(operator.mul, self.balances, rates))
+        slices = map(slice, self.indptr[:-1], self.indptr[1:])
+        return list(map(math.fsum, map(products.__getitem__, slices)))
+
+
+def revalue_all(
+    base: str = "USD",
+    portfolios: Optional[Iterable[Portfolio]] = None,
+) -> Dict:
+    """
+    Оценка всех портфелей в базовой валюте.
+    Возвращает суммы по пользователям и общий объём активов (AUM).
+    Валюты без курса оцениваются в 0 и перечисляются в "unpriced".
+    """
+    # импорт здесь: usecases сам зависит от модулей core
+    from .usecases import get_rates_to
+
+    base = base.upper()
+
+    start = perf_counter()
+    matrix = BalanceMatrix.from_portfolios(
+        portfolios if portfolios is not None else iter_portfolios()
+    )
+    build_ms = (perf_counter() - start) * 1000
+
+    start = perf_counter()
+    rates = get_rates_to(base, matrix.currencies, check_ttl=False)
+
+    rate_vector = array("d", [0.0]) * len(matrix.currencies)
+    unpriced = []
+    for code, cid in matrix.currency_index.items():
+        info = rates[f"{code}_{base}"]
+        if info is None:
+            unpriced.append(code)
+        else:
+            rate_vector[cid] = info["rate"]
+
+    totals = matrix.dot(rate_vector)
+    revalue_ms = (perf_counter() - start) * 1000
+
+    return {
+        "base": base,
+        "totals": dict(zip(matrix.user_ids, totals)),
+        "aum": math.fsum(totals),
+        "users": matrix.n_users,
+        "wallets": matrix.n_wallets,
+        "unpriced": sorted(unpriced),
+        "build_ms": build_ms,
+        "revalue_ms": revalue_ms,
+    }
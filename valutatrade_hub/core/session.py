@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from typing import Dict, Optional, Set
+
+from valutatrade_hub.infra.repository import StorageBackend, get_backend
+
+from .models import Portfolio
+
+
+class UnitOfWork:
+    """
+    Сессия работы с портфелями.
+    Держит загруженные портфели, отмечает изменённые и сохраняет их
+    одной операцией в commit().
+
+    Для хранилищ с точечной записью портфель перечитывается из хранилища
+    в начале каждой единицы работы (пока он не изменён в этой сессии),
+    чтобы не затереть записи других сессий и процессов.
+    Для хранилищ без точечной записи (JSON) сессия один раз загружает
+    все портфели и при commit перезаписывает файл из памяти, не читая
+    его повторно. Если файл изменили извне, снимок перечитывается.
+    """
+
+    def __init__(self, backend: Optional[StorageBackend] = None) -> None:
+        self._backend = backend
+        self._portfolios: Dict[int, Portfolio] = {}
+        self._dirty: Set[int] = set()
+        self._snapshot_loaded = False
+        self._version: Optional[tuple] = None
+
+    @property
+    def backend(self) -> StorageBackend:
+        if self._backend is None:
+            self._backend = get_backend()
+        return self._backend
+
+    def __enter__(self) -> "UnitOfWork":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+    # ---------- Загрузка ----------
+    def _ensure_snapshot(self) -> None:
+        """Загружает (или обновляет) полный снимок для JSON-хранилища"""
+        version = self.backend.portfolios_version()
+        if self._snapshot_loaded and (self._dirty or version == self._version):
+            return
+
+        self._portfolios = self.backend.load_portfolios()
+        self._version = version
+        self._snapshot_loaded = True
+
+    def get_portfolio(self, user_id: int) -> Portfolio:
+        """Возвращает портфель пользователя, создавая пустой при отсутствии"""
+        if not self.backend.partial_writes:
+            self._ensure_snapshot()
+        elif user_id not in self._dirty:
+            portfolio = self.backend.get_portfolio(user_id)
+            if portfolio is not None:
+                self._portfolios[user_id] = portfolio
+
+        if user_id not in self._portfolios:
+            self._portfolios[user_id] = Portfolio(user_id=user_id, wallets={})
+            self._dirty.add(user_id)
+
+        return self._portfolios[user_id]
+
+    def mark_dirty(self, portfolio: Portfolio) -> None:
+        """Отмечает портфель как изменённый"""
+        self._portfolios[portfolio.user_id] = portfolio
+        self._dirty.add(portfolio.user_id)
+
+    # ---------- Фиксация ----------
+    def commit(self) -> None:
+        """Сохраняет все изменённые портфели одной операцией"""
+        if not self._dirty:
+            return
+
+        if self.backend.partial_writes:
+            self.backend.save_portfolio_batch(
+                [self._portfolios[uid] for uid in sorted(self._dirty)]
+            )
+        else:
+            self.backend.save_portfolios(self._portfolios)
+            self._version = self.backend.portfolios_version()
+
+        self._dirty.clear()
+
+    def rollback(self) -> None:
+        """Отбрасывает несохранённые изменения"""
+        for uid in self._dirty:
+            self._portfolios.pop(uid, None)
+        self._dirty.clear()
+        # Снимок без выброшенных портфелей неполон — перечитаем при обращении
+        self._snapshot_loaded = False
@@ -1,10 +1,15 @@
 from __future__ import annotations
 
-from datetime import datetime, timedelta, timezone
-from typing import Tuple, Dict
+from datetime import datetime, timezone
+from typing import Tuple, Dict, Iterable, List, Optional, Set
 
 from valutatrade_hub.infra.settings import SettingsLoader
 from valutatrade_hub.decorators import log_action
+from valutatrade_hub.infra.ledger import get_ledger
+from valutatrade_hub.logging_config import LOGGER
+from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.history_index import get_history_index
+from valutatrade_hub.parser_service.storage import RatesStorage
 
 from .models import User, Wallet, Portfolio
 from .exceptions import (
@@ -13,21 +18,20 @@ from .exceptions import (
     ApiRequestError,
 )
 from .currencies import get_currency
+from .rate_matrix import RateMatrix, get_rate_matrix
+from .rates_cache import parse_timestamp
+from .session import UnitOfWork
 from .utils import (
-    load_users,
-    save_users,
-    generate_user_id,
+    add_user,
+    next_user_id,
     find_user_by_username,
-    load_portfolios,
-    save_portfolios,
-    get_portfolio_by_user_id,
     update_portfolio,
-    load_rates,
-    save_rates,
 )
 
 import secrets
 import hashlib
+import math
+import time
 
 
 # ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ
@@ -35,6 +39,20 @@ def _hash_password(password: str, salt: str) -> str:
     return hashlib.sha256((password + salt).encode("utf-8")).hexdigest()
 
 
+def _record_trade(
+    user: User,
+    action: str,
+    currency: str,
+    amount: float,
+    balance: float,
+) -> None:
+    """Запись сделки в журнал; сбой журнала не отменяет уже сохранённую сделку"""
+    try:
+        get_ledger().record(user.user_id, action, currency, amount, balance)
+    except OSError as e:
+        LOGGER.error(f"{action} user='{user.username}' ledger write failed: {e}")
+
+
 def _validate_amount(amount: float) -> float:
     if not isinstance(amount, (int, float)):
         raise ValueError("'amount' должен быть числом")
@@ -55,8 +73,7 @@ def register(username: str, password: str) -> str:
     if find_user_by_username(username) is not None:
         raise ValueError(f"Имя пользователя '{username}' уже занято")
 
-    users = load_users()
-    user_id = generate_user_id(users)
+    user_id = next_user_id()
 
     salt = secrets.token_hex(8)
     hashed = _hash_password(password, salt)
@@ -69,12 +86,8 @@ def register(username: str, password: str) -> str:
         registration_date=datetime.utcnow(),
     )
 
-    users.append(new_user)
-    save_users(users)
-
-    portfolios = load_portfolios()
-    portfolios[user_id] = Portfolio(user_id=user_id, wallets={})
-    save_portfolios(portfolios)
+    add_user(new_user)
+    update_portfolio(Portfolio(user_id=user_id, wallets={}))
 
     return f"Пользователь '{username}' зарегистрирован (id={user_id})."
 
@@ -92,38 +105,92 @@ def login(username: str, password: str) -> Tuple[User, str]:
 
 
 # ПОЛУЧЕНИЕ КУРСА С УЧЁТОМ TTL
-def _get_rate_internal(code_from: str, code_to: str) -> Dict:
+def _resolve_rate(
+    matrix: RateMatrix,
+    code_from: str,
+    code_to: str,
+    now: float,
+    check_ttl: bool = True,
+) -> Optional[Dict]:
     """
-    Получение курса валюты из локального кэша Parser Service.
+    Курс по матрице снимка или None, если его нет или он устарел.
+    В пределах grace-окна после TTL курс возвращается с stale=True.
     """
+    if code_from == code_to:
+        return {
+            "rate": 1.0,
+            "reverse_rate": 1.0,
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+            "stale": False,
+            "age_seconds": 0.0,
+        }
 
-    base_currency = get_currency(code_from)
-    target_currency = get_currency(code_to)
+    quote = matrix.quote(code_from, code_to)
+    if quote is None:
+        return None
+
+    rate, updated_at, raw_updated_at = quote
+    age = now - updated_at
+    stale = age >= matrix.ttl_seconds
+
+    # Проверяем, не устарели ли данные
+    if check_ttl and age >= matrix.ttl_seconds + matrix.grace_seconds:
+        return None
+
+    return {
+        "rate": rate,
+        "updated_at": raw_updated_at,
+        "reverse_rate": matrix.rate(code_to, code_from),
+        "stale": stale,
+        "age_seconds": age,
+    }
 
+
+def _revalidate_if_expired(
+    matrix: RateMatrix, codes: Iterable[str], now: float
+) -> bool:
+    """
+    Если котировка запрошенной валюты к базовой старше TTL — запускает
+    фоновый опрос её источника. Сам вызов не ждёт сети.
+    Возвращает True, если опрос действительно запущен.
+    """
     settings = SettingsLoader()
-    ttl_seconds = settings.get("RATES_TTL_SECONDS", 300)
+    if not settings.get("RATES_STALE_WHILE_REVALIDATE", False):
+        return False
+
+    ages: Dict[str, float] = {}
+    for code in codes:
+        quote = matrix.quote(code, matrix.base)
+        if quote is not None and now - quote[1] >= matrix.ttl_seconds:
+            ages[code] = now - quote[1]
+    if not ages:
+        return False
 
-    rates = load_rates()
-    pairs = rates
+    from valutatrade_hub.parser_service.refresher import refresh_in_background
+
+    return refresh_in_background(
+        ages, settings.get("RATES_REFRESH_MIN_INTERVAL_SECONDS", 60)
+    )
 
-    pair_key = f"{base_currency.code}_{target_currency.code}"
-    reverse_key = f"{target_currency.code}_{base_currency.code}"
 
-    if pair_key in pairs:
-        raw_updated_at = pairs[pair_key]["updated_at"]
+def _get_rate_internal(code_from: str, code_to: str) -> Dict:
+    """
+    Получение курса валюты из локального кэша Parser Service.
+    """
 
-        updated_at_str = raw_updated_at.replace("Z", "+00:00")
-        updated_at = datetime.fromisoformat(updated_at_str)
+    base_currency = get_currency(code_from)
+    target_currency = get_currency(code_to)
 
-        now = datetime.now(timezone.utc)
+    matrix = get_rate_matrix()
+    now = time.time()
+    refreshing = _revalidate_if_expired(
+        matrix, (base_currency.code, target_currency.code), now
+    )
 
-        # Проверяем, не устарели ли данные
-        if now - updated_at < timedelta(seconds=ttl_seconds):
-            return {
-                "rate": float(pairs[pair_key]["rate"]),
-                "updated_at": raw_updated_at,
-                "reverse_rate": float(pairs.get(reverse_key, {}).get("rate", 0.0)),
-            }
+    info = _resolve_rate(matrix, base_currency.code, target_currency.code, now)
+    if info is not None:
+        info["refreshing"] = refreshing
+        return info
 
     # Если пары нет или данные устарели
     raise ApiRequestError("Parser Service временно недоступен или данные устарели")
@@ -147,37 +214,220 @@ def get_rate(code_from: str, code_to: str) -> Dict:
             "rate": 1.0,
             "reverse_rate": 1.0,
             "updated_at": now,
+            "stale": False,
+            "age_seconds": 0.0,
+            "refreshing": False,
         }
 
     # Получаем курс из локального кэша ParserService
     return _get_rate_internal(code_from, code_to)
 
 
+# ПАКЕТНОЕ ПОЛУЧЕНИЕ КУРСОВ
+def _get_rates(
+    matrix: RateMatrix,
+    pairs: Iterable[Tuple[str, str]],
+    check_ttl: bool,
+) -> Dict[str, Optional[Dict]]:
+    now = time.time()
+    result: Dict[str, Optional[Dict]] = {}
+    codes: Set[str] = set()
+    for code_from, code_to in pairs:
+        code_from = code_from.upper()
+        code_to = code_to.upper()
+        codes.update((code_from, code_to))
+        result[f"{code_from}_{code_to}"] = _resolve_rate(
+            matrix, code_from, code_to, now, check_ttl
+        )
+
+    if check_ttl:
+        _revalidate_if_expired(matrix, codes, now)
+    return result
+
+
+def get_rates(
+    pairs: Iterable[Tuple[str, str]],
+    check_ttl: bool = True,
+) -> Dict[str, Optional[Dict]]:
+    """
+    Курсы для многих пар за один проход по одному снимку.
+    Возвращает {"FROM_TO": данные как у get_rate или None}.
+    В отличие от get_rate не требует, чтобы валюта была в реестре,
+    и не бросает исключений для отсутствующих/устаревших пар.
+    """
+    return _get_rates(get_rate_matrix(), pairs, check_ttl)
+
+
+def get_rates_to(
+    base: str,
+    codes: Optional[Iterable[str]] = None,
+    check_ttl: bool = True,
+) -> Dict[str, Optional[Dict]]:
+    """
+    Курсы codes -> base (по умолчанию — всех валют снимка, кроме base).
+    """
+    base = base.upper()
+    matrix = get_rate_matrix()
+    if codes is None:
+        codes = [code for code in matrix.codes if code != base]
+    return _get_rates(matrix, ((code, base) for code in codes), check_ttl)
+
+
+# КУРС НА МОМЕНТ ВРЕМЕНИ (ИСТОРИЯ)
+def _to_epoch(moment) -> float:
+    """ISO-строка / datetime / epoch -> epoch seconds (без зоны = UTC)"""
+    if isinstance(moment, (int, float)):
+        return float(moment)
+    if isinstance(moment, str):
+        try:
+            return parse_timestamp(moment.strip())
+        except ValueError:
+            raise ValueError(
+                f"Некорректное время '{moment}', ожидается ISO 8601 "
+                f"(например 2026-01-14T12:25:00)"
+            )
+    if isinstance(moment, datetime):
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return moment.timestamp()
+    raise ValueError(f"Некорректное время: {moment!r}")
+
+
+def _history_quote(index, code: str, base: str, at: float):
+    """Цена code в base на момент at: (курс, время) или None"""
+    if code == base:
+        return 1.0, math.inf
+
+    direct = index.rate_at(f"{code}_{base}", at)
+    if direct is not None:
+        return direct
+
+    inverse = index.rate_at(f"{base}_{code}", at)
+    if inverse is not None and inverse[0] != 0:
+        return 1.0 / inverse[0], inverse[1]
+    return None
+
+
+def get_rate_at(code_from: str, code_to: str, at) -> Dict:
+    """
+    Курс code_from -> code_to на момент at по истории Parser Service.
+    Берётся последняя котировка не позже at, кросс-курс — через базовую валюту.
+    """
+    code_from = get_currency(code_from).code
+    code_to = get_currency(code_to).code
+    at_ts = _to_epoch(at)
+
+    if code_from == code_to:
+        return {"rate": 1.0, "reverse_rate": 1.0, "timestamp": None}
+
+    index = get_history_index()
+    base = ParserConfig.BASE_CURRENCY
+
+    direct = index.rate_at(f"{code_from}_{code_to}", at_ts)
+    if direct is not None:
+        rate, ts = direct
+    else:
+        q_from = _history_quote(index, code_from, base, at_ts)
+        q_to = _history_quote(index, code_to, base, at_ts)
+        if q_from is None or q_to is None or q_to[0] == 0:
+            raise ValueError(
+                f"Нет истории курса {code_from}→{code_to} на момент {at}"
+            )
+        rate = q_from[0] / q_to[0]
+        ts = min(q_from[1], q_to[1])
+
+    return {
+        "rate": rate,
+        "reverse_rate": 1.0 / rate if rate else 0.0,
+        "timestamp": datetime.fromtimestamp(ts, timezone.utc).isoformat(),
+    }
+
+
+def get_rate_range(
+    code_from: str,
+    code_to: str,
+    start,
+    end,
+) -> List[Tuple[str, float]]:
+    """Точки истории хранимой пары code_from_code_to в интервале [start, end]"""
+    code_from = get_currency(code_from).code
+    code_to = get_currency(code_to).code
+
+    points = get_history_index().range(
+        f"{code_from}_{code_to}", _to_epoch(start), _to_epoch(end)
+    )
+    return [
+        (datetime.fromtimestamp(ts, timezone.utc).isoformat(), rate)
+        for ts, rate in points
+    ]
+
+
+def get_rate_history(
+    pair: str,
+    interval: str = "1h",
+    since=None,
+    until=None,
+    limit: Optional[int] = None,
+) -> List[Dict]:
+    """
+    OHLC-агрегаты пары (например BTC_USD) по интервалу 1m/1h/1d.
+    """
+    pair = pair.strip().upper()
+    if "_" not in pair:
+        raise ValueError("Пара задаётся как FROM_TO, например BTC_USD")
+
+    storage = RatesStorage(ParserConfig())
+    return storage.rollups.query(
+        pair,
+        interval,
+        since=_to_epoch(since) if since is not None else None,
+        until=_to_epoch(until) if until is not None else None,
+        limit=limit,
+    )
+
+
 # ПОКУПКА ВАЛЮТЫ
 @log_action("BUY", verbose=True)
-def buy(user: User, currency_code: str, amount: float) -> Dict:
+def buy(
+    user: User,
+    currency_code: str,
+    amount: float,
+    session: Optional[UnitOfWork] = None,
+) -> Dict:
     amount = _validate_amount(amount)
 
     currency = get_currency(currency_code)
 
-    portfolio = get_portfolio_by_user_id(user.user_id)
-    wallet = portfolio.get_wallet(currency.code)
-
-    if wallet is None:
-        wallet = portfolio.add_currency(currency.code)
-
-    before = wallet.balance
-    wallet.deposit(amount)
-    after = wallet.balance
-
-    estimate_usd = None
+    uow = session or UnitOfWork()
     try:
-        rate_info = get_rate(currency.code, "USD")
-        estimate_usd = amount * rate_info["rate"]
+        portfolio = uow.get_portfolio(user.user_id)
+        wallet = portfolio.get_wallet(currency.code)
+
+        if wallet is None:
+            wallet = portfolio.add_currency(currency.code)
+
+        before = wallet.balance
+        wallet.deposit(amount)
+        after = wallet.balance
+
+        estimate_usd = None
+        estimate_stale = False
+        estimate_refreshing = False
+        try:
+            rate_info = get_rate(currency.code, "USD")
+            estimate_usd = amount * rate_info["rate"]
+            estimate_stale = rate_info["stale"]
+            estimate_refreshing = rate_info["refreshing"]
+        except Exception:
+            pass
+
+        uow.mark_dirty(portfolio)
+        uow.commit()
     except Exception:
-        pass
+        uow.rollback()
+        raise
 
-    update_portfolio(portfolio)
+    _record_trade(user, "BUY", currency.code, amount, after)
 
     return {
         "currency": currency.code,
@@ -185,36 +435,55 @@ def buy(user: User, currency_code: str, amount: float) -> Dict:
         "after": after,
         "amount": amount,
         "estimated_value_usd": estimate_usd,
+        "estimate_stale": estimate_stale,
+        "estimate_refreshing": estimate_refreshing,
     }
 
 # ПРОДАЖА ВАЛЮТЫ
 @log_action("SELL", verbose=True)
-def sell(user: User, currency_code: str, amount: float) -> Dict:
+def sell(
+    user: User,
+    currency_code: str,
+    amount: float,
+    session: Optional[UnitOfWork] = None,
+) -> Dict:
     amount = _validate_amount(amount)
 
     currency = get_currency(currency_code)
 
-    portfolio = get_portfolio_by_user_id(user.user_id)
-    wallet = portfolio.get_wallet(currency.code)
-
-    if wallet is None:
-        raise CurrencyNotFoundError(currency.code)
-
-    if wallet.balance < amount:
-        raise InsufficientFundsError(wallet.balance, amount, currency.code)
-
-    before = wallet.balance
-    wallet.withdraw(amount)
-    after = wallet.balance
-
-    est_usd = None
+    uow = session or UnitOfWork()
     try:
-        rate_info = get_rate(currency.code, "USD")
-        est_usd = amount * rate_info["rate"]
+        portfolio = uow.get_portfolio(user.user_id)
+        wallet = portfolio.get_wallet(currency.code)
+
+        if wallet is None:
+            raise CurrencyNotFoundError(currency.code)
+
+        if wallet.balance < amount:
+            raise InsufficientFundsError(wallet.balance, amount, currency.code)
+
+        before = wallet.balance
+        wallet.withdraw(amount)
+        after = wallet.balance
+
+        est_usd = None
+        estimate_stale = False
+        estimate_refreshing = False
+        try:
+            rate_info = get_rate(currency.code, "USD")
+            est_usd = amount * rate_info["rate"]
+            estimate_stale = rate_info["stale"]
+            estimate_refreshing = rate_info["refreshing"]
+        except Exception:
+            pass
+
+        uow.mark_dirty(portfolio)
+        uow.commit()
     except Exception:
-        pass
+        uow.rollback()
+        raise
 
-    update_portfolio(portfolio)
+    _record_trade(user, "SELL", currency.code, amount, after)
 
     return {
         "currency": currency.code,
@@ -222,11 +491,17 @@ def sell(user: User, currency_code: str, amount: float) -> Dict:
         "after": after,
         "amount": amount,
         "estimated_income_usd": est_usd,
+        "estimate_stale": estimate_stale,
+        "estimate_refreshing": estimate_refreshing,
     }
 
 
 # ПОКАЗ ПОРТФЕЛЯ
-def show_portfolio(user: User, base_currency: str = None) -> Dict:
+def show_portfolio(
+    user: User,
+    base_currency: str = None,
+    session: Optional[UnitOfWork] = None,
+) -> Dict:
     if user is None:
         raise ValueError("Сначала выполните login")
 
@@ -236,7 +511,9 @@ def show_portfolio(user: User, base_currency: str = None) -> Dict:
 
     get_currency(base_currency)
 
-    portfolio = get_portfolio_by_user_id(user.user_id)
+    uow = session or UnitOfWork()
+    portfolio = uow.get_portfolio(user.user_id)
+    uow.commit()
     wallets = portfolio.wallets
 
     result = {
@@ -246,22 +523,20 @@ def show_portfolio(user: User, base_currency: str = None) -> Dict:
         "total": 0.0,
     }
 
+    rates = get_rates_to(base_currency, [w.currency_code for w in wallets.values()])
+
     for w in wallets.values():
         code = w.currency_code
 
-        if code == base_currency:
-            converted = w.balance
-        else:
-            try:
-                rate_info = get_rate(code, base_currency)
-                converted = w.balance * rate_info["rate"]
-            except Exception:
-                converted = None
+        rate_info = rates[f"{code}_{base_currency}"]
+        converted = w.balance * rate_info["rate"] if rate_info else None
 
         result["wallets"].append({
             "currency_code": code,
             "balance": w.balance,
             "converted": converted,
+            "stale": bool(rate_info and rate_info["stale"]),
+            "age_seconds": rate_info["age_seconds"] if rate_info else None,
         })
 
         if converted is not None:
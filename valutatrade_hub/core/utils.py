@@ -1,9 +1,10 @@
 import json
 import os
-from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
 
-from .models import Portfolio, User, Wallet
+from valutatrade_hub.infra.repository import get_backend
+
+from .models import Portfolio, User
 
 DATA_DIR = os.path.join(
     os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data"
@@ -29,37 +30,25 @@ def _save_json(path: str, data):
 
 
 # ======================= ПОЛЬЗОВАТЕЛИ ========================
+# Пользователи и портфели хранятся в хранилище, выбранном через
+# STORAGE_BACKEND (json по умолчанию, sqlite), см. infra/repository.py
 
 def load_users() -> List[User]:
-    data = _load_json(USERS_FILE, default=[])
-    users: List[User] = []
-
-    for item in data:
-        users.append(
-            User(
-                user_id=item["user_id"],
-                username=item["username"],
-                hashed_password=item["hashed_password"],
-                salt=item["salt"],
-                registration_date=datetime.fromisoformat(item["registration_date"]),
-            )
-        )
-    return users
+    return get_backend().load_users()
 
 
 def save_users(users: List[User]) -> None:
-    data = []
-    for u in users:
-        data.append(
-            {
-                "user_id": u.user_id,
-                "username": u.username,
-                "hashed_password": u.hashed_password,
-                "salt": u.salt,
-                "registration_date": u.registration_date.isoformat(),
-            }
-        )
-    _save_json(USERS_FILE, data)
+    get_backend().save_users(users)
+
+
+def add_user(user: User) -> None:
+    """Добавляет одного пользователя без перезаписи остальных"""
+    get_backend().add_user(user)
+
+
+def next_user_id() -> int:
+    """Следующий свободный user_id"""
+    return get_backend().next_user_id()
 
 
 def generate_user_id(users: List[User]) -> int:
@@ -69,11 +58,7 @@ def generate_user_id(users: List[User]) -> int:
 
 
 def find_user_by_username(username: str) -> Optional[User]:
-    users = load_users()
-    for u in users:
-        if u.username == username:
-            return u
-    return None
+    return get_backend().find_user_by_username(username)
 
 
 # =============== ПОРТФЕЛИ =================
@@ -82,62 +67,30 @@ def load_portfolios() -> Dict[int, Portfolio]:
     """
     Возвращает портфолио
     """
-    data = _load_json(PORTFOLIOS_FILE, default={})
-    portfolios: Dict[int, Portfolio] = {}
+    return get_backend().load_portfolios()
 
-    for item in data:
-        user_id = item["user_id"]
-        wallets_raw = item.get("wallets", {})
 
-        wallets: Dict[str, Wallet] = {}
-        for code, w in wallets_raw.items():
-            wallets[code] = Wallet(
-                currency_code=w["currency_code"],
-                balance=w["balance"],
-            )
-
-        portfolios[user_id] = Portfolio(
-            user_id=user_id,
-            wallets=wallets,
-        )
-
-    return portfolios
+def iter_portfolios() -> Iterator[Portfolio]:
+    """Ленивый перебор портфелей без загрузки всех сразу"""
+    return get_backend().iter_portfolios()
 
 
 def save_portfolios(portfolios: Dict[int, Portfolio]) -> None:
-    data = []
-
-    for user_id, portfolio in portfolios.items():
-        wallet_dict = {}
-        for code, w in portfolio.wallets.items():
-            wallet_dict[code] = {
-                "currency_code": w.currency_code,
-                "balance": w.balance,
-            }
-
-        data.append(
-            {
-                "user_id": user_id,
-                "wallets": wallet_dict,
-            }
-        )
-
-    _save_json(PORTFOLIOS_FILE, data)
+    get_backend().save_portfolios(portfolios)
 
 
 def get_portfolio_by_user_id(user_id: int) -> Portfolio:
-    portfolios = load_portfolios()
-    if user_id not in portfolios:
-        portfolios[user_id] = Portfolio(user_id=user_id, wallets={})
-        save_portfolios(portfolios)
-    return portfolios[user_id]
+    backend = get_backend()
+    portfolio = backend.get_portfolio(user_id)
+    if portfolio is None:
+        portfolio = Portfolio(user_id=user_id, wallets={})
+        backend.save_portfolio(portfolio)
+    return portfolio
 
 
 def update_portfolio(portfolio: Portfolio) -> None:
     """Сохраняет изменения портфеля"""
-    portfolios = load_portfolios()
-    portfolios[portfolio.user_id] = portfolio
-    save_portfolios(portfolios)
+    get_backend().save_portfolio(portfolio)
 
 
 # ===================== КУРСЫ =====================
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Iterator, Optional
+
+from .settings import SettingsLoader
+
+
+class TradeLedger:
+    """
+    Журнал сделок: append-only JSONL, одна строка на BUY/SELL.
+
+        {"timestamp": "...Z", "user_id": 1, "action": "BUY",
+         "currency": "BTC", "amount": 0.5, "balance": 1.5}
+
+    amount — всегда положительный, направление задаёт action;
+    balance — остаток кошелька после сделки.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    def record(
+        self,
+        user_id: int,
+        action: str,
+        currency: str,
+        amount: float,
+        balance: float,
+        timestamp: Optional[datetime] = None,
+    ) -> Dict:
+        moment = timestamp or datetime.now(timezone.utc)
+        entry = {
+            "timestamp": moment.isoformat().replace("+00:00", "Z"),
+            "user_id": user_id,
+            "action": action,
+            "currency": currency,
+            "amount": amount,
+            "balance": balance,
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+        return entry
+
+    def iter_entries(self, user_id: Optional[int] = None) -> Iterator[Dict]:
+        """Записи журнала по порядку (только user_id, если задан)"""
+        try:
+            f = open(self.path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                if not line.endswith("\n"):
+                    # недописанная запись после сбоя
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if user_id is None or entry.get("user_id") == user_id:
+                    yield entry
+
+
+_LEDGER: Optional[TradeLedger] = None
+
+
+def get_ledger() -> TradeLedger:
+    """Журнал сделок из настроек (общий на процесс)"""
+    global _LEDGER
+    if _LEDGER is None:
+        _LEDGER = TradeLedger(SettingsLoader().get("LEDGER_FILE"))
+    return _LEDGER
+
+
+def set_ledger(ledger: TradeLedger) -> None:
+    """Подменяет журнал сделок (бенчмарки, временные каталоги)"""
+    global _LEDGER
+    _LEDGER = ledger
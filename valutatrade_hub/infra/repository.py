@@ -0,0 +1,978 @@
+from __future__ import annotations
+
+import fcntl
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from valutatrade_hub.core.models import Portfolio, User, Wallet
+
+from .settings import SettingsLoader
+
+# ============ ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ РАБОТЫ С JSON =============
+
+# Счётчики файловых операций (используются бенчмарками)
+IO_STATS: Dict[str, int] = {"reads": 0, "writes": 0}
+
+
+def _load_json(path: str, default):
+    IO_STATS["reads"] += 1
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def _save_json(path: str, data) -> None:
+    IO_STATS["writes"] += 1
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+
+
+def _file_signature(path: str) -> Optional[tuple]:
+    """(mtime_ns, size) файла или None, если файла нет"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+# ============ СЕРИАЛИЗАЦИЯ =============
+
+def user_to_dict(user: User) -> dict:
+    return {
+        "user_id": user.user_id,
+        "username": user.username,
+        "hashed_password": user.hashed_password,
+        "salt": user.salt,
+        "registration_date": user.registration_date.isoformat(),
+    }
+
+
+def user_from_dict(item: dict) -> User:
+    return User(
+        user_id=item["user_id"],
+        username=item["username"],
+        hashed_password=item["hashed_password"],
+        salt=item["salt"],
+        registration_date=datetime.fromisoformat(item["registration_date"]),
+    )
+
+
+def portfolio_to_dict(portfolio: Portfolio) -> dict:
+    wallet_dict = {}
+    for code, w in portfolio.wallets.items():
+        wallet_dict[code] = {
+            "currency_code": w.currency_code,
+            "balance": w.balance,
+        }
+    return {
+        "user_id": portfolio.user_id,
+        "wallets": wallet_dict,
+    }
+
+
+def portfolio_from_dict(item: dict) -> Portfolio:
+    wallets: Dict[str, Wallet] = {}
+    for code, w in item.get("wallets", {}).items():
+        wallets[code] = Wallet(
+            currency_code=w["currency_code"],
+            balance=w["balance"],
+        )
+    return Portfolio(user_id=item["user_id"], wallets=wallets)
+
+
+# ============ БАЗОВЫЙ РЕПОЗИТОРИЙ =============
+
+class StorageBackend(ABC):
+    """
+    Хранилище пользователей и портфелей.
+    Массовые методы (load_*/save_*) нужны для совместимости и миграций,
+    точечные (find/add/get/save_portfolio) — для горячего пути use cases.
+    """
+
+    name: str = ""
+
+    # Умеет ли хранилище сохранить один портфель, не перезаписывая остальные
+    partial_writes: bool = True
+
+    # ---------- Пользователи ----------
+    @abstractmethod
+    def load_users(self) -> List[User]:
+        ...
+
+    @abstractmethod
+    def save_users(self, users: List[User]) -> None:
+        ...
+
+    @abstractmethod
+    def find_user_by_username(self, username: str) -> Optional[User]:
+        ...
+
+    @abstractmethod
+    def add_user(self, user: User) -> None:
+        ...
+
+    @abstractmethod
+    def next_user_id(self) -> int:
+        ...
+
+    # ---------- Портфели ----------
+    @abstractmethod
+    def load_portfolios(self) -> Dict[int, Portfolio]:
+        ...
+
+    @abstractmethod
+    def save_portfolios(self, portfolios: Dict[int, Portfolio]) -> None:
+        ...
+
+    @abstractmethod
+    def get_portfolio(self, user_id: int) -> Optional[Portfolio]:
+        ...
+
+    def iter_portfolios(self) -> Iterator[Portfolio]:
+        """Перебирает портфели (хранилища могут делать это лениво)"""
+        yield from self.load_portfolios().values()
+
+    @abstractmethod
+    def save_portfolio(self, portfolio: Portfolio) -> None:
+        ...
+
+    def save_portfolio_batch(self, portfolios: List[Portfolio]) -> None:
+        """Сохраняет несколько портфелей за одну операцию"""
+        for portfolio in portfolios:
+            self.save_portfolio(portfolio)
+
+    def portfolios_version(self) -> Optional[tuple]:
+        """
+        Метка версии сохранённых портфелей, если хранилище её поддерживает.
+        Позволяет сессии понять, что данные изменились извне.
+        """
+        return None
+
+    def close(self) -> None:
+        """Освобождает ресурсы хранилища"""
+        pass
+
+
+# ============ ИНДЕКС ПОЛЬЗОВАТЕЛЕЙ =============
+
+class UserIndex:
+    """
+    Процессный индекс users.json: username -> сырая запись.
+    Файл перечитывается только при изменении mtime/size, объекты User
+    создаются лениво при обращении к конкретной записи.
+    Счётчик следующего user_id хранится отдельно в seq_file.
+    """
+
+    def __init__(self, users_file: str, seq_file: str) -> None:
+        self.users_file = users_file
+        self.seq_file = seq_file
+
+        self._lock = threading.RLock()
+        self._signature: Optional[tuple] = None
+        self._loaded = False
+        self._records: List[dict] = []
+        self._by_username: Dict[str, dict] = {}
+        self._next_id = 1
+
+    def _load_seq(self) -> int:
+        data = _load_json(self.seq_file, default={})
+        return int(data.get("next_user_id", 1)) if isinstance(data, dict) else 1
+
+    def _rebuild(self, records: List[dict]) -> None:
+        self._records = records
+        self._by_username = {r["username"]: r for r in records}
+        max_id = max((r["user_id"] for r in records), default=0)
+        self._next_id = max(max_id + 1, self._next_id)
+
+    def _refresh(self) -> None:
+        signature = _file_signature(self.users_file)
+        if self._loaded and signature == self._signature:
+            return
+
+        self._next_id = self._load_seq()
+        self._rebuild(list(_load_json(self.users_file, default=[])))
+        self._signature = signature
+        self._loaded = True
+
+    def _flush(self) -> None:
+        _save_json(self.users_file, self._records)
+        _save_json(self.seq_file, {"next_user_id": self._next_id})
+        self._signature = _file_signature(self.users_file)
+
+    def records(self) -> List[dict]:
+        with self._lock:
+            self._refresh()
+            return list(self._records)
+
+    def get(self, username: str) -> Optional[dict]:
+        with self._lock:
+            self._refresh()
+            return self._by_username.get(username)
+
+    def next_id(self) -> int:
+        with self._lock:
+            self._refresh()
+            return self._next_id
+
+    def add(self, record: dict) -> None:
+        with self._lock:
+            self._refresh()
+            if record["username"] in self._by_username:
+                raise ValueError(
+                    f"Имя пользователя '{record['username']}' уже занято"
+                )
+            self._records.append(record)
+            self._by_username[record["username"]] = record
+            self._next_id = max(self._next_id, record["user_id"] + 1)
+            self._flush()
+
+    def replace(self, records: List[dict]) -> None:
+        with self._lock:
+            self._rebuild(list(records))
+            self._loaded = True
+            self._flush()
+
+
+# ============ JSON =============
+
+class JsonStorageBackend(StorageBackend):
+    """
+    Исходный формат: users.json и portfolios.json целиком.
+    Пользователи обслуживаются через UserIndex, портфели
+    читаются/перезаписываются целиком.
+    """
+
+    name = "json"
+    partial_writes = False
+
+    def __init__(
+        self, users_file: str, portfolios_file: str, user_seq_file: str
+    ) -> None:
+        self.users_file = users_file
+        self.portfolios_file = portfolios_file
+        self.user_index = UserIndex(users_file, user_seq_file)
+
+    # ---------- Пользователи ----------
+    def load_users(self) -> List[User]:
+        return [user_from_dict(item) for item in self.user_index.records()]
+
+    def save_users(self, users: List[User]) -> None:
+        self.user_index.replace([user_to_dict(u) for u in users])
+
+    def find_user_by_username(self, username: str) -> Optional[User]:
+        record = self.user_index.get(username)
+        return user_from_dict(record) if record is not None else None
+
+    def add_user(self, user: User) -> None:
+        self.user_index.add(user_to_dict(user))
+
+    def next_user_id(self) -> int:
+        return self.user_index.next_id()
+
+    # ---------- Портфели ----------
+    def load_portfolios(self) -> Dict[int, Portfolio]:
+        data = _load_json(self.portfolios_file, default=[])
+        portfolios: Dict[int, Portfolio] = {}
+        for item in data:
+            portfolio = portfolio_from_dict(item)
+            portfolios[portfolio.user_id] = portfolio
+        return portfolios
+
+    def save_portfolios(self, portfolios: Dict[int, Portfolio]) -> None:
+        data = [portfolio_to_dict(p) for p in portfolios.values()]
+        _save_json(self.portfolios_file, data)
+
+    def get_portfolio(self, user_id: int) -> Optional[Portfolio]:
+        return self.load_portfolios().get(user_id)
+
+    def save_portfolio(self, portfolio: Portfolio) -> None:
+        self.save_portfolio_batch([portfolio])
+
+    def save_portfolio_batch(self, portfolios: List[Portfolio]) -> None:
+        current = self.load_portfolios()
+        for portfolio in portfolios:
+            current[portfolio.user_id] = portfolio
+        self.save_portfolios(current)
+
+    def portfolios_version(self) -> Optional[tuple]:
+        return _file_signature(self.portfolios_file)
+
+
+# ============ JSON + ЖУРНАЛ =============
+
+class JournaledJsonStorageBackend(JsonStorageBackend):
+    """
+    JSON-хранилище с журналом изменений портфелей.
+
+    portfolios.json — снимок. Каждое изменение баланса дописывается
+    в журнал (JSONL, fsync) записью с абсолютным значением баланса,
+    поэтому повторное применение записи безопасно. При загрузке журнал
+    накатывается на снимок. Когда журнал превышает порог, он
+    переименовывается в уникальный *.<время>.<pid>.old, сворачивается
+    в новый снимок и удаляется (в фоне).
+
+    Экземпляры в разных процессах согласуются через flock на *.lock:
+    чтение — общая блокировка, дозапись и сжатие — исключительная.
+    """
+
+    name = "journal"
+    partial_writes = True
+
+    def __init__(
+        self,
+        users_file: str,
+        portfolios_file: str,
+        user_seq_file: str,
+        journal_file: str,
+        journal_max_bytes: int = 1_000_000,
+    ) -> None:
+        super().__init__(users_file, portfolios_file, user_seq_file)
+        self.journal_file = journal_file
+        self.lock_file = journal_file + ".lock"
+        self.journal_max_bytes = journal_max_bytes
+
+        self._lock = threading.RLock()
+        self._state: Dict[int, Dict[str, float]] = {}
+        self._loaded = False
+        self._snapshot_sig: Optional[tuple] = None
+        self._journal_ino: Optional[int] = None
+        self._journal_offset = 0
+        self._compactor: Optional[threading.Thread] = None
+
+    # ---------- Журнал ----------
+    @contextmanager
+    def _file_lock(self, exclusive: bool) -> Iterator[None]:
+        """Межпроцессная блокировка журнала (снимается закрытием файла)"""
+        fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+        finally:
+            os.close(fd)
+
+    def _rotated_journals(self) -> List[str]:
+        """Ротированные, но ещё не свёрнутые журналы — от старых к новым"""
+        return sorted(glob.glob(glob.escape(self.journal_file) + ".*.old"))
+
+    @staticmethod
+    def _apply(state: Dict[int, Dict[str, float]], entry: dict) -> None:
+        balances = state.setdefault(entry["user_id"], {})
+        code = entry.get("currency_code")
+        if code is not None:
+            balances[code] = float(entry["balance"])
+
+    def _replay(self, path: str, state: Dict[int, Dict[str, float]],
+                offset: int = 0) -> int:
+        """Накатывает записи журнала с позиции offset, возвращает новую позицию"""
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return offset
+
+        with f:
+            f.seek(offset)
+            IO_STATS["reads"] += 1
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # недописанная запись после сбоя
+                    break
+                offset += len(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                self._apply(state, entry)
+        return offset
+
+    def _append(self, entries: List[dict]) -> None:
+        data = "".join(
+            json.dumps(e, ensure_ascii=False) + "\n" for e in entries
+        ).encode("utf-8")
+
+        IO_STATS["writes"] += 1
+        with open(self.journal_file, "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            st = os.fstat(f.fileno())
+
+        self._journal_ino = st.st_ino
+        self._journal_offset = st.st_size
+
+    # ---------- Состояние ----------
+    def _load_snapshot(self) -> Dict[int, Dict[str, float]]:
+        return {
+            item["user_id"]: {
+                code: float(w["balance"])
+                for code, w in item.get("wallets", {}).items()
+            }
+            for item in _load_json(self.portfolios_file, default=[])
+        }
+
+    def _reload(self) -> None:
+        state = self._load_snapshot()
+        for path in self._rotated_journals():
+            self._replay(path, state)
+        offset = self._replay(self.journal_file, state)
+
+        try:
+            st = os.stat(self.journal_file)
+        except FileNotFoundError:
+            st = None
+
+        if st is not None and st.st_size > offset:
+            # Отрезаем недописанный хвост, чтобы новые записи не склеились с ним
+            os.truncate(self.journal_file, offset)
+
+        self._state = state
+        self._snapshot_sig = _file_signature(self.portfolios_file)
+        self._journal_ino = st.st_ino if st is not None else None
+        self._journal_offset = offset
+        self._loaded = True
+
+    def _refresh(self) -> None:
+        """
+        Подтягивает изменения, сделанные другими процессами.
+        Вызывается под _file_lock.
+        """
+        if not self._loaded:
+            self._reload()
+            return
+
+        if _file_signature(self.portfolios_file) != self._snapshot_sig:
+            self._reload()
+            return
+
+        try:
+            st = os.stat(self.journal_file)
+        except FileNotFoundError:
+            st = None
+
+        ino = st.st_ino if st is not None else None
+        if ino != self._journal_ino:
+            # журнал ротирован другим процессом — читаем новый с начала
+            self._journal_ino = ino
+            self._journal_offset = 0
+
+        if st is not None and st.st_size > self._journal_offset:
+            self._journal_offset = self._replay(
+                self.journal_file, self._state, self._journal_offset
+            )
+
+    def _to_portfolio(self, user_id: int) -> Portfolio:
+        wallets = {
+            code: Wallet(code, balance)
+            for code, balance in self._state[user_id].items()
+        }
+        return Portfolio(user_id=user_id, wallets=wallets)
+
+    # ---------- Сжатие ----------
+    def _write_snapshot(self, state: Dict[int, Dict[str, float]]) -> None:
+        data = [
+            {
+                "user_id": user_id,
+                "wallets": {
+                    code: {"currency_code": code, "balance": balance}
+                    for code, balance in balances.items()
+                },
+            }
+            for user_id, balances in state.items()
+        ]
+
+        tmp_path = self.portfolios_file + ".tmp"
+        IO_STATS["writes"] += 1
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.portfolios_file)
+
+    def _compact(self) -> None:
+        """
+        Под исключительной блокировкой перечитывает снимок и все журналы,
+        ротирует текущий журнал, пишет новый снимок и удаляет свёрнутые
+        журналы. Состояние экземпляра не трогает: новый снимок будет
+        перечитан при следующем обращении.
+        """
+        with self._file_lock(exclusive=True):
+            state = self._load_snapshot()
+            rotated = self._rotated_journals()
+            for path in rotated:
+                self._replay(path, state)
+
+            if os.path.exists(self.journal_file):
+                path = f"{self.journal_file}.{time.time_ns()}.{os.getpid()}.old"
+                os.replace(self.journal_file, path)
+                self._replay(path, state)
+                rotated.append(path)
+
+            self._write_snapshot(state)
+            for path in rotated:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def compact(self, background: bool = True) -> None:
+        """Сворачивает журнал в новый снимок portfolios.json"""
+        with self._lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                return
+
+            if not background:
+                self._compact()
+                return
+
+            self._compactor = threading.Thread(target=self._compact, daemon=True)
+            self._compactor.start()
+
+    def wait_compaction(self) -> None:
+        """Дожидается завершения фонового сжатия"""
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+
+    # ---------- Портфели ----------
+    def load_portfolios(self) -> Dict[int, Portfolio]:
+        with self._lock, self._file_lock(exclusive=False):
+            self._refresh()
+            return {uid: self._to_portfolio(uid) for uid in self._state}
+
+    def save_portfolios(self, portfolios: Dict[int, Portfolio]) -> None:
+        self.wait_compaction()
+        with self._lock, self._file_lock(exclusive=True):
+            state = {
+                p.user_id: {c: w.balance for c, w in p.wallets.items()}
+                for p in portfolios.values()
+            }
+            self._write_snapshot(state)
+            for path in [self.journal_file, *self._rotated_journals()]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+            self._state = state
+            self._snapshot_sig = _file_signature(self.portfolios_file)
+            self._journal_ino = None
+            self._journal_offset = 0
+            self._loaded = True
+
+    def get_portfolio(self, user_id: int) -> Optional[Portfolio]:
+        with self._lock, self._file_lock(exclusive=False):
+            self._refresh()
+            if user_id not in self._state:
+                return None
+            return self._to_portfolio(user_id)
+
+    def save_portfolio_batch(self, portfolios: List[Portfolio]) -> None:
+        with self._lock:
+            with self._file_lock(exclusive=True):
+                self._refresh()
+                entries = self._diff_entries(portfolios)
+                if not entries:
+                    return
+
+                self._append(entries)
+                for entry in entries:
+                    self._apply(self._state, entry)
+
+            if self._journal_offset >= self.journal_max_bytes:
+                self.compact(background=True)
+
+    def _diff_entries(self, portfolios: List[Portfolio]) -> List[dict]:
+        """Записи журнала для балансов, отличающихся от текущего состояния"""
+        entries: List[dict] = []
+        for portfolio in portfolios:
+            current = self._state.get(portfolio.user_id)
+            if current is None:
+                entries.append({"user_id": portfolio.user_id})
+                current = {}
+
+            for code, w in portfolio.wallets.items():
+                if current.get(code) != w.balance:
+                    entries.append({
+                        "user_id": portfolio.user_id,
+                        "currency_code": code,
+                        "balance": w.balance,
+                    })
+        return entries
+
+    def portfolios_version(self) -> Optional[tuple]:
+        return None
+
+    def close(self) -> None:
+        self.wait_compaction()
+
+
+# ============ JSON ПО ШАРДАМ =============
+
+class ShardedJsonStorageBackend(JsonStorageBackend):
+    """
+    Портфели лежат в отдельных файлах data/portfolios/<shard>/<user_id>.json,
+    шард выбирается по хешу user_id. Параметры раскладки хранятся в
+    manifest.json. Чтение и запись портфеля затрагивают один файл,
+    записи в разные шарды не блокируют друг друга.
+    """
+
+    name = "sharded"
+    partial_writes = True
+
+    MANIFEST_VERSION = 1
+
+    def __init__(
+        self,
+        users_file: str,
+        portfolios_dir: str,
+        user_seq_file: str,
+        shard_count: int = 64,
+    ) -> None:
+        super().__init__(users_file, "", user_seq_file)
+        self.portfolios_dir = portfolios_dir
+        self.manifest_file = os.path.join(portfolios_dir, "manifest.json")
+        self.shard_count = self._load_manifest(shard_count)
+        self._shard_locks = [threading.Lock() for _ in range(self.shard_count)]
+
+    def _load_manifest(self, shard_count: int) -> int:
+        """Читает manifest.json; число шардов фиксируется при создании"""
+        manifest = _load_json(self.manifest_file, default=None)
+        if isinstance(manifest, dict) and manifest.get("shard_count"):
+            return int(manifest["shard_count"])
+
+        os.makedirs(self.portfolios_dir, exist_ok=True)
+        _save_json(
+            self.manifest_file,
+            {
+                "version": self.MANIFEST_VERSION,
+                "shard_count": shard_count,
+                "layout": "<shard>/<user_id>.json",
+            },
+        )
+        return shard_count
+
+    def _shard_of(self, user_id: int) -> int:
+        return zlib.crc32(str(user_id).encode("ascii")) % self.shard_count
+
+    def _shard_dir(self, shard: int) -> str:
+        return os.path.join(self.portfolios_dir, f"{shard:02x}")
+
+    def _portfolio_path(self, user_id: int) -> str:
+        shard_dir = self._shard_dir(self._shard_of(user_id))
+        return os.path.join(shard_dir, f"{user_id}.json")
+
+    def _write_one(self, portfolio: Portfolio) -> None:
+        path = self._portfolio_path(portfolio.user_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        _save_json(tmp_path, portfolio_to_dict(portfolio))
+        os.replace(tmp_path, path)
+
+    # ---------- Портфели ----------
+    def iter_portfolios(self) -> Iterator[Portfolio]:
+        for shard in range(self.shard_count):
+            try:
+                names = os.listdir(self._shard_dir(shard))
+            except FileNotFoundError:
+                continue
+
+            for name in sorted(names):
+                if not name.endswith(".json"):
+                    continue
+                item = _load_json(os.path.join(self._shard_dir(shard), name), None)
+                if item is not None:
+                    yield portfolio_from_dict(item)
+
+    def load_portfolios(self) -> Dict[int, Portfolio]:
+        return {p.user_id: p for p in self.iter_portfolios()}
+
+    def save_portfolios(self, portfolios: Dict[int, Portfolio]) -> None:
+        for portfolio in self.iter_portfolios():
+            if portfolio.user_id not in portfolios:
+                os.remove(self._portfolio_path(portfolio.user_id))
+
+        self.save_portfolio_batch(list(portfolios.values()))
+
+    def get_portfolio(self, user_id: int) -> Optional[Portfolio]:
+        item = _load_json(self._portfolio_path(user_id), default=None)
+        return portfolio_from_dict(item) if item is not None else None
+
+    def save_portfolio(self, portfolio: Portfolio) -> None:
+        with self._shard_locks[self._shard_of(portfolio.user_id)]:
+            self._write_one(portfolio)
+
+    def save_portfolio_batch(self, portfolios: List[Portfolio]) -> None:
+        for portfolio in portfolios:
+            self.save_portfolio(portfolio)
+
+    def portfolios_version(self) -> Optional[tuple]:
+        return None
+
+
+# ============ SQLITE =============
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL,
+    hashed_password TEXT NOT NULL,
+    salt TEXT NOT NULL,
+    registration_date TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username ON users(username);
+
+CREATE TABLE IF NOT EXISTS portfolios (
+    user_id INTEGER PRIMARY KEY
+);
+
+CREATE TABLE IF NOT EXISTS wallets (
+    user_id INTEGER NOT NULL,
+    currency_code TEXT NOT NULL,
+    balance REAL NOT NULL,
+    PRIMARY KEY (user_id, currency_code)
+);
+CREATE INDEX IF NOT EXISTS idx_wallets_user_id ON wallets(user_id);
+"""
+
+
+class SqliteStorageBackend(StorageBackend):
+    """
+    Хранилище в SQLite (WAL). Точечные операции работают по индексам
+    user_id/username и не зависят от общего числа пользователей.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, db_file: str) -> None:
+        self.db_file = db_file
+        os.makedirs(os.path.dirname(db_file) or ".", exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SQLITE_SCHEMA)
+        self._conn.commit()
+
+    @staticmethod
+    def _row_to_user(row) -> User:
+        return User(
+            user_id=row[0],
+            username=row[1],
+            hashed_password=row[2],
+            salt=row[3],
+            registration_date=datetime.fromisoformat(row[4]),
+        )
+
+    @staticmethod
+    def _user_row(user: User) -> tuple:
+        return (
+            user.user_id,
+            user.username,
+            user.hashed_password,
+            user.salt,
+            user.registration_date.isoformat(),
+        )
+
+    # ---------- Пользователи ----------
+    def load_users(self) -> List[User]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id, username, hashed_password, salt, registration_date "
+                "FROM users ORDER BY user_id"
+            ).fetchall()
+        return [self._row_to_user(r) for r in rows]
+
+    def save_users(self, users: List[User]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM users")
+            self._conn.executemany(
+                "INSERT INTO users VALUES (?, ?, ?, ?, ?)",
+                [self._user_row(u) for u in users],
+            )
+
+    def find_user_by_username(self, username: str) -> Optional[User]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT user_id, username, hashed_password, salt, registration_date "
+                "FROM users WHERE username = ?",
+                (username,),
+            ).fetchone()
+        return self._row_to_user(row) if row else None
+
+    def add_user(self, user: User) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO users VALUES (?, ?, ?, ?, ?)", self._user_row(user)
+            )
+
+    def next_user_id(self) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(user_id) FROM users").fetchone()
+        return (row[0] or 0) + 1
+
+    # ---------- Портфели ----------
+    def _write_portfolio(self, portfolio: Portfolio) -> None:
+        self._conn.execute(
+            "INSERT OR IGNORE INTO portfolios(user_id) VALUES (?)",
+            (portfolio.user_id,),
+        )
+        self._conn.execute(
+            "DELETE FROM wallets WHERE user_id = ?", (portfolio.user_id,)
+        )
+        self._conn.executemany(
+            "INSERT INTO wallets(user_id, currency_code, balance) VALUES (?, ?, ?)",
+            [
+                (portfolio.user_id, w.currency_code, w.balance)
+                for w in portfolio.wallets.values()
+            ],
+        )
+
+    def load_portfolios(self) -> Dict[int, Portfolio]:
+        with self._lock:
+            ids = self._conn.execute(
+                "SELECT user_id FROM portfolios ORDER BY user_id"
+            ).fetchall()
+            rows = self._conn.execute(
+                "SELECT user_id, currency_code, balance FROM wallets"
+            ).fetchall()
+
+        wallets: Dict[int, Dict[str, Wallet]] = {uid: {} for (uid,) in ids}
+        for user_id, code, balance in rows:
+            wallets.setdefault(user_id, {})[code] = Wallet(code, balance)
+
+        return {
+            uid: Portfolio(user_id=uid, wallets=w) for uid, w in wallets.items()
+        }
+
+    def save_portfolios(self, portfolios: Dict[int, Portfolio]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM wallets")
+            self._conn.execute("DELETE FROM portfolios")
+            for portfolio in portfolios.values():
+                self._write_portfolio(portfolio)
+
+    def get_portfolio(self, user_id: int) -> Optional[Portfolio]:
+        with self._lock:
+            exists = self._conn.execute(
+                "SELECT 1 FROM portfolios WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            rows = self._conn.execute(
+                "SELECT currency_code, balance FROM wallets WHERE user_id = ?",
+                (user_id,),
+            ).fetchall()
+
+        if exists is None and not rows:
+            return None
+
+        wallets = {code: Wallet(code, balance) for code, balance in rows}
+        return Portfolio(user_id=user_id, wallets=wallets)
+
+    def save_portfolio(self, portfolio: Portfolio) -> None:
+        with self._lock, self._conn:
+            self._write_portfolio(portfolio)
+
+    def save_portfolio_batch(self, portfolios: List[Portfolio]) -> None:
+        with self._lock, self._conn:
+            for portfolio in portfolios:
+                self._write_portfolio(portfolio)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# ============ ВЫБОР ХРАНИЛИЩА =============
+
+_BACKEND: Optional[StorageBackend] = None
+
+
+def create_backend(kind: str) -> StorageBackend:
+    """Создаёт хранилище указанного типа с путями из SettingsLoader"""
+    settings = SettingsLoader()
+    kind = (kind or "json").lower()
+
+    if kind == "json":
+        return JsonStorageBackend(
+            users_file=settings.get("USERS_FILE"),
+            portfolios_file=settings.get("PORTFOLIOS_FILE"),
+            user_seq_file=settings.get("USER_SEQ_FILE"),
+        )
+    if kind == "journal":
+        return JournaledJsonStorageBackend(
+            users_file=settings.get("USERS_FILE"),
+            portfolios_file=settings.get("PORTFOLIOS_FILE"),
+            user_seq_file=settings.get("USER_SEQ_FILE"),
+            journal_file=settings.get("PORTFOLIO_JOURNAL_FILE"),
+            journal_max_bytes=settings.get("PORTFOLIO_JOURNAL_MAX_BYTES"),
+        )
+    if kind == "sharded":
+        return ShardedJsonStorageBackend(
+            users_file=settings.get("USERS_FILE"),
+            portfolios_dir=settings.get("PORTFOLIOS_DIR"),
+            user_seq_file=settings.get("USER_SEQ_FILE"),
+            shard_count=settings.get("PORTFOLIO_SHARDS"),
+        )
+    if kind == "sqlite":
+        return SqliteStorageBackend(settings.get("SQLITE_FILE"))
+
+    raise ValueError(f"Неизвестный тип хранилища '{kind}'")
+
+
+def get_backend() -> StorageBackend:
+    """
+    Возвращает текущее хранилище (STORAGE_BACKEND в настройках).
+    Экземпляр создаётся один раз на процесс.
+    """
+    global _BACKEND
+    if _BACKEND is None:
+        _BACKEND = create_backend(SettingsLoader().get("STORAGE_BACKEND", "json"))
+    return _BACKEND
+
+
+def set_backend(backend: StorageBackend) -> None:
+    """Подменяет текущее хранилище (бенчмарки, миграции)"""
+    global _BACKEND
+    _BACKEND = backend
+
+
+def reset_backend() -> None:
+    """Сбрасывает выбранное хранилище (например, после смены настроек)"""
+    global _BACKEND
+    if _BACKEND is not None:
+        _BACKEND.close()
+    _BACKEND = None
+
+
+def migrate_storage(source_kind: str, target_kind: str) -> Dict[str, int]:
+    """
+    Переносит пользователей и портфели из одного хранилища в другое.
+    Возвращает количество перенесённых записей.
+    """
+    if source_kind == target_kind:
+        raise ValueError("Источник и приёмник миграции совпадают")
+
+    source = create_backend(source_kind)
+    target = create_backend(target_kind)
+    try:
+        users = source.load_users()
+        portfolios = source.load_portfolios()
+
+        target.save_users(users)
+        target.save_portfolios(portfolios)
+    finally:
+        source.close()
+        target.close()
+
+    return {"users": len(users), "portfolios": len(portfolios)}
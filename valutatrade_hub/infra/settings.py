@@ -38,14 +38,39 @@ class SettingsLoader:
         self._config: Dict[str, Any] = {
             "DATA_DIR": data_dir,
             "USERS_FILE": os.path.join(data_dir, "users.json"),
+            "USER_SEQ_FILE": os.path.join(data_dir, "users_seq.json"),
             "PORTFOLIOS_FILE": os.path.join(data_dir, "portfolios.json"),
             "RATES_FILE": os.path.join(data_dir, "rates.json"),
+            # Валюты, найденные parser_service в режиме UNIVERSE_MODE=full
+            "UNIVERSE_FILE": os.path.join(data_dir, "universe.json"),
+            # Журнал сделок BUY/SELL (для истории стоимости портфеля)
+            "LEDGER_FILE": os.path.join(data_dir, "ledger.jsonl"),
+
+            # Хранилище пользователей и портфелей: json | journal | sharded | sqlite
+            "STORAGE_BACKEND": "json",
+            "SQLITE_FILE": os.path.join(data_dir, "valutatrade.db"),
+            "PORTFOLIO_JOURNAL_FILE": os.path.join(data_dir, "portfolios.journal"),
+            "PORTFOLIO_JOURNAL_MAX_BYTES": 1_000_000,
+            "PORTFOLIOS_DIR": os.path.join(data_dir, "portfolios"),
+            "PORTFOLIO_SHARDS": 64,
 
             "LOG_DIR": log_dir,
             "LOG_FILE": os.path.join(log_dir, "actions.log"),
 
             "RATES_TTL_SECONDS": 300,
 
+            # Stale-while-revalidate: после TTL курс ещё отдаётся с пометкой
+            # "устарел" в течение grace-окна, а источник устаревшей пары
+            # опрашивается в фоне (в пределах квоты и circuit breaker)
+            "RATES_STALE_WHILE_REVALIDATE": False,
+            "RATES_STALE_GRACE_SECONDS": 3600,
+            "RATES_REFRESH_MIN_INTERVAL_SECONDS": 60,
+
+            # Демон курсов (parser_service.daemon): если сокет существует,
+            # снимок курсов берётся у демона, иначе — из rates.json
+            "RATES_DAEMON_SOCKET": os.path.join(data_dir, "rates.sock"),
+            "RATES_DAEMON_TIMEOUT_SECONDS": 0.5,
+
             "DEFAULT_BASE_CURRENCY": "USD",
 
             "LOG_FORMAT": "[{timestamp}] {level} {action} {message}",
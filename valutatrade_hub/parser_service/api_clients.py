@@ -1,16 +1,51 @@
 from __future__ import annotations
 
+import math
+import random
+import threading
 from abc import ABC, abstractmethod
-from typing import Dict, Any
-from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+from time import monotonic, perf_counter, sleep
+from urllib.parse import quote_plus
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from .config import ParserConfig
 from ..core.exceptions import ApiRequestError
 from ..logging_config import LOGGER
 
 
+# Статусы, после которых запрос повторяется
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+_sessions: Dict[int, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(pool_size: int) -> requests.Session:
+    """
+    Долгоживущая сессия с пулом keep-alive соединений (общая на процесс).
+    Клиенты создаются заново на каждое обновление, а соединения
+    с API переиспользуются между ними.
+    """
+    with _sessions_lock:
+        session = _sessions.get(pool_size)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[pool_size] = session
+        return session
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Экспоненциальная задержка с полным джиттером: U(0, min(cap, base*2^n))"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
 class BaseApiClient(ABC):
     """
     Базовый клиент внешнего API
@@ -18,40 +53,188 @@ class BaseApiClient(ABC):
 
     def __init__(self, config: ParserConfig):
         self.config = config
+        self.session = get_session(config.HTTP_POOL_SIZE)
+        # Валидаторы последнего ответа 200: {"key", "etag", "last_modified"},
+        # key — см. _validator_key. Загружаются/сохраняются RatesUpdater
+        # между запусками (в data/sources.json).
+        self.validators: Dict[str, str] = {}
+        # Момент по monotonic(), после которого запросы не повторяются,
+        # а таймаут попытки не выходит за него (выставляет RatesUpdater)
+        self.deadline: Optional[float] = None
+        # Число отправленных HTTP-запросов, включая повторы
+        # (по нему планировщик расходует месячную квоту)
+        self.requests_sent = 0
+        self._requests_lock = threading.Lock()
+
+    def redact(self, text: str) -> str:
+        """Текст (URL, сообщение об ошибке) без секретов источника"""
+        return text
+
+    def _public_url(self, url: str) -> str:
+        """URL запроса без секретов (для хранения и логов)"""
+        return self.redact(url)
+
+    def _validator_key(self, url: str) -> str:
+        """Ключ валидаторов: имя источника и URL без секретов"""
+        return f"{self.name} {self._public_url(url)}"
+
+    def _conditional_headers(self, url: str) -> Dict[str, str]:
+        """If-None-Match / If-Modified-Since, если есть валидаторы для url"""
+        if self.validators.get("key") != self._validator_key(url):
+            return {}
+        headers = {}
+        if self.validators.get("etag"):
+            headers["If-None-Match"] = self.validators["etag"]
+        if self.validators.get("last_modified"):
+            headers["If-Modified-Since"] = self.validators["last_modified"]
+        return headers
+
+    def _remember_validators(self, url: str, resp: requests.Response) -> None:
+        etag = resp.headers.get("ETag", "")
+        last_modified = resp.headers.get("Last-Modified", "")
+        if etag or last_modified:
+            self.validators = {
+                "key": self._validator_key(url),
+                "etag": etag,
+                "last_modified": last_modified,
+            }
+        else:
+            self.validators = {}
+
+    def _retry_delay(self, attempt: int, resp: Optional[requests.Response]) -> float:
+        if resp is not None:
+            retry_after = resp.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return min(float(retry_after), self.config.HTTP_BACKOFF_MAX_SECONDS)
+        return backoff_delay(
+            attempt,
+            self.config.HTTP_BACKOFF_BASE_SECONDS,
+            self.config.HTTP_BACKOFF_MAX_SECONDS,
+        )
+
+    def _get(
+        self,
+        url: str,
+        params: Optional[Dict] = None,
+        conditional: bool = True,
+    ) -> requests.Response:
+        """
+        Условный GET через пул соединений: с сохранёнными валидаторами
+        сервер может ответить 304 Not Modified. На 429/5xx и сетевых
+        ошибках — до HTTP_MAX_RETRIES повторов с backoff (Retry-After
+        учитывается). Попытки и паузы между ними не выходят за deadline.
+        Возвращает последний ответ; исключение — только если ответа нет.
+        conditional=False — без валидаторов (для параллельных запросов
+        одного клиента).
+        """
+        full_url = requests.Request("GET", url, params=params).prepare().url
+        headers = self._conditional_headers(full_url) if conditional else {}
+
+        retries = self.config.HTTP_MAX_RETRIES
+        resp = None
+        for attempt in range(retries + 1):
+            timeout = self.config.REQUEST_TIMEOUT
+            if self.deadline is not None:
+                remaining = self.deadline - monotonic()
+                if remaining <= 0:
+                    break
+                timeout = min(timeout, remaining)
+
+            with self._requests_lock:
+                self.requests_sent += 1
+            try:
+                resp = self.session.get(full_url, headers=headers, timeout=timeout)
+            except requests.RequestException as e:
+                # текст исключения содержит URL запроса (с ключом API)
+                error = self.redact(str(e))
+                if attempt == retries:
+                    raise ApiRequestError(f"{self.name}: {error}")
+                resp = None
+                LOGGER.warning(f"{self.name}: {error}, повтор {attempt + 1}/{retries}")
+            else:
+                if resp.status_code not in RETRY_STATUSES or attempt == retries:
+                    if resp.status_code == 200 and conditional:
+                        self._remember_validators(full_url, resp)
+                    return resp
+                LOGGER.warning(
+                    f"{self.name}: статус {resp.status_code}, "
+                    f"повтор {attempt + 1}/{retries}"
+                )
+
+            delay = self._retry_delay(attempt, resp)
+            if self.deadline is not None and monotonic() + delay >= self.deadline:
+                break
+            sleep(delay)
+
+        # повторы прерваны дедлайном обновления
+        if resp is None:
+            raise ApiRequestError(f"{self.name}: превышен дедлайн обновления")
+        return resp
 
     @property
     @abstractmethod
     def name(self) -> str:
         ...
 
+    @property
+    def configuration_error(self) -> Optional[str]:
+        """Чего не хватает в настройках для запросов (None — всё задано)"""
+        return None
+
     @abstractmethod
-    def fetch_rates(self) -> Dict[str, Dict[str, Any]]:
+    def fetch_rates(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Курсы источника или None, если с прошлого запроса они не менялись (304)"""
         ...
 
 
 class CoinGeckoClient(BaseApiClient):
+    # Максимум монет на страницу /coins/markets
+    MARKETS_PAGE_SIZE = 250
+
     @property
     def name(self) -> str:
         return "CoinGecko"
 
-    def fetch_rates(self) -> Dict[str, Dict[str, Any]]:
-        ids = [self.config.CRYPTO_ID_MAP[code] for code in self.config.CRYPTO_CURRENCIES]
-        params = {
-            "ids": ",".join(ids),
-            "vs_currencies": self.config.BASE_CURRENCY.lower(),
-        }
-
-        start = perf_counter()
-        try:
-            resp = requests.get(
-                self.config.COINGECKO_URL,
-                params=params,
-                timeout=self.config.REQUEST_TIMEOUT,
-            )
-        except requests.RequestException as e:
-            raise ApiRequestError(f"{self.name}: {e}")
-
-        elapsed_ms = int((perf_counter() - start) * 1000)
+    def _id_batches(self, ids: List[str], vs: str) -> List[List[str]]:
+        """
+        Делит ids на пакеты максимального размера, при котором URL
+        запроса не длиннее COINGECKO_MAX_URL_LENGTH.
+        """
+        base_length = len(
+            requests.Request(
+                "GET", self.config.COINGECKO_URL,
+                params={"ids": "", "vs_currencies": vs},
+            ).prepare().url
+        )
+        limit = self.config.COINGECKO_MAX_URL_LENGTH
+
+        batches: List[List[str]] = []
+        batch: List[str] = []
+        length = base_length
+        for coin_id in ids:
+            # запятая между id кодируется как %2C
+            extra = len(quote_plus(coin_id)) + (3 if batch else 0)
+            if batch and length + extra > limit:
+                batches.append(batch)
+                batch, length = [], base_length
+                extra = len(quote_plus(coin_id))
+            batch.append(coin_id)
+            length += extra
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _fetch_batch(
+        self, ids: List[str], vs: str, conditional: bool = True
+    ) -> Optional[Tuple[Dict, requests.Response]]:
+        """Цены одного пакета: (данные, ответ) или None при 304"""
+        params = {"ids": ",".join(ids), "vs_currencies": vs}
+        resp = self._get(
+            self.config.COINGECKO_URL, params=params, conditional=conditional
+        )
+
+        if resp.status_code == 304:
+            return None
 
         if resp.status_code != 200:
             raise ApiRequestError(
@@ -59,17 +242,67 @@ class CoinGeckoClient(BaseApiClient):
             )
 
         try:
-            data = resp.json()
+            return resp.json(), resp
         except ValueError as e:
             raise ApiRequestError(f"{self.name}: некорректный JSON: {e}")
 
+    def _fetch_batches(self, batches: List[List[str]], vs: str) -> Dict:
+        """
+        Пакеты запрашиваются параллельно (до COINGECKO_BATCH_WORKERS).
+        Ошибка части пакетов не отменяет остальные; исключение —
+        только если не удалось получить ни одного.
+        """
+        workers = min(self.config.COINGECKO_BATCH_WORKERS, len(batches))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(self._fetch_batch, batch, vs, False) for batch in batches
+            ]
+
+        data: Dict = {}
+        errors = []
+        for future in futures:
+            try:
+                batch_data, _ = future.result()
+            except ApiRequestError as e:
+                errors.append(e)
+                continue
+            data.update(batch_data)
+
+        if len(errors) == len(batches):
+            raise errors[0]
+        if errors:
+            LOGGER.warning(
+                f"{self.name}: {len(errors)} из {len(batches)} пакетов не получены: "
+                f"{errors[0]}"
+            )
+        return data
+
+    def fetch_rates(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        ids = [self.config.CRYPTO_ID_MAP[code] for code in self.config.CRYPTO_CURRENCIES]
+        vs_key = self.config.BASE_CURRENCY.lower()
+        batches = self._id_batches(ids, vs_key)
+
+        start = perf_counter()
+        if len(batches) == 1:
+            fetched = self._fetch_batch(batches[0], vs_key)
+            if fetched is None:
+                LOGGER.info(f"{self.name}: курсы не изменились (304)")
+                return None
+            data, resp = fetched
+            etag = resp.headers.get("ETag", "")
+        else:
+            # валидаторы одни на источник — условные запросы только для одного URL
+            self.validators = {}
+            data, etag = self._fetch_batches(batches, vs_key), ""
+
+        elapsed_ms = int((perf_counter() - start) * 1000)
+
         result: Dict[str, Dict[str, Any]] = {}
         for code in self.config.CRYPTO_CURRENCIES:
             coin_id = self.config.CRYPTO_ID_MAP.get(code)
             if not coin_id or coin_id not in data:
                 continue
             vs_map = data[coin_id]
-            vs_key = self.config.BASE_CURRENCY.lower()
             if vs_key not in vs_map:
                 continue
 
@@ -79,8 +312,8 @@ class CoinGeckoClient(BaseApiClient):
             meta = {
                 "raw_id": coin_id,
                 "request_ms": elapsed_ms,
-                "status_code": resp.status_code,
-                "etag": resp.headers.get("ETag", ""),
+                "status_code": 200,
+                "etag": etag,
             }
 
             result[pair_key] = {
@@ -89,31 +322,75 @@ class CoinGeckoClient(BaseApiClient):
                 "meta": meta,
             }
 
-        LOGGER.info(f"{self.name}: получено {len(result)} курсов")
+        LOGGER.info(
+            f"{self.name}: получено {len(result)} курсов ({len(batches)} запросов)"
+        )
         return result
 
+    def discover(self, top_n: int) -> List[Dict[str, Any]]:
+        """
+        top_n монет по капитализации из /coins/markets
+        (страницы запрашиваются параллельно).
+        """
+        pages = math.ceil(top_n / self.MARKETS_PAGE_SIZE)
+        vs = self.config.BASE_CURRENCY.lower()
+
+        def fetch_page(page: int) -> List[Dict[str, Any]]:
+            params = {
+                "vs_currency": vs,
+                "order": "market_cap_desc",
+                "per_page": self.MARKETS_PAGE_SIZE,
+                "page": page,
+            }
+            resp = self._get(
+                self.config.COINGECKO_MARKETS_URL, params=params, conditional=False
+            )
+            if resp.status_code != 200:
+                raise ApiRequestError(
+                    f"{self.name}: статус {resp.status_code}, тело={resp.text[:200]}"
+                )
+            try:
+                return resp.json()
+            except ValueError as e:
+                raise ApiRequestError(f"{self.name}: некорректный JSON: {e}")
+
+        workers = max(min(self.config.COINGECKO_BATCH_WORKERS, pages), 1)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pages_data = list(pool.map(fetch_page, range(1, pages + 1)))
+        return [coin for page in pages_data for coin in page][:top_n]
+
 
 class ExchangeRateApiClient(BaseApiClient):
     @property
     def name(self) -> str:
         return "ExchangeRate-API"
 
-    def fetch_rates(self) -> Dict[str, Dict[str, Any]]:
+    @property
+    def configuration_error(self) -> Optional[str]:
         if not self.config.EXCHANGERATE_API_KEY:
-            raise ApiRequestError(
-                f"{self.name}: ключ API не задан (переменная EXCHANGERATE_API_KEY)"
-            )
+            return "ключ API не задан (переменная EXCHANGERATE_API_KEY)"
+        return None
+
+    def redact(self, text: str) -> str:
+        """Ключ API — сегмент пути URL, в логах и sources.json он скрыт"""
+        key = self.config.EXCHANGERATE_API_KEY
+        return text.replace(key, "***") if key else text
+
+    def fetch_rates(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        if self.configuration_error:
+            raise ApiRequestError(f"{self.name}: {self.configuration_error}")
 
         url = f"{self.config.EXCHANGERATE_API_URL}/{self.config.EXCHANGERATE_API_KEY}/latest/{self.config.BASE_CURRENCY}"
 
         start = perf_counter()
-        try:
-            resp = requests.get(url, timeout=self.config.REQUEST_TIMEOUT)
-        except requests.RequestException as e:
-            raise ApiRequestError(f"{self.name}: {e}")
+        resp = self._get(url)
 
         elapsed_ms = int((perf_counter() - start) * 1000)
 
+        if resp.status_code == 304:
+            LOGGER.info(f"{self.name}: курсы не изменились (304)")
+            return None
+
         if resp.status_code != 200:
             raise ApiRequestError(
                 f"{self.name}: статус {resp.status_code}, тело={resp.text[:200]}"
@@ -160,3 +437,29 @@ class ExchangeRateApiClient(BaseApiClient):
 
         LOGGER.info(f"{self.name}: получено {len(result)} курсов")
         return result
+
+    def discover(self) -> Dict[str, str]:
+        """Все поддерживаемые валюты: {код: название}"""
+        if self.configuration_error:
+            raise ApiRequestError(f"{self.name}: {self.configuration_error}")
+
+        url = (
+            f"{self.config.EXCHANGERATE_API_URL}/"
+            f"{self.config.EXCHANGERATE_API_KEY}/codes"
+        )
+        resp = self._get(url, conditional=False)
+        if resp.status_code != 200:
+            raise ApiRequestError(
+                f"{self.name}: статус {resp.status_code}, тело={resp.text[:200]}"
+            )
+        try:
+            data = resp.json()
+        except ValueError as e:
+            raise ApiRequestError(f"{self.name}: некорректный JSON: {e}")
+
+        if data.get("result") != "success":
+            raise ApiRequestError(
+                f"{self.name}: результат={data.get('result')}, "
+                f"ошибка={data.get('error-type')}"
+            )
+        return {code: name for code, name in data.get("supported_codes", [])}
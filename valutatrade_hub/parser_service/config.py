@@ -8,9 +8,16 @@ class ParserConfig:
     # Ключ загружается из переменной окружения
     EXCHANGERATE_API_KEY: str = os.getenv("EXCHANGERATE_API_KEY", "")
 
-    # Эндпоинты
-    COINGECKO_URL: str = "https://api.coingecko.com/api/v3/simple/price"
-    EXCHANGERATE_API_URL: str = "https://v6.exchangerate-api.com/v6"
+    # Эндпоинты (переменные окружения позволяют направить клиентов
+    # на локальный benchmarks.fake_provider)
+    COINGECKO_URL: str = os.getenv(
+        "COINGECKO_URL", "https://api.coingecko.com/api/v3/simple/price"
+    )
+    EXCHANGERATE_API_URL: str = os.getenv(
+        "EXCHANGERATE_API_URL", "https://v6.exchangerate-api.com/v6"
+    )
+    # По умолчанию — /coins/markets рядом с COINGECKO_URL
+    COINGECKO_MARKETS_URL: str = ""
 
     # Списки валют
     BASE_CURRENCY: str = "USD"
@@ -18,12 +25,71 @@ class ParserConfig:
     CRYPTO_CURRENCIES: tuple = ("BTC", "ETH", "SOL")
     CRYPTO_ID_MAP: dict = None
 
+    # Набор валют: static — списки выше; full — все валюты ExchangeRate-API
+    # и CRYPTO_TOP_N криптовалют CoinGecko по капитализации. Список
+    # обновляется раз в UNIVERSE_REFRESH_SECONDS и хранится в universe.json
+    UNIVERSE_MODE: str = os.getenv("RATES_UNIVERSE", "static")
+    CRYPTO_TOP_N: int = 500
+    UNIVERSE_REFRESH_SECONDS: int = 86_400
+
+    # CoinGecko: ids делятся на пакеты с URL не длиннее лимита,
+    # пакеты запрашиваются параллельно
+    COINGECKO_MAX_URL_LENGTH: int = 2000
+    COINGECKO_BATCH_WORKERS: int = 4
+
     # Пути к файлам
     RATES_FILE_PATH: str = ""
+    # Старый монолитный файл истории (импортируется в сегменты при первом запуске)
     HISTORY_FILE_PATH: str = ""
+    HISTORY_DIR_PATH: str = ""
+    # Состояние источников между запусками (ETag/Last-Modified и т.п.)
+    SOURCES_STATE_FILE_PATH: str = ""
+    UNIVERSE_FILE_PATH: str = ""
+
+    # Ротация сегментов истории
+    HISTORY_SEGMENT_MAX_BYTES: int = 1_000_000
+    HISTORY_SEGMENT_MAX_SECONDS: int = 86_400
+
+    # Хранение истории: сырые тики — N дней (0 — бессрочно, по умолчанию:
+    # удаление истории включается явно), закрытые сегменты сжимаются gzip;
+    # OHLC-агрегаты не удаляются
+    HISTORY_RAW_RETENTION_DAYS: int = 0
+    HISTORY_COMPRESS_COLD: bool = True
+
+    # Детектор изменений: курс пишется в историю и кэш, только если он
+    # сдвинулся больше порога или с прошлой записи прошёл heartbeat
+    RATE_CHANGE_ABS_THRESHOLD: float = 0.0
+    RATE_CHANGE_REL_THRESHOLD: float = 0.0001
+    RATE_HEARTBEAT_SECONDS: int = 3600
 
     # Сетевые параметры
     REQUEST_TIMEOUT: int = 10
+    # Общий дедлайн параллельного опроса всех источников
+    UPDATE_DEADLINE_SECONDS: float = 15
+
+    # Планировщик: свои интервалы для крипто- и фиат-источников,
+    # джиттер (доля интервала), backoff после ошибок
+    SCHEDULE_CRYPTO_INTERVAL_SECONDS: float = 60
+    SCHEDULE_FIAT_INTERVAL_SECONDS: float = 3600
+    SCHEDULE_JITTER: float = 0.1
+    SCHEDULE_BACKOFF_BASE_SECONDS: float = 30
+    SCHEDULE_BACKOFF_MAX_SECONDS: float = 1800
+
+    # Месячные квоты запросов (0 — без лимита)
+    EXCHANGERATE_MONTHLY_QUOTA: int = 1500
+    COINGECKO_MONTHLY_QUOTA: int = 10000
+
+    # Circuit breaker источников: открывается после N ошибок подряд,
+    # пробный запрос — через BREAKER_RESET_SECONDS; окно статистики
+    BREAKER_FAILURE_THRESHOLD: int = 3
+    BREAKER_RESET_SECONDS: float = 300
+    HEALTH_WINDOW: int = 50
+
+    # HTTP: пул keep-alive соединений и повторы на 429/5xx
+    HTTP_POOL_SIZE: int = 10
+    HTTP_MAX_RETRIES: int = 3
+    HTTP_BACKOFF_BASE_SECONDS: float = 0.5
+    HTTP_BACKOFF_MAX_SECONDS: float = 8.0
 
     def __post_init__(self):
         if self.CRYPTO_ID_MAP is None:
@@ -42,3 +108,12 @@ class ParserConfig:
             self.RATES_FILE_PATH = path.join(data_dir, "rates.json")
         if not self.HISTORY_FILE_PATH:
             self.HISTORY_FILE_PATH = path.join(data_dir, "exchange_rates.json")
+        if not self.HISTORY_DIR_PATH:
+            self.HISTORY_DIR_PATH = path.join(data_dir, "history")
+        if not self.SOURCES_STATE_FILE_PATH:
+            self.SOURCES_STATE_FILE_PATH = path.join(data_dir, "sources.json")
+        if not self.UNIVERSE_FILE_PATH:
+            self.UNIVERSE_FILE_PATH = path.join(data_dir, "universe.json")
+        if not self.COINGECKO_MARKETS_URL:
+            root = self.COINGECKO_URL.rsplit("/simple/price", 1)[0]
+            self.COINGECKO_MARKETS_URL = f"{root}/coins/markets"
@@ -0,0 +1,357 @@
+from __future__ import annotations
+
+import argparse
+import math
+import os
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from array import array
+from typing import Iterable, List, Optional, Tuple
+
+from valutatrade_hub.infra.settings import SettingsLoader
+
+from ..core.rate_matrix import RateMatrix
+from ..core.rates_cache import RatesCache, RatesSnapshot
+from ..logging_config import LOGGER
+from .config import ParserConfig
+from .scheduler import MultiSourceScheduler, SystemClock, default_schedules
+from .storage import RatesStorage
+
+# ===== ПРОТОКОЛ =====
+#
+# Запрос:  op (1 байт) + длина тела (uint32) + тело
+# Ответ:   status (1 байт) + длина тела (uint32) + тело
+#
+# OP_LOOKUP   тело — "FROM_TO FROM_TO ..." (ASCII);
+#             ответ — N пар float64 (курс, updated_at epoch), NaN — курса нет
+# OP_SNAPSHOT тело — известное клиенту поколение снимка (uint64);
+#             ответ — STATUS_NOT_MODIFIED без тела или снимок:
+#             SNAPSHOT_HEADER, курсы и updated_at (array('d')),
+#             затем текст: last_refresh и строки "PAIR\tupdated_at"
+
+HEADER = struct.Struct("<BI")
+GENERATION = struct.Struct("<Q")
+# поколение, ttl, grace, число пар
+SNAPSHOT_HEADER = struct.Struct("<QddI")
+
+OP_LOOKUP = 1
+OP_SNAPSHOT = 2
+
+STATUS_OK = 0
+STATUS_NOT_MODIFIED = 1
+STATUS_ERROR = 2
+
+
+def _pack_snapshot(snapshot: RatesSnapshot, generation: int) -> bytes:
+    keys = list(snapshot.rates)
+    rates = array("d", (snapshot.rates[k] for k in keys))
+    updated = array("d", (snapshot.updated_at[k] for k in keys))
+    lines = [snapshot.last_refresh or ""]
+    lines.extend(f"{k}\t{snapshot.updated_at_raw[k]}" for k in keys)
+    return b"".join(
+        (
+            SNAPSHOT_HEADER.pack(
+                generation, snapshot.ttl_seconds, snapshot.grace_seconds, len(keys)
+            ),
+            rates.tobytes(),
+            updated.tobytes(),
+            "\n".join(lines).encode("utf-8"),
+        )
+    )
+
+
+def _unpack_snapshot(payload: bytes) -> Tuple[int, RatesSnapshot]:
+    generation, ttl, grace, n = SNAPSHOT_HEADER.unpack_from(payload)
+    offset = SNAPSHOT_HEADER.size
+    rates = array("d")
+    rates.frombytes(payload[offset:offset + 8 * n])
+    offset += 8 * n
+    updated = array("d")
+    updated.frombytes(payload[offset:offset + 8 * n])
+    offset += 8 * n
+
+    lines = payload[offset:].decode("utf-8").split("\n")
+    snapshot = RatesSnapshot({}, ttl, grace)
+    snapshot.last_refresh = lines[0] or None
+    snapshot.version = generation
+    for i, line in enumerate(lines[1:n + 1]):
+        key, raw = line.split("\t", 1)
+        snapshot.rates[key] = rates[i]
+        snapshot.updated_at[key] = updated[i]
+        snapshot.updated_at_raw[key] = raw
+    return generation, snapshot
+
+
+# ===== СЕРВЕР =====
+
+class _StopRequested(Exception):
+    pass
+
+
+class _DaemonClock(SystemClock):
+    """
+    Часы планировщика внутри демона: перед каждым сном снимок
+    перечитывается (JSON разбирается здесь, а не в обработчике
+    запроса), сон прерывается остановкой демона.
+    """
+
+    def __init__(self, daemon: "RatesDaemon") -> None:
+        self.daemon = daemon
+
+    def sleep(self, seconds: float) -> None:
+        self.daemon.current()
+        if self.daemon.stopped.wait(seconds):
+            raise _StopRequested()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Одно соединение: запросы читаются, пока клиент его не закроет"""
+
+    def handle(self) -> None:
+        while True:
+            header = self.rfile.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return
+            op, length = HEADER.unpack(header)
+            body = self.rfile.read(length)
+            status, payload = self.server.rates_daemon.dispatch(op, body)
+            self.wfile.write(HEADER.pack(status, len(payload)) + payload)
+
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class RatesDaemon:
+    """
+    Процесс, держащий снимок курсов в памяти и отвечающий на запросы
+    по Unix-сокету. rates.json перечитывается только при изменении файла;
+    на каждый снимок один раз строятся RateMatrix и упакованное
+    представление для клиентов. Если refresh=True, в фоне работает
+    MultiSourceScheduler.
+    """
+
+    def __init__(
+        self,
+        config: ParserConfig,
+        socket_path: str,
+        refresh: bool = True,
+    ) -> None:
+        self.config = config
+        self.socket_path = socket_path
+        self.refresh = refresh
+        self.cache = RatesCache(config.RATES_FILE_PATH)
+        self.stopped = threading.Event()
+
+        self._lock = threading.Lock()
+        self._snapshot: Optional[RatesSnapshot] = None
+        self._matrix: Optional[RateMatrix] = None
+        self._generation = 0
+        self._packed = b""
+        self._server: Optional[_Server] = None
+
+    # ---------- Снимок ----------
+    def current(self) -> Tuple[RateMatrix, int, bytes]:
+        """Матрица, поколение и упакованный снимок для текущего rates.json"""
+        snapshot = self.cache.get()
+        with self._lock:
+            if snapshot is not self._snapshot:
+                # поколение уникально и между перезапусками демона
+                self._generation = max(time.time_ns(), self._generation + 1)
+                self._matrix = RateMatrix(snapshot, self.config.BASE_CURRENCY)
+                self._packed = _pack_snapshot(snapshot, self._generation)
+                self._snapshot = snapshot
+            return self._matrix, self._generation, self._packed
+
+    def dispatch(self, op: int, body: bytes) -> Tuple[int, bytes]:
+        try:
+            matrix, generation, packed = self.current()
+            if op == OP_SNAPSHOT:
+                (known,) = GENERATION.unpack(body)
+                if known == generation:
+                    return STATUS_NOT_MODIFIED, b""
+                return STATUS_OK, packed
+
+            if op == OP_LOOKUP:
+                values = array("d")
+                for pair in body.decode("ascii").split():
+                    code_from, _, code_to = pair.partition("_")
+                    quote = matrix.quote(code_from, code_to)
+                    if quote is None:
+                        values.extend((math.nan, -math.inf))
+                    else:
+                        values.extend(quote[:2])
+                return STATUS_OK, values.tobytes()
+
+            return STATUS_ERROR, f"неизвестная операция {op}".encode("utf-8")
+        except Exception as e:
+            LOGGER.error(f"RatesDaemon: request failed: {e}")
+            return STATUS_ERROR, str(e).encode("utf-8")
+
+    # ---------- Запуск ----------
+    def _run_scheduler(self) -> None:
+        storage = RatesStorage(self.config)
+        scheduler = MultiSourceScheduler(
+            self.config, storage, default_schedules(self.config),
+            clock=_DaemonClock(self),
+        )
+        try:
+            scheduler.run()
+        except _StopRequested:
+            pass
+
+    def serve_forever(self) -> None:
+        # сокет от прошлого запуска, если процесс не удалил его сам
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        self.current()
+        self._server = _Server(self.socket_path, _Handler)
+        self._server.rates_daemon = self
+        os.chmod(self.socket_path, 0o600)
+
+        if self.refresh:
+            threading.Thread(
+                target=self._run_scheduler, name="rates-scheduler", daemon=True
+            ).start()
+
+        LOGGER.info(f"RatesDaemon: listening on {self.socket_path}")
+        try:
+            self._server.serve_forever()
+        finally:
+            self.stopped.set()
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def shutdown(self) -> None:
+        self.stopped.set()
+        if self._server is not None:
+            self._server.shutdown()
+
+
+# ===== КЛИЕНТ =====
+
+class DaemonClient:
+    """
+    Клиент демона курсов. Соединение открывается при первом запросе
+    и переиспользуется; при ошибке закрывается и бросается OSError —
+    вызывающий откатывается на чтение файлов.
+    """
+
+    def __init__(self, socket_path: str, timeout: float = 0.5) -> None:
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _recv_exact(self, size: int) -> bytes:
+        chunks = []
+        while size:
+            chunk = self._sock.recv(size)
+            if not chunk:
+                raise ConnectionError("демон курсов закрыл соединение")
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def _call(self, op: int, body: bytes) -> Tuple[int, bytes]:
+        with self._lock:
+            try:
+                if self._sock is None:
+                    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    sock.settimeout(self.timeout)
+                    try:
+                        sock.connect(self.socket_path)
+                    except OSError:
+                        sock.close()
+                        raise
+                    self._sock = sock
+                self._sock.sendall(HEADER.pack(op, len(body)) + body)
+                status, length = HEADER.unpack(self._recv_exact(HEADER.size))
+                payload = self._recv_exact(length)
+            except OSError:
+                self.close()
+                raise
+
+        if status == STATUS_ERROR:
+            raise ConnectionError(payload.decode("utf-8", "replace"))
+        return status, payload
+
+    def lookup(
+        self, pairs: Iterable[Tuple[str, str]]
+    ) -> List[Optional[Tuple[float, float]]]:
+        """(курс, updated_at epoch) для пар (с кросс-курсами) или None"""
+        body = " ".join(f"{f.upper()}_{t.upper()}" for f, t in pairs)
+        _, payload = self._call(OP_LOOKUP, body.encode("ascii"))
+        values = array("d")
+        values.frombytes(payload)
+        return [
+            None if math.isnan(values[i]) else (values[i], values[i + 1])
+            for i in range(0, len(values), 2)
+        ]
+
+    def snapshot(
+        self, known_generation: int = 0
+    ) -> Optional[Tuple[int, RatesSnapshot]]:
+        """Снимок курсов или None, если поколение не изменилось"""
+        status, payload = self._call(
+            OP_SNAPSHOT, GENERATION.pack(known_generation)
+        )
+        if status == STATUS_NOT_MODIFIED:
+            return None
+        return _unpack_snapshot(payload)
+
+
+_client: Optional[DaemonClient] = None
+_client_lock = threading.Lock()
+
+
+def get_daemon_client() -> Optional[DaemonClient]:
+    """Клиент демона, если его сокет существует (None — демон не запущен)"""
+    global _client
+    settings = SettingsLoader()
+    path = settings.get("RATES_DAEMON_SOCKET", "")
+    if not path or not os.path.exists(path):
+        return None
+    with _client_lock:
+        if _client is None or _client.socket_path != path:
+            _client = DaemonClient(
+                path, settings.get("RATES_DAEMON_TIMEOUT_SECONDS", 0.5)
+            )
+        return _client
+
+
+def run_daemon(socket_path: Optional[str] = None, refresh: bool = True) -> None:
+    """Запускает демон курсов (блокирует до остановки)"""
+    config = ParserConfig()
+    path = socket_path or SettingsLoader().get("RATES_DAEMON_SOCKET")
+    daemon = RatesDaemon(config, path, refresh=refresh)
+    # по SIGTERM выходим через finally serve_forever, удаляя сокет
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Демон курсов валют")
+    parser.add_argument("--socket", help="путь к Unix-сокету")
+    parser.add_argument(
+        "--no-refresh",
+        action="store_true",
+        help="не обновлять курсы, только раздавать rates.json",
+    )
+    args = parser.parse_args()
+    run_daemon(args.socket, refresh=not args.no_refresh)
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import math
+from typing import Dict, List, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """Перцентиль методом ближайшего ранга (None для пустого списка)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(p / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+class SourceHealth:
+    """
+    Circuit breaker и статистика одного источника.
+
+    closed    — запросы идут; после failure_threshold ошибок подряд -> open
+    open      — запросы не отправляются до истечения reset_seconds
+    half_open — один пробный запрос: успех -> closed, ошибка -> open
+
+    Время — wall clock (epoch): состояние хранится в sources.json и
+    переживает перезапуск процесса. Окно последних window результатов
+    даёт success rate и p50/p95 request_ms.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        reset_seconds: float = 300,
+        window: int = 50,
+        data: Optional[Dict] = None,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.window = window
+
+        data = data or {}
+        self.state: str = data.get("state", CLOSED)
+        self.failures: int = int(data.get("failures", 0))
+        self.opened_at: Optional[float] = data.get("opened_at")
+        self.last_error: Optional[str] = data.get("last_error")
+        # [успех 0/1, request_ms] последних запросов
+        self.results: List[List[float]] = list(data.get("results", []))[-window:]
+
+    def to_dict(self) -> Dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opened_at": self.opened_at,
+            "last_error": self.last_error,
+            "results": self.results,
+        }
+
+    # ---------- Breaker ----------
+    def allow(self, now: float) -> bool:
+        """Можно ли сейчас обращаться к источнику"""
+        if self.state == OPEN:
+            if now - (self.opened_at or 0) < self.reset_seconds:
+                return False
+            self.state = HALF_OPEN
+        return True
+
+    def retry_in(self, now: float) -> float:
+        """Сколько секунд осталось до пробного запроса (0 — не открыт)"""
+        if self.state != OPEN:
+            return 0.0
+        return max(self.reset_seconds - (now - (self.opened_at or 0)), 0.0)
+
+    def _record(self, ok: bool, request_ms: float) -> None:
+        self.results.append([1 if ok else 0, round(request_ms, 1)])
+        del self.results[: -self.window]
+
+    def record_success(self, request_ms: float) -> None:
+        self._record(True, request_ms)
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+
+    def record_failure(self, now: float, request_ms: float, error: str) -> None:
+        self._record(False, request_ms)
+        self.failures += 1
+        self.last_error = error
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = OPEN
+            self.opened_at = now
+
+    # ---------- Статистика ----------
+    @property
+    def success_rate(self) -> Optional[float]:
+        if not self.results:
+            return None
+        return sum(ok for ok, _ in self.results) / len(self.results)
+
+    def latency(self, p: float) -> Optional[float]:
+        """Перцентиль request_ms успешных запросов окна"""
+        return percentile([ms for ok, ms in self.results if ok], p)
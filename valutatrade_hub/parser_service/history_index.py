@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple
+
+from .config import ParserConfig
+from .history_store import SegmentedHistoryStore
+from .storage import RatesStorage
+
+
+class RateHistoryIndex:
+    """
+    Индекс истории курсов по парам: отсортированные epoch-времена
+    и курсы в array('d'). Запросы «курс на момент T» и «диапазон T1..T2»
+    решаются бинарным поиском. Индекс дочитывает только новые записи
+    хранилища (по позиции в сегментах).
+    """
+
+    def __init__(self, store: SegmentedHistoryStore) -> None:
+        self.store = store
+        self._lock = threading.Lock()
+        self._times: Dict[str, array] = {}
+        self._rates: Dict[str, array] = {}
+        self._position: Optional[Tuple[str, int]] = None
+
+    def _add(self, pair: str, ts: float, rate: float) -> None:
+        times = self._times.get(pair)
+        if times is None:
+            times = self._times[pair] = array("d")
+            self._rates[pair] = array("d")
+        rates = self._rates[pair]
+
+        if not times or ts >= times[-1]:
+            times.append(ts)
+            rates.append(rate)
+        else:
+            i = bisect_right(times, ts)
+            times.insert(i, ts)
+            rates.insert(i, rate)
+
+    def refresh(self) -> int:
+        """Дочитывает новые тики истории; возвращает их количество"""
+        with self._lock:
+            ticks, self._position = self.store.read_ticks_from(self._position)
+            for pair, ts, rate in ticks:
+                self._add(pair, ts, rate)
+            return len(ticks)
+
+    def pairs(self) -> List[str]:
+        self.refresh()
+        return sorted(self._times)
+
+    def rate_at(self, pair: str, at: float) -> Optional[Tuple[float, float]]:
+        """Последний курс пары не позже at: (курс, время) или None"""
+        self.refresh()
+        times = self._times.get(pair)
+        if not times:
+            return None
+        i = bisect_right(times, at) - 1
+        if i < 0:
+            return None
+        return self._rates[pair][i], times[i]
+
+    def range(self, pair: str, start: float, end: float) -> List[Tuple[float, float]]:
+        """Все точки пары в [start, end]: список (время, курс)"""
+        self.refresh()
+        times = self._times.get(pair)
+        if not times:
+            return []
+        lo = bisect_left(times, start)
+        hi = bisect_right(times, end)
+        return list(zip(times[lo:hi], self._rates[pair][lo:hi]))
+
+    def series(
+        self,
+        pair: str,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+    ) -> Tuple[array, array]:
+        """Времена и курсы пары в [start, end] как срезы array('d')"""
+        self.refresh()
+        times = self._times.get(pair)
+        if not times:
+            return array("d"), array("d")
+        lo = 0 if start is None else bisect_left(times, start)
+        hi = len(times) if end is None else bisect_right(times, end)
+        return times[lo:hi], self._rates[pair][lo:hi]
+
+
+_INDEX: Optional[RateHistoryIndex] = None
+
+
+def get_history_index() -> RateHistoryIndex:
+    """Процессный индекс истории для хранилища из ParserConfig"""
+    global _INDEX
+    if _INDEX is None:
+        _INDEX = RateHistoryIndex(RatesStorage(ParserConfig()).history)
+    return _INDEX
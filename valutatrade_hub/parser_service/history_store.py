@@ -0,0 +1,473 @@
+from __future__ import annotations
+
+import gzip
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from ..logging_config import LOGGER
+
+
+def to_epoch(timestamp: str) -> float:
+    """ISO-время из истории ('...Z') -> epoch seconds"""
+    dt = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+# Тик в бинарном файле сегмента: epoch-время, курс, id пары (index["pairs"])
+TICK = struct.Struct("<ddI")
+
+# (пара, время, курс)
+Tick = Tuple[str, float, float]
+
+
+class SegmentedHistoryStore:
+    """
+    Append-only история курсов в виде сегментов:
+
+        <directory>/seg-000001.jsonl     — полные записи (с source и meta)
+        <directory>/seg-000001.ticks     — те же тики фиксированной ширины
+        <directory>/seg-000001.jsonl.gz  — закрытый («холодный») сегмент
+        <directory>/seg-000001.ticks.gz
+        <directory>/index.json
+
+    Новые записи дописываются в конец активного сегмента, поэтому
+    стоимость обновления зависит только от числа новых записей.
+    Активный сегмент закрывается по размеру или возрасту, после чего
+    сжимается gzip. Закрытые сегменты старше retention_days удаляются
+    (OHLC-агрегаты в rollups/ хранятся бессрочно).
+
+    Файл .ticks читается через mmap и struct.iter_unpack, поэтому
+    выборка по диапазону не создаёт dict на каждую запись.
+
+    Для дедупликации index.json хранит по каждой паре время последней
+    записи (id записи = пара + timestamp, а запись идёт по возрастанию
+    времени), вместо множества всех id.
+    """
+
+    INDEX_FILE = "index.json"
+    INDEX_VERSION = 2
+
+    def __init__(
+        self,
+        directory: str,
+        segment_max_bytes: int = 1_000_000,
+        segment_max_seconds: int = 86_400,
+        legacy_file: Optional[str] = None,
+        retention_days: float = 0,
+        compress_cold: bool = True,
+    ) -> None:
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_seconds = segment_max_seconds
+        self.legacy_file = legacy_file
+        # 0 — хранить сырые тики бессрочно
+        self.retention_days = retention_days
+        self.compress_cold = compress_cold
+
+        self._lock = threading.RLock()
+        self._index: Optional[Dict] = None
+        self._index_mtime: Optional[int] = None
+        self._pair_ids: Dict[str, int] = {}
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    # ---------- Индекс ----------
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.directory, self.INDEX_FILE)
+
+    def _segment_path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @staticmethod
+    def _ticks_name(name: str) -> str:
+        return name[: -len(".jsonl")] + ".ticks"
+
+    def _file_path(self, segment: Dict, ticks: bool = False) -> str:
+        """Путь к файлу сегмента с учётом сжатия"""
+        name = self._ticks_name(segment["name"]) if ticks else segment["name"]
+        if segment.get("codec") == "gzip":
+            name += ".gz"
+        return self._segment_path(name)
+
+    def _save_index(self) -> None:
+        tmp_path = self.index_path + ".tmp"
+        text = json.dumps(self._index, ensure_ascii=False, indent=4)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, self.index_path)
+        self._index_mtime = os.stat(self.index_path).st_mtime_ns
+
+    def _load_index(self) -> Dict:
+        """Индекс из памяти; перечитывается, если его обновил другой процесс"""
+        try:
+            mtime = os.stat(self.index_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+
+        if self._index is not None and mtime == self._index_mtime:
+            return self._index
+
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self._index = json.load(f)
+            self._index_mtime = mtime
+        except FileNotFoundError:
+            self._index = {
+                "version": self.INDEX_VERSION,
+                "segments": [],
+                "high_water": {},
+                "pairs": [],
+                "next_seq": 1,
+            }
+            self._import_legacy()
+
+        if self._index.get("version", 1) < self.INDEX_VERSION:
+            self._upgrade_index()
+
+        self._pair_ids = {p: i for i, p in enumerate(self._index["pairs"])}
+        return self._index
+
+    def _upgrade_index(self) -> None:
+        """Индекс версии 1: строим .ticks для уже записанных сегментов"""
+        index = self._index
+        index["pairs"] = []
+        self._pair_ids = {}
+        segments = index["segments"]
+        index["next_seq"] = int(segments[-1]["name"][4:10]) + 1 if segments else 1
+
+        for segment in segments:
+            ticks = []
+            for r in self._read_segment(segment):
+                try:
+                    ticks.append(self._pack(r))
+                except (KeyError, TypeError, ValueError):
+                    continue
+            with open(self._file_path(segment, ticks=True), "wb") as f:
+                f.write(b"".join(ticks))
+            segment["ticks"] = len(ticks)
+
+        index["version"] = self.INDEX_VERSION
+        self._save_index()
+        LOGGER.info("HistoryStore: индекс истории обновлён до версии 2")
+
+    def _import_legacy(self) -> None:
+        """Однократный перенос старого exchange_rates.json в сегменты"""
+        if not self.legacy_file or not os.path.isfile(self.legacy_file):
+            self._save_index()
+            return
+
+        try:
+            with open(self.legacy_file, "r", encoding="utf-8") as f:
+                records = json.load(f)
+        except ValueError as e:
+            LOGGER.error(f"HistoryStore: не удалось прочитать {self.legacy_file}: {e}")
+            records = []
+
+        if isinstance(records, list) and records:
+            self._append_locked(records)
+            LOGGER.info(
+                f"HistoryStore: импортировано {len(records)} записей "
+                f"из {self.legacy_file}"
+            )
+        self._save_index()
+
+    def last_timestamps(self) -> Dict[str, float]:
+        """Время последней записи по каждой паре (epoch seconds)"""
+        with self._lock:
+            return dict(self._load_index()["high_water"])
+
+    def segments(self) -> List[Dict]:
+        """Описания сегментов в порядке записи"""
+        with self._lock:
+            return [dict(s) for s in self._load_index()["segments"]]
+
+    # ---------- Запись ----------
+    def _pack(self, record: Dict) -> bytes:
+        pair = f"{record['from_currency']}_{record['to_currency']}"
+        pair_id = self._pair_ids.get(pair)
+        if pair_id is None:
+            pair_id = self._pair_ids[pair] = len(self._index["pairs"])
+            self._index["pairs"].append(pair)
+        return TICK.pack(to_epoch(record["timestamp"]), float(record["rate"]), pair_id)
+
+    def _new_segment(self, now: float) -> Dict:
+        seq = self._index["next_seq"]
+        self._index["next_seq"] = seq + 1
+        segment = {
+            "name": f"seg-{seq:06d}.jsonl",
+            "started_at": now,
+            "first_ts": None,
+            "last_ts": None,
+            "records": 0,
+            "bytes": 0,
+            "ticks": 0,
+            "closed": False,
+        }
+        self._index["segments"].append(segment)
+        return segment
+
+    def _active_segment(self, now: float) -> Dict:
+        segments = self._index["segments"]
+        if segments and not segments[-1]["closed"]:
+            active = segments[-1]
+            too_big = active["bytes"] >= self.segment_max_bytes
+            too_old = now - active["started_at"] >= self.segment_max_seconds
+            if not (too_big or too_old):
+                return active
+            active["closed"] = True
+        return self._new_segment(now)
+
+    @staticmethod
+    def _append_file(path: str, data: bytes, size: int) -> None:
+        """
+        Дописывает data с позиции size: хвост, не попавший в индекс
+        (запись прервана сбоем), отбрасывается.
+        """
+        with open(path, "ab") as f:
+            if f.tell() != size:
+                f.truncate(size)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _append_locked(self, records: List[Dict]) -> List[Dict]:
+        index = self._index
+        high_water = index["high_water"]
+
+        new_records = []
+        for r in records:
+            pair = f"{r['from_currency']}_{r['to_currency']}"
+            ts = to_epoch(r["timestamp"])
+            if ts <= high_water.get(pair, float("-inf")):
+                continue
+            high_water[pair] = ts
+            new_records.append((ts, r))
+
+        if not new_records:
+            return []
+
+        now = time.time()
+        segment = self._active_segment(now)
+        data = "".join(
+            json.dumps(r, ensure_ascii=False) + "\n" for _, r in new_records
+        ).encode("utf-8")
+        ticks = b"".join(self._pack(r) for _, r in new_records)
+
+        self._append_file(self._file_path(segment), data, segment["bytes"])
+        self._append_file(
+            self._file_path(segment, ticks=True), ticks, segment["ticks"] * TICK.size
+        )
+
+        first = min(ts for ts, _ in new_records)
+        last = max(ts for ts, _ in new_records)
+        if segment["first_ts"] is None or first < segment["first_ts"]:
+            segment["first_ts"] = first
+        if segment["last_ts"] is None or last > segment["last_ts"]:
+            segment["last_ts"] = last
+        segment["records"] += len(new_records)
+        segment["bytes"] += len(data)
+        segment["ticks"] += len(new_records)
+
+        self._save_index()
+        self._maintain_locked(now)
+        return [r for _, r in new_records]
+
+    def append(self, records: List[Dict]) -> List[Dict]:
+        """
+        Дописывает записи, которых ещё нет в истории.
+        Возвращает фактически добавленные записи.
+        """
+        with self._lock:
+            self._load_index()
+            return self._append_locked(records)
+
+    # ---------- Хранение: сжатие и retention ----------
+    def _compress_segment(self, segment: Dict) -> None:
+        for ticks in (False, True):
+            src = self._file_path(segment, ticks=ticks)
+            tmp = src + ".gz.tmp"
+            try:
+                with open(src, "rb") as f_in, gzip.open(tmp, "wb") as f_out:
+                    f_out.write(f_in.read())
+            except FileNotFoundError:
+                continue
+            os.replace(tmp, src + ".gz")
+
+        old_paths = [self._file_path(segment), self._file_path(segment, ticks=True)]
+        segment["codec"] = "gzip"
+        self._save_index()
+        for path in old_paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _maintain_locked(self, now: float) -> None:
+        segments = self._index["segments"]
+
+        if self.compress_cold:
+            for segment in segments:
+                if segment["closed"] and segment.get("codec") is None:
+                    self._compress_segment(segment)
+
+        if self.retention_days > 0:
+            cutoff = now - self.retention_days * 86_400
+            expired = [
+                s for s in segments
+                if s["closed"] and (s["last_ts"] is None or s["last_ts"] < cutoff)
+            ]
+            if expired:
+                self._index["segments"] = [s for s in segments if s not in expired]
+                self._save_index()
+                for segment in expired:
+                    for ticks in (False, True):
+                        try:
+                            os.remove(self._file_path(segment, ticks=ticks))
+                        except FileNotFoundError:
+                            pass
+                LOGGER.info(
+                    f"HistoryStore: удалено сегментов по retention: {len(expired)}"
+                )
+
+    def maintain(self) -> None:
+        """Сжимает закрытые сегменты и удаляет устаревшие по retention"""
+        with self._lock:
+            self._load_index()
+            self._maintain_locked(time.time())
+
+    # ---------- Чтение ----------
+    def _read_segment(self, segment: Dict) -> Iterator[Dict]:
+        path = self._file_path(segment)
+        try:
+            if segment.get("codec") == "gzip":
+                f = gzip.open(path, "rt", encoding="utf-8")
+            else:
+                f = open(path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                if not line.endswith("\n"):
+                    # недописанная запись после сбоя
+                    break
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    def _select(self, since: Optional[float], until: Optional[float]) -> List[Dict]:
+        selected = []
+        for segment in self.segments():
+            if segment["records"] == 0:
+                continue
+            if since is not None and segment["last_ts"] < since:
+                continue
+            if until is not None and segment["first_ts"] > until:
+                continue
+            selected.append(segment)
+        return selected
+
+    def iter_records(
+        self,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+    ) -> Iterator[Dict]:
+        """
+        Перебирает записи истории по порядку. since/until (epoch seconds)
+        отсекают целые сегменты по их first_ts/last_ts.
+        """
+        for segment in self._select(since, until):
+            yield from self._read_segment(segment)
+
+    def _unpack_ticks(
+        self,
+        segment: Dict,
+        start: int = 0,
+    ) -> List[Tuple[float, float, int]]:
+        """Тики сегмента с номера start: (время, курс, id пары)"""
+        end = segment.get("ticks", 0)
+        if start >= end:
+            return []
+        path = self._file_path(segment, ticks=True)
+
+        try:
+            if segment.get("codec") == "gzip":
+                with gzip.open(path, "rb") as f:
+                    data = f.read()
+                return list(TICK.iter_unpack(data[start * TICK.size : end * TICK.size]))
+
+            with open(path, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    with memoryview(mm) as view:
+                        window = view[start * TICK.size : end * TICK.size]
+                        try:
+                            return list(TICK.iter_unpack(window))
+                        finally:
+                            window.release()
+        except (FileNotFoundError, ValueError):
+            # нет файла или он пуст (mmap пустого файла невозможен)
+            return []
+
+    def scan(
+        self,
+        pair: str,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+    ) -> List[Tuple[float, float]]:
+        """Точки пары в [since, until] по бинарным тикам: список (время, курс)"""
+        with self._lock:
+            self._load_index()
+            pair_id = self._pair_ids.get(pair)
+        if pair_id is None:
+            return []
+
+        lo = float("-inf") if since is None else since
+        hi = float("inf") if until is None else until
+
+        points: List[Tuple[float, float]] = []
+        for segment in self._select(since, until):
+            points.extend(
+                (ts, rate)
+                for ts, rate, pid in self._unpack_ticks(segment)
+                if pid == pair_id and lo <= ts <= hi
+            )
+        return points
+
+    def read_ticks_from(
+        self,
+        position: Optional[Tuple[str, int]] = None,
+    ) -> Tuple[List[Tick], Optional[Tuple[str, int]]]:
+        """
+        Тики, добавленные после position = (сегмент, номер тика).
+        Возвращает их и новую позицию — для инкрементального чтения.
+        """
+        with self._lock:
+            self._load_index()
+            pairs = list(self._index["pairs"])
+
+        ticks: List[Tick] = []
+        for segment in self.segments():
+            name = segment["name"]
+            if position is not None and name < position[0]:
+                continue
+
+            start = 0
+            if position is not None and name == position[0]:
+                start = position[1]
+
+            ticks.extend(
+                (pairs[pid], ts, rate)
+                for ts, rate, pid in self._unpack_ticks(segment, start)
+            )
+            position = (name, segment.get("ticks", 0))
+
+        return ticks, position
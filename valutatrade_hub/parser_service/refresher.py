@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from ..logging_config import LOGGER
+from .api_clients import CoinGeckoClient
+from .config import ParserConfig
+from .health import SourceHealth
+from .scheduler import MultiSourceScheduler, SourceSchedule, default_schedules
+from .storage import RatesStorage
+from .universe import apply_universe
+
+_lock = threading.Lock()
+_thread: Optional[threading.Thread] = None
+_last_started: Optional[float] = None
+
+
+def _due_schedules(
+    config: ParserConfig,
+    scheduler: MultiSourceScheduler,
+    sources_state: Dict[str, Dict],
+    ages: Dict[str, float],
+) -> List[SourceSchedule]:
+    """
+    Источники устаревших валют, чьи котировки старше интервала
+    их расписания (с учётом месячной квоты). Раньше этого срока
+    внеочередной опрос израсходовал бы квоту быстрее планировщика.
+    Ненастроенные источники, источники с исчерпанной квотой и
+    открытым circuit breaker не опрашиваются.
+    """
+    wall = time.time()
+    due = []
+    for schedule in scheduler.schedules:
+        crypto = isinstance(schedule.client, CoinGeckoClient)
+        owned = [
+            age for code, age in ages.items()
+            if (code in config.CRYPTO_ID_MAP) == crypto
+        ]
+        if not owned or max(owned) < schedule.budget_interval(wall):
+            continue
+        if schedule.client.configuration_error:
+            continue
+        if schedule.quota_remaining(wall) <= 0:
+            continue
+        health = SourceHealth(
+            failure_threshold=config.BREAKER_FAILURE_THRESHOLD,
+            reset_seconds=config.BREAKER_RESET_SECONDS,
+            data=sources_state.get(schedule.name, {}).get("health"),
+        )
+        if health.retry_in(wall) > 0:
+            continue
+        due.append(schedule)
+    return due
+
+
+def _plan(
+    ages: Dict[str, float],
+) -> Tuple[MultiSourceScheduler, List[SourceSchedule]]:
+    """Планировщик с общими квотами и источники, которые нужно опросить"""
+    config = ParserConfig()
+    storage = RatesStorage(config)
+    if config.UNIVERSE_MODE == "full":
+        universe = storage.load_universe()
+        if universe:
+            apply_universe(config, universe)
+
+    # квота и circuit breaker — те же, что у планировщика
+    scheduler = MultiSourceScheduler(config, storage, default_schedules(config))
+    due = _due_schedules(config, scheduler, storage.load_sources_state(), ages)
+    return scheduler, due
+
+
+def _run(scheduler: MultiSourceScheduler, due: List[SourceSchedule]) -> None:
+    try:
+        scheduler.run_once(due)
+    except Exception as e:
+        LOGGER.error(f"Background refresh: update failed: {e}")
+
+
+def refresh_in_background(
+    ages: Dict[str, float], min_interval_seconds: float = 60
+) -> bool:
+    """
+    Запускает в фоновом потоке внеочередной опрос источников валют ages
+    ({код: возраст котировки в секундах}), не блокируя вызывающего.
+    Одновременно работает не больше одного обновления, повторная попытка
+    возможна не раньше чем через min_interval_seconds после предыдущей.
+    Возвращает True, только если опрос действительно запущен (источник
+    не ждёт своего срока, квоты или закрытия circuit breaker).
+    """
+    global _thread, _last_started
+
+    with _lock:
+        if _thread is not None and _thread.is_alive():
+            return False
+
+        now = time.monotonic()
+        if _last_started is not None and now - _last_started < min_interval_seconds:
+            return False
+        _last_started = now
+
+        try:
+            scheduler, due = _plan(ages)
+        except Exception as e:
+            LOGGER.error(f"Background refresh: planning failed: {e}")
+            return False
+        if not due:
+            LOGGER.info("Background refresh: no source is due")
+            return False
+
+        _thread = threading.Thread(
+            target=_run, args=(scheduler, due), name="rates-refresh", daemon=True
+        )
+        _thread.start()
+
+    LOGGER.info(
+        f"Background refresh: started ({', '.join(s.name for s in due)})"
+    )
+    return True
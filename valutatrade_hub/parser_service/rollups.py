@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ..logging_config import LOGGER
+from .history_store import SegmentedHistoryStore, to_epoch
+
+# Поддерживаемые интервалы агрегации, секунды
+INTERVALS: Dict[str, int] = {
+    "1m": 60,
+    "1h": 3600,
+    "1d": 86400,
+}
+
+
+class RollupStore:
+    """
+    OHLC-агрегаты истории курсов (open/high/low/close/count) по парам
+    для интервалов 1m/1h/1d, обновляемые по мере записи тиков:
+
+        <directory>/<interval>/<pair>.jsonl — закрытые интервалы (append-only)
+        <directory>/open.json               — текущие, ещё открытые интервалы
+
+    Запрос за месяцы по 1h/1d читает сотни-тысячи строк, а не сырые тики.
+    Тики старше текущего открытого интервала пары пропускаются.
+    """
+
+    OPEN_FILE = "open.json"
+
+    def __init__(
+        self,
+        directory: str,
+        history: Optional[SegmentedHistoryStore] = None,
+    ) -> None:
+        self.directory = directory
+        self.history = history
+
+        self._lock = threading.Lock()
+        self._open: Optional[Dict[str, Dict[str, Dict]]] = None
+        self._open_mtime: Optional[int] = None
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    @property
+    def open_path(self) -> str:
+        return os.path.join(self.directory, self.OPEN_FILE)
+
+    def _closed_path(self, interval: str, pair: str) -> str:
+        return os.path.join(self.directory, interval, f"{pair}.jsonl")
+
+    # ---------- Состояние ----------
+    def _save_open(self) -> None:
+        tmp_path = self.open_path + ".tmp"
+        text = json.dumps(self._open, ensure_ascii=False)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, self.open_path)
+        self._open_mtime = os.stat(self.open_path).st_mtime_ns
+
+    def _load_open(self) -> Dict[str, Dict[str, Dict]]:
+        """Открытые интервалы; перечитываются, если их обновил другой процесс"""
+        try:
+            mtime = os.stat(self.open_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+
+        if self._open is not None and mtime == self._open_mtime:
+            return self._open
+
+        if mtime is not None:
+            with open(self.open_path, "r", encoding="utf-8") as f:
+                self._open = json.load(f)
+            self._open_mtime = mtime
+            return self._open
+
+        # Первый запуск — строим агрегаты по уже накопленной истории
+        self._open = {interval: {} for interval in INTERVALS}
+        if self.history is not None:
+            closed = self._apply(self.history.iter_records())
+            self._write_closed(closed)
+            LOGGER.info("RollupStore: агрегаты построены по существующей истории")
+        self._save_open()
+        return self._open
+
+    # ---------- Обновление ----------
+    def _apply(self, records: Iterable[Dict]) -> Dict[Tuple[str, str], List[Dict]]:
+        """Накладывает тики на открытые интервалы, возвращает закрытые"""
+        closed: Dict[Tuple[str, str], List[Dict]] = defaultdict(list)
+
+        for r in records:
+            try:
+                pair = f"{r['from_currency']}_{r['to_currency']}"
+                ts = to_epoch(r["timestamp"])
+                rate = float(r["rate"])
+            except (KeyError, TypeError, ValueError):
+                continue
+
+            for interval, seconds in INTERVALS.items():
+                start = int(ts // seconds * seconds)
+                buckets = self._open[interval]
+                bucket = buckets.get(pair)
+
+                if bucket is None or start > bucket["start"]:
+                    if bucket is not None:
+                        closed[(interval, pair)].append(self._finalize(bucket))
+                    buckets[pair] = {
+                        "start": start,
+                        "open": rate,
+                        "high": rate,
+                        "low": rate,
+                        "close": rate,
+                        "count": 1,
+                        "open_ts": ts,
+                        "close_ts": ts,
+                    }
+                elif start == bucket["start"]:
+                    bucket["high"] = max(bucket["high"], rate)
+                    bucket["low"] = min(bucket["low"], rate)
+                    bucket["count"] += 1
+                    if ts >= bucket["close_ts"]:
+                        bucket["close"] = rate
+                        bucket["close_ts"] = ts
+                    if ts < bucket["open_ts"]:
+                        bucket["open"] = rate
+                        bucket["open_ts"] = ts
+
+        return closed
+
+    @staticmethod
+    def _finalize(bucket: Dict) -> Dict:
+        return {
+            k: bucket[k] for k in ("start", "open", "high", "low", "close", "count")
+        }
+
+    def _write_closed(self, closed: Dict[Tuple[str, str], List[Dict]]) -> None:
+        for (interval, pair), buckets in closed.items():
+            path = self._closed_path(interval, pair)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                for bucket in buckets:
+                    f.write(json.dumps(bucket) + "\n")
+
+    def load(self) -> None:
+        """
+        Загружает состояние (при первом запуске — строит по истории).
+        Вызывается до записи новых тиков в историю, чтобы они не
+        попали в агрегаты дважды.
+        """
+        with self._lock:
+            self._load_open()
+
+    def add(self, records: List[Dict]) -> None:
+        """Учитывает новые тики истории в агрегатах"""
+        if not records:
+            return
+        with self._lock:
+            self._load_open()
+            self._write_closed(self._apply(records))
+            self._save_open()
+
+    # ---------- Запросы ----------
+    def query(
+        self,
+        pair: str,
+        interval: str,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict]:
+        """Агрегаты пары по интервалу (последние limit штук, по времени)"""
+        if interval not in INTERVALS:
+            raise ValueError(
+                f"Неизвестный интервал '{interval}'. "
+                f"Доступны: {', '.join(INTERVALS)}"
+            )
+
+        with self._lock:
+            current = self._load_open()[interval].get(pair)
+
+        buckets: List[Dict] = []
+        try:
+            with open(self._closed_path(interval, pair), "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        break
+                    buckets.append(json.loads(line))
+        except FileNotFoundError:
+            pass
+
+        if current is not None:
+            buckets.append(self._finalize(current))
+
+        if since is not None:
+            buckets = [b for b in buckets if b["start"] >= since]
+        if until is not None:
+            buckets = [b for b in buckets if b["start"] <= until]
+        if limit is not None:
+            buckets = buckets[-limit:] if limit > 0 else []
+        return buckets
@@ -1,27 +1,306 @@
+from __future__ import annotations
+
+import calendar
+import random
 import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
 
 from .config import ParserConfig
 from .storage import RatesStorage
-from .api_clients import CoinGeckoClient, ExchangeRateApiClient
+from .api_clients import BaseApiClient, CoinGeckoClient, ExchangeRateApiClient
 from .updater import RatesUpdater
 from ..logging_config import LOGGER
 
 
-def run_scheduler(interval_seconds: int = 300):
+# ===== ЧАСЫ =====
+
+class SystemClock:
+    """Реальные часы: monotonic — для дедлайнов, time — для месячной квоты"""
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def time(self) -> float:
+        return time.time()
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+
+class FakeClock:
+    """Часы для офлайн-проверок: sleep мгновенно сдвигает время"""
+
+    def __init__(self, start: float = 0.0, wall: float = 1_767_225_600.0) -> None:
+        self._monotonic = start
+        self._offset = wall - start
+
+    def monotonic(self) -> float:
+        return self._monotonic
+
+    def time(self) -> float:
+        return self._monotonic + self._offset
+
+    def sleep(self, seconds: float) -> None:
+        self.advance(seconds)
+
+    def advance(self, seconds: float) -> None:
+        self._monotonic += max(seconds, 0.0)
+
+
+# ===== РАСПИСАНИЕ ИСТОЧНИКА =====
+
+def _month_key(wall: float) -> str:
+    return datetime.fromtimestamp(wall, timezone.utc).strftime("%Y-%m")
+
+
+def _seconds_to_month_end(wall: float) -> float:
+    now = datetime.fromtimestamp(wall, timezone.utc)
+    days = calendar.monthrange(now.year, now.month)[1]
+    end = datetime(now.year, now.month, days, tzinfo=timezone.utc).timestamp() + 86400
+    return max(end - wall, 0.0)
+
+
+@dataclass
+class SourceSchedule:
+    """
+    Расписание одного источника.
+    monthly_quota — лимит запросов в месяц (0 — без лимита).
+    """
+
+    client: BaseApiClient
+    interval: float
+    jitter: float = 0.1
+    backoff_base: float = 30.0
+    backoff_max: float = 1800.0
+    monthly_quota: int = 0
+
+    # срок без джиттера (от него считается следующий) и срок с джиттером
+    anchor: float = 0.0
+    next_due: float = 0.0
+    failures: int = 0
+    # опросы, пропущенные без запроса (нет ключа API, открыт breaker)
+    skipped: int = 0
+    quota_month: str = ""
+    quota_used: int = 0
+    last_error: Optional[str] = field(default=None, repr=False)
+
+    @property
+    def name(self) -> str:
+        return self.client.name
+
+    def budget_interval(self, wall: float) -> float:
+        """
+        Интервал, при котором остаток квоты равномерно делится
+        на остаток месяца (не меньше базового интервала).
+        """
+        if self.monthly_quota <= 0:
+            return self.interval
+        remaining = self.quota_remaining(wall)
+        if remaining <= 0:
+            # квота исчерпана — ждём начала следующего месяца
+            return max(self.interval, _seconds_to_month_end(wall))
+        return max(self.interval, _seconds_to_month_end(wall) / remaining)
+
+    def quota_remaining(self, wall: float) -> float:
+        if self.monthly_quota <= 0:
+            return float("inf")
+        self.roll_month(wall)
+        return self.monthly_quota - self.quota_used
+
+    def roll_month(self, wall: float) -> None:
+        month = _month_key(wall)
+        if month != self.quota_month:
+            self.quota_month = month
+            self.quota_used = 0
+
+
+# ===== ПЛАНИРОВЩИК =====
+
+class MultiSourceScheduler:
     """
-    Периодически запускает обновление курсов
+    Планировщик обновления курсов с отдельным расписанием на источник.
+
+    - Сроки считаются по monotonic-часам от предыдущего срока, а не от
+      момента окончания запроса, поэтому интервал не «уплывает».
+    - К каждому сроку добавляется джиттер ±jitter·интервал.
+    - После ошибки — экспоненциальный backoff до backoff_max.
+    - При месячной квоте интервал растягивается так, чтобы остаток
+      запросов хватил до конца месяца; расход хранится в sources.json.
+    """
+
+    def __init__(
+        self,
+        config: ParserConfig,
+        storage: RatesStorage,
+        schedules: List[SourceSchedule],
+        clock=None,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        self.config = config
+        self.storage = storage
+        self.schedules = schedules
+        self.clock = clock or SystemClock()
+        self.rng = rng or random.Random()
+
+        self._load_quota()
+        now = self.clock.monotonic()
+        for schedule in self.schedules:
+            schedule.anchor = schedule.next_due = now
+
+    # ---------- Квота ----------
+    def _load_quota(self) -> None:
+        state = self.storage.load_sources_state()
+        for schedule in self.schedules:
+            quota = state.get(schedule.name, {}).get("quota", {})
+            schedule.quota_month = quota.get("month", "")
+            schedule.quota_used = int(quota.get("used", 0))
+
+    def _save_quota(self, schedules: List[SourceSchedule]) -> None:
+        state = self.storage.load_sources_state()
+        for schedule in schedules:
+            entry = state.setdefault(schedule.name, {})
+            entry["quota"] = {
+                "month": schedule.quota_month,
+                "used": schedule.quota_used,
+            }
+        self.storage.save_sources_state(state)
+
+    # ---------- Сроки ----------
+    def _reschedule(self, schedule: SourceSchedule, now: float, wall: float) -> None:
+        if schedule.failures:
+            delay = min(
+                schedule.backoff_max,
+                schedule.backoff_base * 2 ** (schedule.failures - 1),
+            )
+            # после backoff расписание начинается заново от момента повтора
+            schedule.anchor = now + delay
+        else:
+            interval = schedule.budget_interval(wall)
+            schedule.anchor += interval
+            if schedule.anchor <= now:
+                # пропущенные сроки не навёрстываем пачкой
+                schedule.anchor = now + interval
+            delay = interval
+
+        spread = delay * schedule.jitter
+        schedule.next_due = schedule.anchor + self.rng.uniform(-spread, spread)
+
+    def due(self) -> List[SourceSchedule]:
+        now = self.clock.monotonic()
+        return [s for s in self.schedules if s.next_due <= now]
+
+    def seconds_until_next(self) -> float:
+        if not self.schedules:
+            return float("inf")
+        earliest = min(s.next_due for s in self.schedules)
+        return max(earliest - self.clock.monotonic(), 0.0)
+
+    # ---------- Запуск ----------
+    def run_once(
+        self, schedules: Optional[List[SourceSchedule]] = None
+    ) -> Optional[Dict]:
+        """
+        Опрашивает источники, срок которых наступил (или schedules —
+        внеочередной опрос); None — опрашивать нечего.
+        """
+        due = self.due() if schedules is None else schedules
+        if not due:
+            return None
+
+        wall = self.clock.time()
+        now = self.clock.monotonic()
+        exhausted = [s for s in due if s.quota_remaining(wall) <= 0]
+        for schedule in exhausted:
+            LOGGER.warning(f"Scheduler: {schedule.name}: месячная квота исчерпана")
+            self._reschedule(schedule, now, wall)
+
+        due = [s for s in due if s not in exhausted]
+        if not due:
+            return None
+
+        sent = {s.name: s.client.requests_sent for s in due}
+        updater = RatesUpdater(self.config, self.storage, [s.client for s in due])
+        result = updater.run_update()
+        failed = {name: msg for name, msg in result["errors"]}
+        skipped = set(result.get("skipped_sources", ()))
+
+        now = self.clock.monotonic()
+        for schedule in due:
+            # квота расходуется фактически отправленными запросами
+            # (с повторами и пакетами CoinGecko)
+            schedule.quota_used += schedule.client.requests_sent - sent[schedule.name]
+            if schedule.name in skipped:
+                # запрос не отправлялся — это не сбой источника, без backoff
+                schedule.skipped += 1
+                schedule.last_error = failed.get(schedule.name)
+            elif schedule.name in failed:
+                schedule.failures += 1
+                schedule.last_error = failed[schedule.name]
+            else:
+                schedule.failures = 0
+                schedule.last_error = None
+            self._reschedule(schedule, now, wall)
+
+        limited = [s for s in due if s.monthly_quota]
+        if limited:
+            self._save_quota(limited)
+        return result
+
+    def run(self, iterations: Optional[int] = None) -> None:
+        """Основной цикл; iterations ограничивает число опросов (для проверок)"""
+        done = 0
+        while iterations is None or done < iterations:
+            self.clock.sleep(self.seconds_until_next())
+            try:
+                if self.run_once() is not None:
+                    done += 1
+            except Exception as e:
+                LOGGER.error(f"Scheduler: update failed: {e}")
+                # не крутимся в цикле без паузы при постоянной ошибке
+                for schedule in self.due():
+                    schedule.failures += 1
+                    self._reschedule(
+                        schedule, self.clock.monotonic(), self.clock.time()
+                    )
+
+
+def default_schedules(
+    config: ParserConfig,
+    interval_seconds: Optional[float] = None,
+) -> List[SourceSchedule]:
+    """Криптовалюты — часто, фиат — редко и в пределах месячной квоты"""
+    common = {
+        "jitter": config.SCHEDULE_JITTER,
+        "backoff_base": config.SCHEDULE_BACKOFF_BASE_SECONDS,
+        "backoff_max": config.SCHEDULE_BACKOFF_MAX_SECONDS,
+    }
+    return [
+        SourceSchedule(
+            CoinGeckoClient(config),
+            interval=interval_seconds or config.SCHEDULE_CRYPTO_INTERVAL_SECONDS,
+            monthly_quota=config.COINGECKO_MONTHLY_QUOTA,
+            **common,
+        ),
+        SourceSchedule(
+            ExchangeRateApiClient(config),
+            interval=interval_seconds or config.SCHEDULE_FIAT_INTERVAL_SECONDS,
+            monthly_quota=config.EXCHANGERATE_MONTHLY_QUOTA,
+            **common,
+        ),
+    ]
+
+
+def run_scheduler(interval_seconds: Optional[int] = None):
+    """
+    Периодически запускает обновление курсов.
+    interval_seconds задаёт общий интервал; по умолчанию — свои
+    интервалы для крипто- и фиат-источников из ParserConfig.
     """
     config = ParserConfig()
     storage = RatesStorage(config)
-    clients = [
-        CoinGeckoClient(config),
-        ExchangeRateApiClient(config),
-    ]
-    updater = RatesUpdater(config, storage, clients)
-
-    while True:
-        try:
-            updater.run_update()
-        except Exception as e:
-            LOGGER.error(f"Scheduler: update failed: {e}")
-        time.sleep(interval_seconds)
+    scheduler = MultiSourceScheduler(
+        config, storage, default_schedules(config, interval_seconds)
+    )
+    scheduler.run()
@@ -2,9 +2,15 @@ from __future__ import annotations
 
 import json
 import os
-from typing import List, Dict, Any
+import re
+from typing import List, Dict, Any, Optional
 
 from .config import ParserConfig
+from .history_store import SegmentedHistoryStore
+from .rollups import RollupStore
+
+# "PAIR": {... "updated_at": "..."} в rates.json
+_UPDATED_AT_RE = re.compile(rb'"([^"]+)": \{[^{}]*?"updated_at": "([^"]*)"')
 
 
 class RatesStorage:
@@ -12,17 +18,36 @@ class RatesStorage:
     Отвечает за чтение/запись
     """
 
+    # Кэш курсов больше этого размера пишется без отступов
+    PRETTY_MAX_PAIRS = 200
+
     def __init__(self, config: ParserConfig):
         self.config = config
         os.makedirs(os.path.dirname(self.config.RATES_FILE_PATH), exist_ok=True)
         os.makedirs(os.path.dirname(self.config.HISTORY_FILE_PATH), exist_ok=True)
 
+        self.history = SegmentedHistoryStore(
+            self.config.HISTORY_DIR_PATH,
+            segment_max_bytes=self.config.HISTORY_SEGMENT_MAX_BYTES,
+            segment_max_seconds=self.config.HISTORY_SEGMENT_MAX_SECONDS,
+            legacy_file=self.config.HISTORY_FILE_PATH,
+            retention_days=self.config.HISTORY_RAW_RETENTION_DAYS,
+            compress_cold=self.config.HISTORY_COMPRESS_COLD,
+        )
+        self.rollups = RollupStore(
+            os.path.join(self.config.HISTORY_DIR_PATH, "rollups"),
+            history=self.history,
+        )
+
     # ---------- Вспомогательные методы ----------
     @staticmethod
-    def _atomic_write(path: str, data: Any) -> None:
+    def _atomic_write(path: str, data: Any, indent: Optional[int] = 4) -> None:
         tmp_path = path + ".tmp"
+        # dumps + одна запись: потоковый json.dump (как и indent) идёт
+        # через медленный Python-кодировщик, заметный на тысячах пар
+        text = json.dumps(data, ensure_ascii=False, indent=indent)
         with open(tmp_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+            f.write(text)
         os.replace(tmp_path, path)
 
     @staticmethod
@@ -41,28 +66,103 @@ class RatesStorage:
         data = self._load_json(self.config.RATES_FILE_PATH, default={})
         return data
 
+    def _cache_version(self) -> int:
+        """version из хвоста rates.json (ключ пишется последним), без разбора файла"""
+        try:
+            with open(self.config.RATES_FILE_PATH, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(f.tell() - 64, 0))
+                tail = f.read()
+        except FileNotFoundError:
+            return 0
+
+        match = re.search(rb'"version": (\d+)\s*\}\s*$', tail)
+        if match is not None:
+            return int(match.group(1))
+        previous = self.load_cache()
+        return previous.get("version", 0) if isinstance(previous, dict) else 0
+
     def save_cache(self, pairs: Dict[str, Dict], last_refresh: str) -> None:
+        # version растёт при каждой записи — по нему читатели
+        # понимают, что снимок курсов устарел
         data = {
             "pairs": pairs,
             "last_refresh": last_refresh,
+            "version": self._cache_version() + 1,
         }
-        self._atomic_write(self.config.RATES_FILE_PATH, data)
+        indent = 4 if len(pairs) <= self.PRETTY_MAX_PAIRS else None
+        self._atomic_write(self.config.RATES_FILE_PATH, data, indent=indent)
+
+    def touch_cache(self, pair_keys, updated_at: str) -> bool:
+        """
+        Продлевает свежесть курсов без перезаписи rates.json: новые
+        updated_at и last_refresh записываются на место старых.
+        Возможно, только если длина меток совпадает (RatesUpdater пишет
+        их фиксированной ширины); иначе возвращает False.
+        """
+        path = self.config.RATES_FILE_PATH
+        try:
+            with open(path, "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return False
+
+        value = updated_at.encode("utf-8")
+        match = re.search(rb'"last_refresh": "([^"]*)"', raw)
+        if match is None or len(match.group(1)) != len(value):
+            return False
+        offsets = [match.start(1)]
+
+        # один проход по файлу вместо поиска каждой пары
+        wanted = {key.encode("utf-8") for key in pair_keys}
+        found = 0
+        for match in _UPDATED_AT_RE.finditer(raw):
+            if match.group(1) not in wanted:
+                continue
+            if len(match.group(2)) != len(value):
+                return False
+            offsets.append(match.start(2))
+            found += 1
+        if found != len(wanted):
+            return False
+
+        with open(path, "r+b") as f:
+            for offset in offsets:
+                f.seek(offset)
+                f.write(value)
+        return True
+
+    # ---------- Состояние источников ----------
+    def load_sources_state(self) -> Dict[str, Dict]:
+        """
+        Читаем data/sources.json: {имя источника: {"validators": {...}, ...}}
+        """
+        data = self._load_json(self.config.SOURCES_STATE_FILE_PATH, default={})
+        return data if isinstance(data, dict) else {}
+
+    def save_sources_state(self, state: Dict[str, Dict]) -> None:
+        self._atomic_write(self.config.SOURCES_STATE_FILE_PATH, state)
+
+    # ---------- Набор валют ----------
+    def load_universe(self) -> Dict:
+        """
+        Читаем data/universe.json (режим UNIVERSE_MODE=full):
+        {"updated_at", "fiat": {...}, "crypto": {...}}
+        """
+        data = self._load_json(self.config.UNIVERSE_FILE_PATH, default={})
+        return data if isinstance(data, dict) else {}
+
+    def save_universe(self, universe: Dict) -> None:
+        self._atomic_write(self.config.UNIVERSE_FILE_PATH, universe)
 
     # ---------- История измерений ----------
     def load_history(self) -> List[Dict]:
-        data = self._load_json(self.config.HISTORY_FILE_PATH, default=[])
-        if isinstance(data, list):
-            return data
-        return []
+        return list(self.history.iter_records())
 
     def append_history(self, records: List[Dict]) -> None:
         """
         Добавляет записи истории курсов
         """
-        history = self.load_history()
-
-        existing_ids = {r.get("id") for r in history if "id" in r}
-        new_records = [r for r in records if r.get("id") not in existing_ids]
-
-        history.extend(new_records)
-        self._atomic_write(self.config.HISTORY_FILE_PATH, history)
+        self.rollups.load()
+        added = self.history.append(records)
+        self.rollups.add(added)
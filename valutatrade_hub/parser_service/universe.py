@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import re
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from ..core.exceptions import ApiRequestError
+from ..logging_config import LOGGER
+from .api_clients import CoinGeckoClient, ExchangeRateApiClient
+from .config import ParserConfig
+from .history_store import to_epoch
+from .storage import RatesStorage
+
+# Коды, допустимые в core.currencies и в ключах пар FROM_TO
+_CODE_RE = re.compile(r"^[A-Z0-9]{2,5}$")
+
+
+def discover_universe(config: ParserConfig, previous: Optional[Dict] = None) -> Dict:
+    """
+    Запрашивает у источников полный набор валют:
+    {"updated_at", "fiat": {код: название}, "crypto": {код: {id, name, market_cap}}}.
+    Если источник недоступен, его часть берётся из previous
+    (или из статических списков ParserConfig).
+    """
+    previous = previous or {}
+    base = config.BASE_CURRENCY
+
+    try:
+        fiat = {
+            code: name
+            for code, name in ExchangeRateApiClient(config).discover().items()
+            if _CODE_RE.match(code)
+        }
+    except ApiRequestError as e:
+        LOGGER.warning(f"Universe: фиатные валюты не обновлены: {e}")
+        fiat = previous.get("fiat") or {code: code for code in config.FIAT_CURRENCIES}
+
+    try:
+        crypto: Dict[str, Dict] = {}
+        for coin in CoinGeckoClient(config).discover(config.CRYPTO_TOP_N):
+            code = str(coin.get("symbol", "")).upper()
+            # одинаковые тикеры у разных монет: остаётся более крупная
+            if not _CODE_RE.match(code) or code in crypto or code in fiat:
+                continue
+            crypto[code] = {
+                "id": coin["id"],
+                "name": coin.get("name") or code,
+                "market_cap": float(coin.get("market_cap") or 0),
+            }
+    except ApiRequestError as e:
+        LOGGER.warning(f"Universe: криптовалюты не обновлены: {e}")
+        crypto = previous.get("crypto") or {
+            code: {"id": config.CRYPTO_ID_MAP[code], "name": code, "market_cap": 0.0}
+            for code in config.CRYPTO_CURRENCIES
+        }
+
+    fiat.pop(base, None)
+    crypto.pop(base, None)
+    LOGGER.info(f"Universe: {len(fiat)} фиатных валют, {len(crypto)} криптовалют")
+    return {
+        "updated_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "fiat": fiat,
+        "crypto": crypto,
+    }
+
+
+def apply_universe(config: ParserConfig, universe: Dict) -> None:
+    """Подставляет набор валют в списки ParserConfig"""
+    config.FIAT_CURRENCIES = tuple(universe.get("fiat", {}))
+    config.CRYPTO_ID_MAP = {
+        code: coin["id"] for code, coin in universe.get("crypto", {}).items()
+    }
+    config.CRYPTO_CURRENCIES = tuple(config.CRYPTO_ID_MAP)
+
+
+def ensure_universe(config: ParserConfig, storage: RatesStorage) -> Optional[Dict]:
+    """
+    В режиме UNIVERSE_MODE=full загружает набор валют (обновляя его
+    у источников раз в UNIVERSE_REFRESH_SECONDS) и применяет к config.
+    В режиме static ничего не делает и возвращает None.
+    """
+    if config.UNIVERSE_MODE != "full":
+        return None
+
+    universe = storage.load_universe()
+    try:
+        age = time.time() - to_epoch(universe["updated_at"])
+    except (KeyError, TypeError, ValueError):
+        age = float("inf")
+
+    if age >= config.UNIVERSE_REFRESH_SECONDS:
+        universe = discover_universe(config, universe)
+        storage.save_universe(universe)
+
+    apply_universe(config, universe)
+    return universe
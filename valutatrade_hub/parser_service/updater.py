@@ -1,10 +1,15 @@
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
-from typing import List, Dict, Tuple
+from time import monotonic, perf_counter, time
+from typing import List, Dict, Optional, Tuple
 
 from .config import ParserConfig
+from .health import SourceHealth
+from .history_store import to_epoch
 from .storage import RatesStorage
+from .universe import ensure_universe
 from .api_clients import BaseApiClient
 from ..logging_config import LOGGER
 from ..core.exceptions import ApiRequestError
@@ -13,9 +18,10 @@ from ..core.exceptions import ApiRequestError
 class RatesUpdater:
     """
     Оркестратор процесса обновления курсов:
-    - опрашивает всех клиентов
-    - объединяет результаты
-    - пишет историю и кэш
+    - опрашивает всех клиентов параллельно, с общим дедлайном
+    - объединяет результаты успешных источников
+    - пишет историю и кэш; курсы, изменившиеся меньше порога (и курсы
+      источника, ответившего 304), только продлевают свежесть в кэше
     """
 
     def __init__(self, config: ParserConfig, storage: RatesStorage, clients: List[BaseApiClient]):
@@ -23,23 +29,169 @@ class RatesUpdater:
         self.storage = storage
         self.clients = clients
 
+    def _fetch_all(
+        self,
+        errors: List[Tuple[str, str]],
+        health: Dict[str, SourceHealth],
+        skipped: List[str],
+    ) -> List[Tuple[BaseApiClient, Optional[Dict]]]:
+        """
+        Опрашивает клиентов в пуле потоков. Каждая попытка запроса
+        ограничена REQUEST_TIMEOUT, весь опрос вместе с повторами —
+        UPDATE_DEADLINE_SECONDS (дедлайн передаётся клиентам).
+        Источник с открытым circuit breaker не опрашивается вовсе;
+        ненастроенный (нет ключа API) — тоже, но это не сбой источника
+        и breaker его не учитывает.
+        Возвращает результаты успешных клиентов в порядке self.clients
+        (None — данные не изменились); ошибки, не уложившиеся в дедлайн
+        и пропущенные источники пишет в errors, имена пропущенных
+        (запрос не отправлялся) — ещё и в skipped.
+        """
+        now = time()
+        active = []
+        for client in self.clients:
+            if client.configuration_error:
+                error = client.configuration_error
+                LOGGER.warning(f"RatesUpdater: {client.name} SKIPPED: {error}")
+                errors.append((client.name, error))
+                skipped.append(client.name)
+                continue
+
+            source = health[client.name]
+            if source.allow(now):
+                active.append(client)
+                continue
+            error = (
+                f"circuit breaker открыт после {source.failures} ошибок подряд, "
+                f"пробный запрос через {source.retry_in(now):.0f} с"
+            )
+            LOGGER.warning(f"RatesUpdater: {client.name} SKIPPED: {error}")
+            errors.append((client.name, error))
+            skipped.append(client.name)
+
+        if not active:
+            return []
+
+        finished: Dict[str, float] = {}
+        started = perf_counter()
+        deadline = monotonic() + self.config.UPDATE_DEADLINE_SECONDS
+        pool = ThreadPoolExecutor(
+            max_workers=len(active), thread_name_prefix="rates-fetch"
+        )
+        try:
+            futures = []
+            for client in active:
+                LOGGER.info(f"RatesUpdater: fetching from {client.name}...")
+                client.deadline = deadline
+                future = pool.submit(client.fetch_rates)
+                future.add_done_callback(
+                    lambda _, name=client.name: finished.setdefault(
+                        name, perf_counter()
+                    )
+                )
+                futures.append(future)
+            wait(futures, timeout=max(deadline - monotonic(), 0))
+        finally:
+            # не ждём зависшие запросы: их результат уже не нужен
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        now = time()
+        timed_out_at = perf_counter()
+        results = []
+        for client, future in zip(active, futures):
+            request_ms = (finished.get(client.name, timed_out_at) - started) * 1000
+            error: Optional[str] = None
+            if not future.done():
+                error = (
+                    f"превышен общий таймаут обновления "
+                    f"({self.config.UPDATE_DEADLINE_SECONDS} с)"
+                )
+            else:
+                try:
+                    rates = future.result()
+                except ApiRequestError as e:
+                    error = str(e)
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+
+            if error is not None:
+                error = client.redact(error)
+                LOGGER.error(f"RatesUpdater: {client.name} FAILED: {error}")
+                errors.append((client.name, error))
+                health[client.name].record_failure(now, request_ms, error)
+                continue
+
+            health[client.name].record_success(request_ms)
+            if rates is None:
+                LOGGER.info(f"RatesUpdater: {client.name} not modified")
+            else:
+                LOGGER.info(f"RatesUpdater: {client.name} OK ({len(rates)} rates)")
+            results.append((client, rates))
+        return results
+
+    def _is_changed(self, old_rate: float, new_rate: float) -> bool:
+        """Изменение курса выше и абсолютного, и относительного порога"""
+        delta = abs(new_rate - old_rate)
+        if delta <= self.config.RATE_CHANGE_ABS_THRESHOLD:
+            return False
+        if old_rate == 0:
+            return True
+        return delta / abs(old_rate) > self.config.RATE_CHANGE_REL_THRESHOLD
+
     def run_update(self) -> Dict:
         LOGGER.info("RatesUpdater: starting rates update...")
+        # режим UNIVERSE_MODE=full: списки валют берутся из universe.json
+        try:
+            ensure_universe(self.config, self.storage)
+        except Exception as e:
+            LOGGER.error(f"RatesUpdater: набор валют не обновлён: {e}")
+
         all_pairs: Dict[str, Dict] = {}
         history_records: List[Dict] = []
         errors: List[Tuple[str, str]] = []
+        unchanged: List[str] = []
+        # пары, курс которых не изменился выше порога
+        steady: List[str] = []
+
+        # фиксированная ширина (всегда с микросекундами) — см. touch_cache
+        timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        now = to_epoch(timestamp)
 
-        timestamp = datetime.utcnow().isoformat() + "Z"
+        previous = self.storage.load_cache()
+        pairs = dict(previous.get("pairs", {})) if isinstance(previous, dict) else {}
+        last_recorded = self.storage.history.last_timestamps()
 
+        sources_state = self.storage.load_sources_state()
+        health: Dict[str, SourceHealth] = {}
         for client in self.clients:
-            LOGGER.info(f"RatesUpdater: fetching from {client.name}...")
-            try:
-                rates = client.fetch_rates()
-                LOGGER.info(f"RatesUpdater: {client.name} OK ({len(rates)} rates)")
-            except ApiRequestError as e:
-                LOGGER.error(f"RatesUpdater: {client.name} FAILED: {e}")
-                errors.append((client.name, str(e)))
-                raise
+            entry = sources_state.get(client.name, {})
+            validators = entry.get("validators", {})
+            # старый формат хранил полный URL (с ключом API) — отбрасываем
+            client.validators = dict(validators) if "key" in validators else {}
+            health[client.name] = SourceHealth(
+                failure_threshold=self.config.BREAKER_FAILURE_THRESHOLD,
+                reset_seconds=self.config.BREAKER_RESET_SECONDS,
+                window=self.config.HEALTH_WINDOW,
+                data=entry.get("health"),
+            )
+            # ошибки, сохранённые до маскировки ключа API
+            last_error = health[client.name].last_error
+            if last_error:
+                health[client.name].last_error = client.redact(last_error)
+
+        skipped: List[str] = []
+        results = self._fetch_all(errors, health, skipped)
+
+        for client in self.clients:
+            entry = sources_state.setdefault(client.name, {})
+            entry["validators"] = client.validators
+            entry["health"] = health[client.name].to_dict()
+        self.storage.save_sources_state(sources_state)
+
+        for client, rates in results:
+            if rates is None:
+                unchanged.append(client.name)
+                continue
 
             # rates: pair_key -> {rate, source, meta}
             for pair_key, payload in rates.items():
@@ -49,6 +201,22 @@ class RatesUpdater:
 
                 from_code, to_code = pair_key.split("_", 1)
 
+                # Курс почти не изменился и heartbeat не наступил —
+                # только продлеваем свежесть, без строки в истории
+                cached = pairs.get(pair_key)
+                heartbeat_due = (
+                    now - last_recorded.get(pair_key, float("-inf"))
+                    >= self.config.RATE_HEARTBEAT_SECONDS
+                )
+                if (
+                    cached is not None
+                    and "rate" in cached
+                    and not heartbeat_due
+                    and not self._is_changed(float(cached["rate"]), rate)
+                ):
+                    steady.append(pair_key)
+                    continue
+
                 # Обновляем all_pairs (в кэше хранится только последний курс)
                 all_pairs[pair_key] = {
                     "rate": rate,
@@ -74,17 +242,43 @@ class RatesUpdater:
         if history_records:
             self.storage.append_history(history_records)
 
+        # Свежесть продлевается курсам без изменений и курсам источников,
+        # ответивших 304 (курсы не пришли — они те же)
+        bump = set(steady)
+        bump.update(
+            key for key, payload in pairs.items()
+            if key not in all_pairs and payload.get("source") in unchanged
+        )
+
         if all_pairs:
-            self.storage.save_cache(all_pairs, last_refresh=timestamp)
+            # курсы источников, не ответивших в этот раз, остаются в кэше
+            pairs.update(all_pairs)
+            for pair_key in bump:
+                pairs[pair_key] = dict(pairs[pair_key], updated_at=timestamp)
+            self.storage.save_cache(pairs, last_refresh=timestamp)
+            LOGGER.info(
+                f"RatesUpdater: wrote {len(all_pairs)} rates to cache, "
+                f"refreshed {len(bump)} unchanged, last_refresh={timestamp}"
+            )
+        elif bump:
+            # ничего не изменилось: правим только время, без перезаписи файла
+            if not self.storage.touch_cache(bump, timestamp):
+                for pair_key in bump:
+                    pairs[pair_key] = dict(pairs[pair_key], updated_at=timestamp)
+                self.storage.save_cache(pairs, last_refresh=timestamp)
             LOGGER.info(
-                f"RatesUpdater: wrote {len(all_pairs)} rates to cache, last_refresh={timestamp}"
+                f"RatesUpdater: no changes, refreshed {len(bump)} rates, "
+                f"last_refresh={timestamp}"
             )
         else:
             LOGGER.warning("RatesUpdater: no rates were fetched; cache not updated")
 
         result = {
             "total_rates": len(all_pairs),
-            "last_refresh": timestamp if all_pairs else None,
+            "unchanged_rates": len(bump),
+            "unchanged_sources": unchanged,
+            "last_refresh": timestamp if all_pairs or bump else None,
             "errors": errors,
+            "skipped_sources": skipped,
         }
         return result